@@ -3,7 +3,10 @@ import os
 import sys
 
 if __name__ == "__main__":
-    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "moocng.settings")
+    if sys.argv[1:2] == ["test"]:
+        os.environ.setdefault("DJANGO_SETTINGS_MODULE", "moocng.settings.test")
+    else:
+        os.environ.setdefault("DJANGO_SETTINGS_MODULE", "moocng.settings")
 
     from django.core.management import execute_from_command_line
 
@@ -13,12 +13,13 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from django.contrib.auth.models import User
+
 from tastypie.authentication import Authentication
 from tastypie.http import HttpUnauthorized
 
-from moocng.api.models import UserApi
-from moocng.courses.models import Course
-from moocng.courses.utils import is_teacher
+from moocng.api.cache import get_api_key_user_id
+from moocng.courses.cache import get_teacher_course_ids
 
 
 class DjangoAuthentication(Authentication):
@@ -33,7 +34,7 @@ class DjangoAuthentication(Authentication):
 class TeacherAuthentication(Authentication):
 
     def is_authenticated(self, request, **kwargs):
-        return (is_teacher(request.user, Course.objects.all()) or request.user.is_staff)
+        return bool(request.user.is_staff or get_teacher_course_ids(request.user))
 
     def get_identifier(self, request):
         return request.user.username
@@ -41,22 +42,30 @@ class TeacherAuthentication(Authentication):
 
 class ApiKeyAuthentication(Authentication):
 
+    def get_user(self, request):
+        # The user is looked up once per request, get_identifier needs it too
+        if not hasattr(request, '_api_key_user'):
+            request._api_key_user = None
+            key = request.GET.get('key', None)
+            user_id = key and get_api_key_user_id(key)
+            if user_id:
+                try:
+                    request._api_key_user = User.objects.get(pk=user_id)
+                except User.DoesNotExist:
+                    pass
+        return request._api_key_user
+
     def is_authenticated(self, request, **kwargs):
-        key = request.GET.get('key', None)
-        if key:
-            userapi = UserApi.objects.filter(key=key)
-            if userapi:
-                request.user = userapi[0].user
-                return True
+        user = self.get_user(request)
+        if user is not None:
+            request.user = user
+            return True
         return False
 
     def get_identifier(self, request):
-
-        key = request.GET.get('key', None)
-        if key:
-            userapi = UserApi.objects.filter(key=key)
-            if userapi:
-                return userapi[0].user
+        user = self.get_user(request)
+        if user is not None:
+            return user
         return 'nouser'
 
 
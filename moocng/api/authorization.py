@@ -17,13 +17,13 @@ from django.core.urlresolvers import resolve
 
 from tastypie.authorization import Authorization
 
-from moocng.courses.models import Course
-from moocng.courses.utils import is_teacher
+from moocng.courses.cache import get_teacher_course_ids
 
 
 PERMISSIONS = {
     'get_courses_as_student': 'courses.can_list_allcourses',
-    'get_passed_courses_as_student': 'courses.can_list_passedcourses'
+    'get_passed_courses_as_student': 'courses.can_list_passedcourses',
+    'get_bulk_passed_courses': 'courses.can_list_passedcourses',
 }
 
 
@@ -34,7 +34,7 @@ class PublicReadTeachersModifyAuthorization(Authorization):
             return request.user.is_authenticated()
         else:
             return (request.user.is_authenticated() and
-                    (is_teacher(request.user, Course.objects.all()) or
+                    (bool(get_teacher_course_ids(request.user)) or
                      request.user.is_staff))
 
 
@@ -42,7 +42,7 @@ class TeacherAuthorization(Authorization):
 
     def is_authorized(self, request, object=None):
         return (request.user.is_authenticated() and
-                (is_teacher(request.user, Course.objects.all()) or
+                (bool(get_teacher_course_ids(request.user)) or
                  request.user.is_staff))
 
 
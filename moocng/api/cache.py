@@ -0,0 +1,74 @@
+# Copyright 2013 UNED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.hashcompat import md5_constructor
+
+USER_PROGRESS_VERSION_TIMEOUT = 3600 * 24
+
+API_KEY_TIMEOUT = getattr(settings, 'API_KEY_CACHE_TIMEOUT', 300)
+
+
+def get_user_progress_version_key(course_id, user_id):
+    return 'course_%s_user_%s_progress_version' % (course_id, user_id)
+
+
+def get_user_progress_version(course_id, user_id):
+    """
+    Version of the activity, answers and peer review data of a user in a
+    course, for the ETags of the resources that depend on them. It is None
+    if the cache can't keep the versions.
+    """
+    key = get_user_progress_version_key(course_id, user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, USER_PROGRESS_VERSION_TIMEOUT)
+        version = cache.get(key)
+    return version
+
+
+def invalidate_user_progress(course_id, user_id):
+    if course_id is None or user_id is None:
+        return
+    cache.set(get_user_progress_version_key(course_id, user_id),
+              uuid.uuid4().hex, USER_PROGRESS_VERSION_TIMEOUT)
+
+
+def get_api_key_user_key(key):
+    # The keys come from the query string, they can't be used as is in a
+    # memcached key
+    return 'api_key_%s_user' % md5_constructor(key.encode('utf-8')).hexdigest()
+
+
+def get_api_key_user_id(key):
+    """
+    Return the id of the user of an API key, or None if the key doesn't
+    exist. Unknown keys are cached too.
+    """
+    from moocng.api.models import UserApi
+    cache_key = get_api_key_user_key(key)
+    user_id = cache.get(cache_key)
+    if user_id is None:
+        user_ids = UserApi.objects.filter(key=key).values_list('user_id', flat=True)
+        user_id = user_ids and user_ids[0] or 0
+        cache.set(cache_key, user_id, API_KEY_TIMEOUT)
+    return user_id or None
+
+
+def invalidate_api_key(key):
+    if key:
+        cache.delete(get_api_key_user_key(key))
@@ -17,12 +17,14 @@ import uuid
 
 from django.contrib.auth.models import User
 from django.db import models
-from django.db.models.signals import pre_save
+from django.db.models.signals import pre_save, post_save, post_delete
 from django.utils.translation import ugettext_lazy as _
 from django.utils.translation import ugettext
 
 from adminsortable.models import Sortable
 
+from moocng.api.cache import invalidate_api_key
+
 
 class UserApi(Sortable):
 
@@ -45,5 +47,16 @@ def pre_save_userapi(sender, **kwargs):
     userapi = kwargs['instance']
     if not userapi.key:
         userapi.key = unicode(uuid.uuid4())
+    if userapi.pk:
+        # The old key must not keep authenticating from the cache
+        old_keys = UserApi.objects.filter(pk=userapi.pk).values_list('key', flat=True)
+        if old_keys and old_keys[0] != userapi.key:
+            invalidate_api_key(old_keys[0])
+
+
+def userapi_invalidate_cache(sender, instance, **kwargs):
+    invalidate_api_key(instance.key)
 
 pre_save.connect(pre_save_userapi, sender=UserApi)
+post_save.connect(userapi_invalidate_cache, sender=UserApi)
+post_delete.connect(userapi_invalidate_cache, sender=UserApi)
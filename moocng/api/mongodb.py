@@ -13,12 +13,20 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from urllib import urlencode
+
 from bson import ObjectId
+from bson.errors import InvalidId
+
+from pymongo import ASCENDING
+from pymongo.errors import DuplicateKeyError
 
 from tastypie.bundle import Bundle
 from tastypie.exceptions import NotFound, BadRequest
+from tastypie.paginator import Paginator
 from tastypie.resources import Resource
 
+from django.conf import settings
 from django.dispatch import Signal
 
 from moocng.mongodb import get_db
@@ -28,6 +36,14 @@ mongo_object_created = Signal(providing_args=["user_id", "mongo_object"])
 mongo_object_updated = Signal(providing_args=["user_id", "mongo_object"])
 
 
+def async_writes_enabled():
+    """
+    With the API_ASYNC_WRITES setting the counts of the activity are
+    calculated by the celery tasks instead of in the requests.
+    """
+    return getattr(settings, 'API_ASYNC_WRITES', False)
+
+
 def validate_dict_schema(obj, schema):
     for (key, value) in obj.items():
         if key not in schema:
@@ -41,30 +57,174 @@ def validate_dict_schema(obj, schema):
 
 
 class MongoObj(object):
-    """This class is required for Tastypie"""
+    """
+    This class is required for Tastypie. fields is the list of fields of
+    the document that were read from the database, None if all of them were.
+    """
 
-    def __init__(self, initial=None):
-        self.__dict__['_data'] = {}
+    __slots__ = ('_data', '_fields')
 
-        if hasattr(initial, 'items'):
-            self.__dict__['_data'] = initial
+    def __init__(self, initial=None, fields=None):
+        if not hasattr(initial, 'items'):
+            initial = {}
+        object.__setattr__(self, '_data', initial)
+        object.__setattr__(self, '_fields', fields)
 
     def __getattr__(self, name):
+        # Only called for the names that are not set slots
+        if name.startswith('__') or name in MongoObj.__slots__:
+            raise AttributeError(name)
         return self._data.get(name, None)
 
     def __setattr__(self, name, value):
-        self.__dict__['_data'][name] = value
+        self._data[name] = value
+
+    def __getstate__(self):
+        return (self._data, self._fields)
+
+    def __setstate__(self, state):
+        object.__setattr__(self, '_data', state[0])
+        object.__setattr__(self, '_fields', state[1])
+
+    def get_fields(self):
+        return self._fields
 
     def to_dict(self):
         return self._data
 
 
+def get_projection_query(fields):
+    # The _id is always needed for the uuid
+    if fields is None:
+        return None
+    projection = dict([(field, True) for field in fields])
+    projection['_id'] = True
+    return projection
+
+
+class MongoObjSet(object):
+    """
+    The MongoObj of the documents that match a query, sorted by _id. The
+    documents are only read when the set is iterated or sliced, and the
+    slices are read with skip and limit, so a page doesn't load the rest of
+    the documents.
+
+    .. versionadded:: 0.1
+    """
+
+    def __init__(self, collection, query, fields=None, uuid=str):
+        self.collection = collection
+        self.query = query
+        self.fields = fields
+        self.uuid = uuid
+
+    def get_cursor(self):
+        return self.collection.find(
+            self.query, fields=get_projection_query(self.fields)
+        ).sort('_id', ASCENDING)
+
+    def wrap(self, document):
+        obj = MongoObj(initial=document, fields=self.fields)
+        obj.uuid = self.uuid(document['_id'])
+        return obj
+
+    def after(self, _id):
+        """
+        Return the documents with an _id greater than the given one
+        """
+        query = dict(self.query)
+        query['_id'] = {'$gt': ObjectId(_id)}
+        return MongoObjSet(self.collection, query, self.fields, self.uuid)
+
+    def count(self):
+        return self.collection.find(self.query).count()
+
+    def __len__(self):
+        return self.count()
+
+    def __iter__(self):
+        for document in self.get_cursor():
+            yield self.wrap(document)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start = index.start or 0
+            cursor = self.get_cursor().skip(start)
+            if index.stop is not None:
+                if index.stop <= start:
+                    return []
+                # limit(0) means no limit
+                cursor = cursor.limit(index.stop - start)
+            return [self.wrap(document) for document in cursor]
+        documents = list(self.get_cursor().skip(index).limit(1))
+        if not documents:
+            raise IndexError(index)
+        return self.wrap(documents[0])
+
+
+class MongoCursorPaginator(Paginator):
+    """
+    Paginator of the MongoObjSet. Besides limit and offset, a page can be
+    requested with the after parameter, the _id of the last document of the
+    previous page. The next URI of the pages use it, so the following pages
+    are read with an _id range instead of skipping the previous documents.
+    """
+
+    def get_after(self):
+        after = self.request_data.get('after', None)
+        if after is not None:
+            try:
+                ObjectId(after)
+            except (InvalidId, TypeError):
+                raise BadRequest("Invalid after parameter provided")
+        return after
+
+    def _generate_after_uri(self, limit, after):
+        if self.resource_uri is None:
+            return None
+        request_params = dict([(key, value.encode('utf-8'))
+                               for key, value in self.request_data.items()
+                               if key != 'offset'])
+        request_params.update({'limit': limit, 'after': after})
+        return '%s?%s' % (self.resource_uri, urlencode(request_params))
+
+    def page(self):
+        after = self.get_after()
+        if not isinstance(self.objects, MongoObjSet):
+            return super(MongoCursorPaginator, self).page()
+        if after is None:
+            output = super(MongoCursorPaginator, self).page()
+        else:
+            limit = self.get_limit()
+            objects = self.objects.after(after)
+            # One more document to know if there is a next page
+            output = {
+                'objects': objects[:limit and limit + 1 or None],
+                'meta': {
+                    'limit': limit,
+                    'after': after,
+                    'next': None,
+                    'previous': None,
+                    'total_count': self.get_count(),
+                },
+            }
+            if limit and len(output['objects']) > limit:
+                output['objects'] = output['objects'][:limit]
+                output['meta']['next'] = True
+        if output['meta'].get('next', None) and output['objects']:
+            last_id = output['objects'][-1].to_dict()['_id']
+            output['meta']['next'] = self._generate_after_uri(
+                output['meta']['limit'], str(last_id))
+        return output
+
+
 class MongoResource(Resource):
 
     collection = None  # subclasses should implement this
 
     class Meta:
         input_schema = {}
+        paginator_class = MongoCursorPaginator
 
     def __init__(self, *args, **kwargs):
         super(MongoResource, self).__init__(*args, **kwargs)
@@ -83,8 +243,25 @@ class MongoResource(Resource):
 
         return self._build_reverse_url('api_dispatch_detail', kwargs=kwargs)
 
+    def get_projection(self, request, endpoint):
+        """
+        Return the fields of the documents that are read for the endpoint
+        ('list' or 'detail'), None for the whole documents. The resources
+        declare them in the projections dict of their Meta and the clients
+        can ask for less with the fields parameter (fields=kq_id,date).
+        """
+        fields = getattr(self._meta, 'projections', {}).get(endpoint, None)
+        requested = request is not None and request.GET.get('fields', None)
+        if requested:
+            requested = [field.strip() for field in requested.split(',')
+                         if field.strip() and not field.strip().startswith('$')]
+            if fields is None:
+                fields = requested
+            else:
+                fields = [field for field in fields if field in requested]
+        return fields
+
     def get_object_list(self, request, **kwargs):
-        results = []
         filters = kwargs.get("filters", {})
         if self._meta.filtering:
             for filter in self._meta.filtering.keys():
@@ -95,12 +272,8 @@ class MongoResource(Resource):
                     except ValueError:
                         filters[filter] = filter_value
 
-        for result in self._collection.find(filters):
-            obj = MongoObj(initial=result)
-            obj.uuid = str(result['_id'])
-            results.append(obj)
-
-        return results
+        return MongoObjSet(self._collection, filters,
+                           fields=self.get_projection(request, 'list'))
 
     def obj_get_list(self, request=None, **kwargs):
         return self.get_object_list(request, **kwargs)
@@ -117,13 +290,15 @@ class MongoResource(Resource):
                     filter[self._meta.datakey] = kwargs["pk"]
             filter.pop("pk")
 
-        result = self._collection.find(filter)
-        if result.count() == 0:
+        fields = self.get_projection(request, 'detail')
+        result = list(self._collection.find(
+            filter, fields=get_projection_query(fields)).limit(2))
+        if len(result) == 0:
             raise NotFound('Invalid resource lookup data provided')
-        elif result.count() > 1:
-            raise NotFound('Dulicate resource')
+        elif len(result) > 1:
+            raise NotFound('Duplicate resource')
 
-        obj = MongoObj(initial=result[0])
+        obj = MongoObj(initial=result[0], fields=fields)
         obj.uuid = str(result[0]['_id'])
         return obj
 
@@ -132,15 +307,13 @@ class MongoResource(Resource):
         self.validate_schema(bundle)
         bundle.obj = MongoObj(bundle.data)
 
-        query_discover = kwargs.get("query_discover", {})
-        query_discover[self._meta.datakey] = getattr(bundle.obj,
-                                                     self._meta.datakey)
-
-        if self._collection.find_one(query_discover):
+        # The unique index of the collection rejects the duplicates, see
+        # moocng.mongodb.MONGODB_INDEXES
+        try:
+            _id = self._collection.insert(bundle.obj.to_dict(), safe=True)
+        except DuplicateKeyError:
             raise BadRequest("This object already exists")
 
-        _id = self._collection.insert(bundle.obj.to_dict(), safe=True)
-
         self.send_created_signal(request.user.id, bundle.obj)
         bundle.obj.uuid = str(_id)
         return bundle
@@ -154,6 +327,14 @@ class MongoResource(Resource):
                                   mongo_object=obj)
 
     def dehydrate(self, bundle):
+        fields = bundle.obj.get_fields()
+        if fields is not None:
+            # The declared fields that were not read would be sent empty or
+            # with their default value
+            for field_name in self.fields.keys():
+                if (field_name not in fields and field_name != 'resource_uri' and
+                        not hasattr(self, 'dehydrate_%s' % field_name)):
+                    bundle.data.pop(field_name, None)
         bundle.data.update(bundle.obj.to_dict())
         return bundle
 
@@ -187,10 +368,6 @@ class MongoUserResource(MongoResource):
     def obj_create(self, bundle, request=None, **kwargs):
         bundle.data[self.user_id_field] = request.user.id
 
-        query_discover = kwargs.get("query_discover", {})
-        query_discover[self.user_id_field] = request.user.id
-        query_discover[self._meta.datakey] = bundle.data.get(self._meta.datakey)
-
         return super(MongoUserResource, self).obj_create(
-            bundle, request, query_discover=query_discover, **kwargs
+            bundle, request, **kwargs
         )
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+# Copyright 2013 UNED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from moocng.mongodb import get_db
+
+
+class UserMongoPrefetch(object):
+    """
+    Activity, answers and peer review submissions of a user in a set of
+    nuggets, loaded with one query per collection so the progress of every
+    nugget can be calculated from memory. The reviews of the user
+    submissions are loaded, with one more query, only if they are needed.
+
+    .. versionadded:: 0.1
+    """
+
+    def __init__(self, user, kq_ids, db=None):
+        db = db or get_db()
+        self.user = user
+        self.kq_ids = list(kq_ids)
+        self._reviews_collection = db.get_collection('peer_review_reviews')
+        self._reviews = None
+
+        query = {'user_id': user.id, 'kq_id': {'$in': self.kq_ids}}
+        self.visited = set([activity['kq_id'] for activity in
+                            db.get_collection('activity').find(
+                                query, fields={'kq_id': True, '_id': False})])
+        self.answers = dict([(answer['question_id'], answer) for answer in
+                             db.get_collection('answers').find(query)])
+        self.submissions = dict([(submission['kq'], submission) for submission in
+                                 db.get_collection('peer_review_submissions').find({
+                                     'author': user.id,
+                                     'kq': {'$in': self.kq_ids},
+                                 })])
+
+    def kq_visited(self, kq_id):
+        return kq_id in self.visited
+
+    def get_answer(self, question_id):
+        return self.answers.get(question_id, None)
+
+    def get_submission(self, kq_id):
+        return self.submissions.get(kq_id, None)
+
+    def get_reviews(self, kq_id):
+        if self._reviews is None:
+            self._reviews = {}
+            reviewed = [kq for kq, submission in self.submissions.items()
+                        if submission.get('reviews', 0) > 0]
+            if reviewed:
+                for review in self._reviews_collection.find({
+                        'author': self.user.id,
+                        'kq': {'$in': reviewed}}):
+                    self._reviews.setdefault(review['kq'], []).append(review)
+        return self._reviews.get(kq_id, [])
@@ -35,9 +35,11 @@ from django.contrib.auth.models import User
 from django.core.exceptions import ObjectDoesNotExist, ValidationError
 from django.db.models import Q, Count
 from django.db.models.fields.files import ImageFieldFile
-from django.http import HttpResponse, HttpResponseNotFound
+from django.http import (HttpResponse, HttpResponseNotFound,
+                         HttpResponseNotModified)
 from django.utils import timezone
 from django.utils.cache import patch_cache_control
+from django.utils.hashcompat import md5_constructor
 from django.utils.translation import ugettext as _
 from django.views.decorators.csrf import csrf_exempt
 
@@ -48,8 +50,13 @@ from moocng.api.authentication import (DjangoAuthentication,
 from moocng.api.authorization import (PublicReadTeachersModifyAuthorization,
                                       TeacherAuthorization,
                                       UserResourceAuthorization)
-from moocng.api.mongodb import (MongoObj, MongoResource, MongoUserResource,
+from moocng.api.cache import get_user_progress_version, invalidate_user_progress
+from moocng.api.mongodb import (MongoCursorPaginator, MongoObj, MongoObjSet,
+                                MongoResource, MongoUserResource,
+                                async_writes_enabled, get_projection_query,
                                 mongo_object_updated, mongo_object_created)
+from moocng.api.prefetch import UserMongoPrefetch
+from moocng.api.serializers import FastSerializer
 from moocng.api.tasks import (on_activity_created_task, on_answer_created_task,
                               on_answer_updated_task,
                               on_peerreviewsubmission_created_task)
@@ -58,11 +65,13 @@ from moocng.api.validation import (AnswerValidation, answer_validate_date,
 from moocng.assets.models import Asset, Reservation, AssetAvailability
 from moocng.assets.utils import get_occupation_for_month
 from moocng.courses.models import (Unit, KnowledgeQuantum, Question, Option,
-                                   Attachment, Course)
-from moocng.courses.marks import normalize_kq_weight, calculate_course_mark
+                                   Attachment, Course, CourseStudent)
+from moocng.courses.marks import normalize_kq_weight, get_passed_courses
+from moocng.courses.structure import (get_course_content_version,
+                                     get_course_structure)
 from moocng.media_contents import (media_content_get_iframe_template,
                                    media_content_get_thumbnail_url)
-from moocng.mongodb import get_db
+from moocng.mongodb import count_upto, get_db
 from moocng.peerreview.models import PeerReviewAssignment, EvaluationCriterion
 from moocng.peerreview.utils import (kq_get_peer_review_score,
                                      get_peer_review_review_score)
@@ -70,6 +79,9 @@ from moocng.peerreview.utils import (kq_get_peer_review_score,
 
 STATS_QUEUE = 'stats'
 
+UNIT_BUNDLE_SUBMISSION_EXCLUDE = ('_id', 'reviewers', 'assigned_to',
+                                  'assigned_when')
+
 
 class HandleErrorProvider(object):
 
@@ -126,6 +138,101 @@ class HandleErrorProvider(object):
         return wrapper
 
 
+class ConditionalGetProvider(object):
+    """
+    Add an ETag, built from the content version of the course, to the GET
+    responses and answer with a 304, without serializing anything, when the
+    client already has it. Only the requests of a known course (detail or
+    filtered by course_list_filter) get an ETag.
+
+    course_path is the lookup from the objects of the resource to their
+    course. If user_dependent is True the ETag includes the version of the
+    progress of the user too.
+    """
+
+    course_path = None
+    course_list_filter = None
+    user_dependent = False
+
+    def get_course_id(self, request, **kwargs):
+        if 'pk' in kwargs:
+            lookup = {'pk': kwargs['pk']}
+        elif self.course_list_filter in request.GET:
+            lookup = {self.course_list_filter: request.GET[self.course_list_filter]}
+        else:
+            return None
+        try:
+            course_ids = self._meta.object_class.objects.filter(
+                **lookup).values_list(self.course_path, flat=True)[:1]
+            return course_ids[0] if course_ids else None
+        except ValueError:
+            return None
+
+    def get_etag(self, request, **kwargs):
+        course_id = self.get_course_id(request, **kwargs)
+        if course_id is None:
+            return None
+        return self.build_etag(request, course_id, self.user_dependent)
+
+    def build_etag(self, request, course_id, user_dependent):
+        versions = [get_course_content_version(course_id)]
+        if user_dependent:
+            if not request.user.is_authenticated():
+                return None
+            versions.append(get_user_progress_version(course_id,
+                                                      request.user.id))
+        if None in versions:
+            return None
+        key = u':'.join([request.get_full_path(), unicode(request.user.id)] +
+                        versions)
+        return '"%s"' % md5_constructor(key.encode('utf-8')).hexdigest()
+
+    def dispatch(self, request_type, request, **kwargs):
+        etag = None
+        if request.method == 'GET':
+            etag = self.get_etag(request, **kwargs)
+            if etag is not None and 'HTTP_IF_NONE_MATCH' in request.META:
+                # The same checks of Resource.dispatch, before telling the
+                # client that what it has is still valid
+                allowed_methods = getattr(self._meta, '%s_allowed_methods' % request_type, None)
+                self.method_check(request, allowed=allowed_methods)
+                self.is_authenticated(request)
+                self.is_authorized(request)
+            if etag is not None and etag == request.META.get('HTTP_IF_NONE_MATCH', None):
+                response = HttpResponseNotModified()
+                response['ETag'] = etag
+                return response
+
+        response = super(ConditionalGetProvider, self).dispatch(
+            request_type, request, **kwargs)
+        if etag is not None and response.status_code == 200:
+            response['ETag'] = etag
+        return response
+
+
+class FastSerializerProvider(object):
+    """
+    Stream the JSON list responses of the resources that use FastSerializer.
+    They aren't streamed with USE_ETAGS because CommonMiddleware reads the
+    whole content to build the ETag.
+    """
+
+    def create_response(self, request, data, response_class=HttpResponse,
+                        **response_kwargs):
+        desired_format = self.determine_format(request)
+        serializer = self._meta.serializer
+        if (desired_format == 'application/json' and
+                hasattr(serializer, 'iter_json') and
+                isinstance(data, dict) and 'objects' in data and
+                getattr(settings, 'API_STREAM_RESPONSES', True) and
+                not getattr(settings, 'USE_ETAGS', False)):
+            return response_class(content=serializer.iter_json(data),
+                                  content_type=build_content_type(desired_format),
+                                  **response_kwargs)
+        return super(FastSerializerProvider, self).create_response(
+            request, data, response_class=response_class, **response_kwargs)
+
+
 class BaseResource(Resource, HandleErrorProvider):
 
     def wrap_view(self, view):
@@ -150,10 +257,14 @@ class BaseMongoUserResource(MongoUserResource, HandleErrorProvider):
         return HandleErrorProvider.wrap_view(self, view)
 
 
-class CourseResource(BaseModelResource):
+class CourseResource(ConditionalGetProvider, FastSerializerProvider,
+                     BaseModelResource):
+
+    course_path = 'id'
 
     class Meta:
         queryset = Course.objects.all()
+        serializer = FastSerializer()
         resource_name = 'course'
         allowed_methods = ['get']
         excludes = ['certification_banner']
@@ -162,9 +273,12 @@ class CourseResource(BaseModelResource):
         authorization = DjangoAuthorization()
 
 
-class UnitResource(BaseModelResource):
+class UnitResource(ConditionalGetProvider, BaseModelResource):
     course = fields.ToOneField(CourseResource, 'course')
 
+    course_path = 'course'
+    course_list_filter = 'course'
+
     class Meta:
         queryset = Unit.objects.all()
         resource_name = 'unit'
@@ -180,8 +294,101 @@ class UnitResource(BaseModelResource):
             data[u'title'] = data[u'title'].strip()
         return data
 
+    def override_urls(self):
+        return [
+            url(r"^(?P<resource_name>%s)/(?P<pk>\d+)/bundle/$" % self._meta.resource_name,
+                self.wrap_view('get_unit_bundle'), name="get_unit_bundle"),
+        ]
 
-class KnowledgeQuantumResource(BaseModelResource):
+    def get_unit_bundle(self, request, **kwargs):
+        """
+        Return in one response the unit, its nuggets with their questions and
+        options, and the activity, answers and peer review submissions of the
+        user in the unit, so the classroom doesn't need a request per nugget.
+        The response has an ETag to revalidate it.
+        """
+        # In tastypie, the override_urls don't call
+        # Authentication/Authorization
+        self.method_check(request, allowed=['get'])
+        self.is_authenticated(request)
+        self.is_authorized(request)
+        unit = self.cached_obj_get(request=request,
+                                   **self.remove_api_resource_names(kwargs))
+
+        # The bundle includes the progress of the user, check the ETag before
+        # building it
+        etag = self.build_etag(request, unit.course_id, True)
+        if etag is not None and etag == request.META.get('HTTP_IF_NONE_MATCH', None):
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            return response
+
+        # Local instances, OptionResource keeps the answer of the question
+        kq_resource = KnowledgeQuantumResource()
+        question_resource = QuestionResource()
+        option_resource = OptionResource()
+
+        prefetch = None
+        kqs = []
+        for kq in kq_resource.get_object_list(request).filter(unit__id=unit.id):
+            kq_bundle = kq_resource.full_dehydrate(
+                kq_resource.build_bundle(obj=kq, request=request))
+            prefetch = kq_resource.get_prefetch(kq_bundle)
+
+            questions = []
+            for question in kq.question_set.all():
+                # Avoid a query per object for the parents we already have
+                question.kq = kq
+                question_bundle = question_resource.full_dehydrate(
+                    question_resource.build_bundle(obj=question,
+                                                   request=request))
+                option_resource.answer = prefetch.get_answer(question.id)
+                options = []
+                for option in question.option_set.all():
+                    option.question = question
+                    options.append(option_resource.full_dehydrate(
+                        option_resource.build_bundle(obj=option,
+                                                     request=request)))
+                question_bundle.data['options'] = options
+                questions.append(question_bundle)
+
+            kq_bundle.data['questions'] = questions
+            kqs.append(kq_bundle)
+
+        data = {
+            'unit': self.full_dehydrate(self.build_bundle(obj=unit,
+                                                          request=request)),
+            'kqs': kqs,
+            'activity': [],
+            'answers': [],
+            'peer_review_submissions': [],
+        }
+        if prefetch is not None:
+            data['activity'] = sorted(prefetch.visited)
+            for answer in prefetch.answers.values():
+                answer = dict(answer)
+                del answer['_id']
+                data['answers'].append(answer)
+            for submission in prefetch.submissions.values():
+                # Don't send who is reviewing or has reviewed the submission
+                submission = dict([(key, value)
+                                   for key, value in submission.items()
+                                   if key not in UNIT_BUNDLE_SUBMISSION_EXCLUDE])
+                data['peer_review_submissions'].append(submission)
+
+        response = self.create_response(request, data)
+        if etag is None:
+            # Without versions (e.g. no shared cache) the ETag only saves the
+            # transfer of the bundle
+            etag = '"%s"' % md5_constructor(response.content).hexdigest()
+            if etag == request.META.get('HTTP_IF_NONE_MATCH', None):
+                response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+
+
+class KnowledgeQuantumResource(ConditionalGetProvider, FastSerializerProvider,
+                               BaseModelResource):
     unit = fields.ToOneField(UnitResource, 'unit')
     question = fields.ToManyField('moocng.api.resources.QuestionResource',
                                   'question_set', related_name='kq',
@@ -203,8 +410,16 @@ class KnowledgeQuantumResource(BaseModelResource):
     completed = fields.BooleanField(readonly=True)
     normalized_weight = fields.IntegerField(readonly=True)
 
+    course_path = 'unit__course'
+    course_list_filter = 'unit'
+    user_dependent = True
+
     class Meta:
-        queryset = KnowledgeQuantum.objects.all()
+        # The related objects used by the fields and the dehydrate methods
+        queryset = KnowledgeQuantum.objects.select_related(
+            'unit', 'peerreviewassignment', 'asset_availability'
+        ).prefetch_related('question_set__option_set')
+        serializer = FastSerializer()
         resource_name = 'kq'
         allowed_methods = ['get']
         authentication = DjangoAuthentication()
@@ -221,13 +436,22 @@ class KnowledgeQuantumResource(BaseModelResource):
             Q(unit__start__isnull=False, unit__start__lte=datetime.now)
         )
 
-    def dispatch(self, request_type, request, **kwargs):
-        db = get_db()
-        self.answers = db.get_collection('answers')
-        self.activity = db.get_collection('activity')
-        return super(KnowledgeQuantumResource, self).dispatch(request_type,
-                                                              request,
-                                                              **kwargs)
+    def get_prefetch(self, bundle):
+        """
+        Return the UserMongoPrefetch of the unit of the nugget. It is loaded
+        once per unit and request, so the progress fields of every nugget of
+        the unit are dehydrated without more queries to mongo.
+        """
+        request = bundle.request
+        if not hasattr(request, '_kq_prefetch'):
+            request._kq_prefetch = {}
+        unit_id = bundle.obj.unit_id
+        if unit_id not in request._kq_prefetch:
+            kq_ids = KnowledgeQuantum.objects.filter(
+                unit__id=unit_id).values_list('id', flat=True)
+            request._kq_prefetch[unit_id] = UserMongoPrefetch(request.user,
+                                                              kq_ids)
+        return request._kq_prefetch[unit_id]
 
     def dehydrate_normalized_weight(self, bundle):
         return normalize_kq_weight(bundle.obj)
@@ -248,30 +472,30 @@ class KnowledgeQuantumResource(BaseModelResource):
                                                bundle.obj.media_content_id)
 
     def dehydrate_peer_review_score(self, bundle):
-        return kq_get_peer_review_score(bundle.obj, bundle.request.user)
+        return kq_get_peer_review_score(bundle.obj, bundle.request.user,
+                                        prefetch=self.get_prefetch(bundle))
 
     def dehydrate_correct(self, bundle):
         questions = bundle.obj.question_set.all()
         if questions.count() == 0:
             # no question: a kq is correct if it is completed
             try:
-                return bundle.obj.is_completed(bundle.request.user)
+                return bundle.obj.is_completed(bundle.request.user,
+                                               self.get_prefetch(bundle))
             except AttributeError:
                 return False
         else:
             question = questions[0]  # there should be only one question
 
-            answer = self.answers.find_one({
-                "user_id": bundle.request.user.id,
-                "question_id": question.id
-            })
+            answer = self.get_prefetch(bundle).get_answer(question.id)
             if not answer:
                 return False
 
             return question.is_correct(answer)
 
     def dehydrate_completed(self, bundle):
-        return bundle.obj.is_completed(bundle.request.user)
+        return bundle.obj.is_completed(bundle.request.user,
+                                       self.get_prefetch(bundle))
 
 
 class PrivateKnowledgeQuantumResource(BaseModelResource):
@@ -453,6 +677,7 @@ class PeerReviewSubmissionsResource(BaseMongoResource):
     class Meta:
         resource_name = 'peer_review_submissions'
         collection = 'peer_review_submissions'
+        paginator_class = MongoCursorPaginator
         datakey = 'peer_review_submissions'
         object_class = MongoObj
         authentication = DjangoAuthentication()
@@ -464,6 +689,13 @@ class PeerReviewSubmissionsResource(BaseMongoResource):
             "unit": ('exact'),
             "course": ('exact'),
         }
+        # The assignment data of the reviews is not sent
+        projections = {
+            'list': ['author', 'author_reviews', 'created', 'kq', 'unit',
+                     'course', 'reviews', 'text', 'file'],
+            'detail': ['author', 'author_reviews', 'created', 'kq', 'unit',
+                       'course', 'reviews', 'text', 'file'],
+        }
 
     def obj_get_list(self, request=None, **kwargs):
 
@@ -478,16 +710,9 @@ class PeerReviewSubmissionsResource(BaseMongoResource):
                 except ValueError:
                     mongo_query[key] = request.GET.get(key)
 
-        query_results = self._collection.find(mongo_query)
-
-        results = []
-
-        for query_item in query_results:
-            obj = MongoObj(initial=query_item)
-            obj.uuid = query_item["_id"]
-            results.append(obj)
-
-        return results
+        return MongoObjSet(self._collection, mongo_query,
+                           fields=self.get_projection(request, 'list'),
+                           uuid=lambda _id: _id)
 
     def obj_get(self, request=None, **kwargs):
 
@@ -496,12 +721,14 @@ class PeerReviewSubmissionsResource(BaseMongoResource):
         except InvalidId:
             raise BadRequest('Invalid ObjectId provided')
 
-        mongo_item = self._collection.find_one(query)
+        fields = self.get_projection(request, 'detail')
+        mongo_item = self._collection.find_one(
+            query, fields=get_projection_query(fields))
 
         if mongo_item is None:
             raise NotFound('Invalid resource lookup data provided')
 
-        obj = MongoObj(initial=mongo_item)
+        obj = MongoObj(initial=mongo_item, fields=fields)
         obj.uuid = kwargs['pk']
         return obj
 
@@ -542,6 +769,7 @@ class PeerReviewReviewsResource(BaseMongoResource):
     class Meta:
         resource_name = 'peer_review_reviews'
         collection = 'peer_review_reviews'
+        paginator_class = MongoCursorPaginator
         datakey = 'peer_review_reviews'
         object_class = MongoObj
         authentication = DjangoAuthentication()
@@ -567,16 +795,9 @@ class PeerReviewReviewsResource(BaseMongoResource):
                 except ValueError:
                     mongo_query[key] = request.GET.get(key)
 
-        query_results = self._collection.find(mongo_query)
-
-        results = []
-
-        for query_item in query_results:
-            obj = MongoObj(initial=query_item)
-            obj.uuid = query_item["_id"]
-            results.append(obj)
-
-        return results
+        return MongoObjSet(self._collection, mongo_query,
+                           fields=self.get_projection(request, 'list'),
+                           uuid=lambda _id: _id)
 
     def obj_get(self, request=None, **kwargs):
 
@@ -585,26 +806,36 @@ class PeerReviewReviewsResource(BaseMongoResource):
         except InvalidId:
             raise BadRequest('Invalid ObjectId provided')
 
-        mongo_item = self._collection.find_one(query)
+        fields = self.get_projection(request, 'detail')
+        mongo_item = self._collection.find_one(
+            query, fields=get_projection_query(fields))
 
         if mongo_item is None:
             raise NotFound('Invalid resource lookup data provided')
 
-        obj = MongoObj(initial=mongo_item)
+        obj = MongoObj(initial=mongo_item, fields=fields)
         obj.uuid = kwargs['pk']
         return obj
 
     def dehydrate_score(self, bundle):
+        if bundle.obj.criteria is None:
+            # Not read, see the fields parameter
+            return None
         return get_peer_review_review_score(bundle.obj.to_dict())
 
 
-class QuestionResource(BaseModelResource):
+class QuestionResource(ConditionalGetProvider, FastSerializerProvider,
+                       BaseModelResource):
     kq = fields.ToOneField(KnowledgeQuantumResource, 'kq')
     iframe_code = fields.CharField(readonly=True)
     thumbnail_url = fields.CharField(readonly=True)
 
+    course_path = 'kq__unit__course'
+    course_list_filter = 'kq'
+
     class Meta:
-        queryset = Question.objects.all()
+        queryset = Question.objects.select_related('kq__unit')
+        serializer = FastSerializer()
         resource_name = 'question'
         allowed_methods = ['get']
         authentication = DjangoAuthentication()
@@ -696,11 +927,17 @@ class PrivateQuestionResource(BaseModelResource):
         return bundle
 
 
-class OptionResource(BaseModelResource):
+class OptionResource(ConditionalGetProvider, FastSerializerProvider,
+                     BaseModelResource):
     question = fields.ToOneField(QuestionResource, 'question')
 
+    course_path = 'question__kq__unit__course'
+    course_list_filter = 'question'
+    user_dependent = True
+
     class Meta:
-        queryset = Option.objects.all()
+        queryset = Option.objects.select_related('question__kq__unit')
+        serializer = FastSerializer()
         resource_name = 'option'
         allowed_methods = ['get']
         authentication = DjangoAuthentication()
@@ -761,6 +998,7 @@ class AnswerResource(BaseMongoUserResource):
     class Meta:
         resource_name = 'answer'
         collection = 'answers'
+        paginator_class = MongoCursorPaginator
         datakey = 'question_id'
         object_class = MongoObj
         authentication = DjangoAuthentication()
@@ -818,6 +1056,7 @@ class ActivityResource(BaseMongoUserResource):
     class Meta:
         resource_name = 'activity'
         collection = 'activity'
+        paginator_class = MongoCursorPaginator
         datakey = 'kq_id'
         object_class = MongoObj
         authentication = DjangoAuthentication()
@@ -873,6 +1112,9 @@ class UserResource(BaseModelResource):
 
     def override_urls(self):
         return [
+            url(r"^(?P<resource_name>%s)/passedcourses/$" % self._meta.resource_name,
+                self.wrap_view('get_bulk_passed_courses'),
+                name="get_bulk_passed_courses"),
             url(r"^(?P<resource_name>%s)/(?P<pk>[^/]+)/allcourses/$" % self._meta.resource_name,
                 self.wrap_view('get_courses'), name="get_courses_as_student"),
             url(r"^(?P<resource_name>%s)/(?P<pk>[^/]+)/passedcourses/$" % self._meta.resource_name,
@@ -927,19 +1169,61 @@ class UserResource(BaseModelResource):
         obj = self.get_object(request, kwargs)
         if isinstance(obj, HttpResponse):
             return obj
-        passed_courses = []
+        courses = obj.courses_as_student.filter(threshold__isnull=False)
         if 'courseid' in request.GET:
             courseid = int(request.GET.get('courseid'))
-            courses = obj.courses_as_student.filter(id=courseid)
-        else:
-            courses = obj.courses_as_student.all()
-        for course in courses:
-            if course.threshold is not None:
-                total_mark, units_info = calculate_course_mark(course, obj)
-                if float(course.threshold) <= total_mark:
-                    passed_courses.append(course)
+            courses = courses.filter(id=courseid)
+        enrollments = [(obj.pk, course) for course in courses]
+        passed_courses = get_passed_courses(enrollments).get(obj.pk, [])
         return self.alt_get_list(request, passed_courses)
 
+    def get_bulk_passed_courses(self, request, **kwargs):
+        """
+        Passed courses of many users in one request, the users are given by
+        id (users=1,2,3) and/or by email (emails=a@example.com,b@example.com)
+        """
+        self.is_authenticated(request)
+        self.is_authorized(request)
+        user_ids = [user_id for user_id in request.GET.get('users', '').split(',')
+                    if user_id]
+        emails = [email for email in request.GET.get('emails', '').split(',')
+                  if email]
+        if not (user_ids or emails):
+            raise BadRequest('The users or emails parameter is required')
+        max_users = getattr(settings, 'API_BULK_PASSED_COURSES_MAX_USERS', 1000)
+        if len(user_ids) + len(emails) > max_users:
+            raise BadRequest('At most %d users can be requested at once' % max_users)
+        try:
+            user_ids = [int(user_id) for user_id in user_ids]
+        except ValueError:
+            raise BadRequest('The users parameter must be a list of ids')
+
+        users = User.objects.filter(Q(id__in=user_ids) |
+                                    Q(email__in=emails)).only('id', 'email')
+        users = dict([(user.pk, user) for user in users])
+        enrollments = CourseStudent.objects.filter(
+            student__in=users.keys(),
+            course__threshold__isnull=False).select_related('course')
+        if 'courseid' in request.GET:
+            enrollments = enrollments.filter(course__id=int(request.GET.get('courseid')))
+        passed_courses = get_passed_courses([(enrollment.student_id, enrollment.course)
+                                             for enrollment in enrollments])
+
+        course_resource = CourseResource()
+        objects = []
+        for user_id, user in sorted(users.items()):
+            objects.append({
+                'id': user_id,
+                'email': user.email,
+                'resource_uri': self.get_resource_uri(user),
+                'passed_courses': [course_resource.get_resource_uri(course)
+                                   for course in passed_courses.get(user_id, [])],
+            })
+        return self.create_response(request, {
+            'meta': {'total_count': len(objects)},
+            'objects': objects,
+        })
+
 
 class AssetResource(BaseModelResource):
     available_in = fields.ToManyField('moocng.api.resources.AssetAvailabilityResource', 'available_in')
@@ -1229,15 +1513,22 @@ def on_activity_created(sender, user_id, mongo_object, **kwargs):
     api_task_logger.debug("activity created")
 
     data = mongo_object.to_dict()
-    activity = get_db().get_collection('activity')
-    unit_activity = activity.find({
-        'user_id': data['user_id'],
-        'unit_id': data['unit_id'],
-    }).count()
-    course_activity = activity.find({
-        'user_id': data['user_id'],
-        'course_id': data['course_id']
-    }).count()
+    invalidate_user_progress(data['course_id'], data['user_id'])
+    if async_writes_enabled():
+        # The task counts the activity, the request only does the insert
+        unit_activity = course_activity = None
+    else:
+        activity = get_db().get_collection('activity')
+        # The task only compares them with 1 and with the number of nuggets
+        limit = get_course_structure(data['course_id']).kq_count + 1
+        unit_activity = count_upto(activity, {
+            'user_id': data['user_id'],
+            'unit_id': data['unit_id'],
+        }, limit)
+        course_activity = count_upto(activity, {
+            'user_id': data['user_id'],
+            'course_id': data['course_id']
+        }, limit)
 
     on_activity_created_task.apply_async(
         args=[data, unit_activity, course_activity],
@@ -1248,6 +1539,8 @@ def on_activity_created(sender, user_id, mongo_object, **kwargs):
 def on_answer_created(sender, user_id, mongo_object, **kwargs):
     api_task_logger.debug("answer created")
 
+    data = mongo_object.to_dict()
+    invalidate_user_progress(data['course_id'], data['user_id'])
     on_answer_created_task.apply_async(
         args=[mongo_object.to_dict()],
         queue=STATS_QUEUE,
@@ -1257,6 +1550,8 @@ def on_answer_created(sender, user_id, mongo_object, **kwargs):
 def on_answer_updated(sender, user_id, mongo_object, **kwargs):
     api_task_logger.debug("answer updated")
 
+    invalidate_user_progress(mongo_object.get('course_id', None),
+                             mongo_object.get('user_id', None))
     on_answer_updated_task.apply_async(
         args=[mongo_object],  # it is already a dict
         queue=STATS_QUEUE,
@@ -1266,6 +1561,8 @@ def on_answer_updated(sender, user_id, mongo_object, **kwargs):
 def on_peerreviewsubmission_created(sender, user_id, mongo_object, **kwargs):
     api_task_logger.debug("peer review submission created")
 
+    data = mongo_object.to_dict()
+    invalidate_user_progress(data.get('course', None), data.get('author', None))
     on_peerreviewsubmission_created_task.apply_async(
         args=[mongo_object.to_dict()],
         queue=STATS_QUEUE,
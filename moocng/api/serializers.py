@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+# Copyright 2013 UNED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+from json.encoder import encode_basestring_ascii
+
+try:
+    from json.encoder import c_make_encoder
+except ImportError:
+    c_make_encoder = None
+
+from tastypie.bundle import Bundle
+from tastypie.serializers import Serializer
+
+
+class FastSerializer(Serializer):
+    """
+    Serializer for the read-only resources. The output is the same as the
+    one of tastypie's Serializer (sorted keys, ASCII), but the data is
+    encoded in one pass: the containers are written here in key order and
+    the rest of the values by the C encoder of json, converting the values
+    that aren't JSON types (dates, decimals, lazy strings...) with to_simple
+    only when they are found.
+
+    iter_json encodes the list responses object by object, to stream them.
+
+    .. versionadded:: 0.1
+    """
+
+    def get_value_encoder(self, options=None):
+        options = options or {}
+
+        def default(o):
+            return self.to_simple(o, options)
+
+        if c_make_encoder is not None:
+            c_encoder = c_make_encoder(None, default, encode_basestring_ascii,
+                                       None, ': ', ', ', False, False, True)
+            return lambda value: c_encoder(value, 0)
+        return json.JSONEncoder(default=default).iterencode
+
+    def encode(self, data, chunks, value_encoder):
+        # json writes the keys of the dicts in hash order unless sort_keys
+        # is set, which only the pure Python encoder supports
+        if isinstance(data, basestring):
+            chunks.append(encode_basestring_ascii(data))
+        elif isinstance(data, Bundle):
+            self.encode(data.data, chunks, value_encoder)
+        elif isinstance(data, dict):
+            chunks.append('{')
+            for i, key in enumerate(sorted(data.keys())):
+                if i:
+                    chunks.append(', ')
+                if not isinstance(key, basestring):
+                    key = unicode(key)
+                chunks.append(encode_basestring_ascii(key))
+                chunks.append(': ')
+                self.encode(data[key], chunks, value_encoder)
+            chunks.append('}')
+        elif isinstance(data, (list, tuple)):
+            chunks.append('[')
+            for i, value in enumerate(data):
+                if i:
+                    chunks.append(', ')
+                self.encode(value, chunks, value_encoder)
+            chunks.append(']')
+        else:
+            chunks.extend(value_encoder(data))
+
+    def to_json(self, data, options=None):
+        chunks = []
+        self.encode(data, chunks, self.get_value_encoder(options))
+        return ''.join(chunks)
+
+    def iter_json(self, data, options=None):
+        value_encoder = self.get_value_encoder(options)
+        yield '{'
+        for i, key in enumerate(sorted(data.keys())):
+            chunks = []
+            if i:
+                chunks.append(', ')
+            chunks.append(encode_basestring_ascii(key))
+            chunks.append(': ')
+            if key == 'objects':
+                chunks.append('[')
+                yield ''.join(chunks)
+                for j, obj in enumerate(data['objects']):
+                    chunks = [j and ', ' or '']
+                    self.encode(obj, chunks, value_encoder)
+                    yield ''.join(chunks)
+                yield ']'
+            else:
+                self.encode(data[key], chunks, value_encoder)
+                yield ''.join(chunks)
+        yield '}'
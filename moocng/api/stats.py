@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+# Copyright 2013 UNED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import atexit
+import logging
+import os
+import threading
+
+from django.conf import settings
+
+from celery import signals
+
+from moocng.mongodb import get_db
+
+logger = logging.getLogger(__name__)
+
+# Default values of the STATS_AGGREGATOR_MAX_EVENTS and
+# STATS_AGGREGATOR_WINDOW settings
+DEFAULT_MAX_EVENTS = 100
+DEFAULT_WINDOW = 5  # in seconds
+
+
+class StatsAggregator(object):
+    """
+    Buffer the increments of the stats_kq, stats_unit and stats_course
+    documents and write them coalesced, one $inc per document, when
+    max_events increments have been buffered or after window seconds.
+
+    With max_events <= 1 or window <= 0 every increment is written right away.
+
+    .. versionadded:: 0.1
+    """
+
+    def __init__(self, max_events=DEFAULT_MAX_EVENTS, window=DEFAULT_WINDOW):
+        self.max_events = max_events
+        self.window = window
+        self.lock = threading.RLock()
+        self.pending = {}
+        self.events = 0
+        self.timer = None
+
+    @property
+    def enabled(self):
+        return self.max_events > 1 and self.window > 0
+
+    def _merge(self, key, data):
+        increments = self.pending.setdefault(key, {})
+        for field, value in data.items():
+            increments[field] = increments.get(field, 0) + value
+
+    def add(self, collection, key_field, key_value, data):
+        if not data:
+            return
+
+        with self.lock:
+            self._merge((collection, key_field, key_value), data)
+            self.events += 1
+
+            if not self.enabled or self.events >= self.max_events:
+                self.flush()
+            elif self.timer is None:
+                self._start_timer(self.window)
+
+    def _start_timer(self, interval):
+        self.timer = threading.Timer(interval, self.flush)
+        self.timer.daemon = True
+        self.timer.start()
+
+    def flush(self):
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            pending = self.pending
+            self.pending = {}
+            self.events = 0
+
+            db = get_db()
+            for key, increments in pending.items():
+                collection, key_field, key_value = key
+                try:
+                    db.get_collection(collection).update(
+                        {key_field: key_value},
+                        {'$inc': increments},
+                        safe=True
+                    )
+                except Exception:
+                    logger.exception('The stats increments of %s %s=%s could '
+                                     'not be stored' % key)
+                    # Keep them for the next flush
+                    self._merge(key, increments)
+                    self.events += 1
+
+            # Retry the failed increments later even if no other event comes
+            if self.pending and self.timer is None:
+                self._start_timer(self.window if self.window > 0
+                                  else DEFAULT_WINDOW)
+
+
+_aggregator = None
+_aggregator_pid = None
+
+
+def get_stats_aggregator():
+    global _aggregator, _aggregator_pid
+    # An aggregator must not be shared by forked processes (e.g. the pool
+    # processes of a celery worker)
+    if _aggregator is None or _aggregator_pid != os.getpid():
+        _aggregator = StatsAggregator(
+            max_events=getattr(settings, 'STATS_AGGREGATOR_MAX_EVENTS',
+                               DEFAULT_MAX_EVENTS),
+            window=getattr(settings, 'STATS_AGGREGATOR_WINDOW',
+                           DEFAULT_WINDOW))
+        _aggregator_pid = os.getpid()
+    return _aggregator
+
+
+def flush_stats_aggregator(*args, **kwargs):
+    if _aggregator is not None and _aggregator_pid == os.getpid():
+        _aggregator.flush()
+
+
+def register_stats_aggregator_finalizer(*args, **kwargs):
+    # The pool processes of a celery worker leave through os._exit, which
+    # doesn't run the atexit functions, but they run the finalizers of
+    # (billiard) multiprocessing before it
+    try:
+        from billiard.util import Finalize
+    except ImportError:
+        from multiprocessing.util import Finalize
+    return Finalize(None, flush_stats_aggregator, exitpriority=10)
+
+
+# Don't lose the buffered increments when the worker stops: the pool
+# processes flush them through the finalizer registered when they start,
+# the main process (and the solo pool) through worker_shutdown and atexit
+signals.worker_process_init.connect(register_stats_aggregator_finalizer,
+                                    weak=False)
+signals.worker_shutdown.connect(flush_stats_aggregator, weak=False)
+atexit.register(flush_stats_aggregator)
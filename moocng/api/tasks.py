@@ -20,98 +20,80 @@ from django.contrib.auth.models import User
 
 from celery import task
 
+from moocng.api.stats import get_stats_aggregator
+from moocng.courses.marks import invalidate_user_marks
 from moocng.courses.models import KnowledgeQuantum
-from moocng.mongodb import get_db
+from moocng.courses.structure import get_course_structure
+from moocng.mongodb import count_upto, get_db
+
+
+def count_previous_activity(activity_created, field, limit):
+    # Only the activity inserted until this one is counted, the task can run
+    # after the next activities of the user are inserted
+    query = {
+        'user_id': activity_created['user_id'],
+        field: activity_created[field],
+    }
+    if activity_created.get('_id', None) is not None:
+        query['_id'] = {'$lte': activity_created['_id']}
+    return count_upto(get_db().get_collection('activity'), query, limit)
 
 
 @task
-def on_activity_created_task(activity_created, unit_activity, course_activity):
-    db = get_db()
+def on_activity_created_task(activity_created, unit_activity=None,
+                             course_activity=None):
     kq = KnowledgeQuantum.objects.get(id=activity_created['kq_id'])
-    kq_type = kq.kq_type()
+    structure = get_course_structure(kq.unit.course_id)
+    kq_type = structure.kq_type(kq.id)
+    # The counts are only compared with 1 and with the number of nuggets
+    if unit_activity is None:
+        unit_activity = count_previous_activity(activity_created, 'unit_id',
+                                                structure.kq_count + 1)
+    if course_activity is None:
+        course_activity = count_previous_activity(activity_created, 'course_id',
+                                                  structure.kq_count + 1)
     up_kq, up_u, up_c, passed_kq, passed_unit, passed_course = update_mark(activity_created)
     # KQ
-    data = {
+    data_kq = {
         'viewed': 1
     }
     if kq_type == 'Video' or passed_kq:
-        data['passed'] = 1
-    stats_kq = db.get_collection('stats_kq')
-    stats_kq.update(
-        {'kq_id': activity_created['kq_id']},
-        {'$inc': data},
-        safe=True
-    )
+        data_kq['passed'] = 1
 
     # UNIT
-    data = {}
+    data_unit = {}
     if unit_activity == 1:  # First activity of the unit
-        data['started'] = 1
-    elif kq.unit.knowledgequantum_set.count() == unit_activity:
-        data['completed'] = 1
+        data_unit['started'] = 1
+    elif structure.unit_kq_count(kq.unit_id) == unit_activity:
+        data_unit['completed'] = 1
 
     if passed_unit:
-        data['passed'] = 1
-
-    if data.keys():
-        stats_unit = db.get_collection('stats_unit')
-        stats_unit.update(
-            {'unit_id': kq.unit.id},
-            {'$inc': data},
-            safe=True
-        )
+        data_unit['passed'] = 1
 
     # COURSE
-    course_kqs = KnowledgeQuantum.objects.filter(unit__course__id=activity_created['course_id']).count()
-    data = {}
+    data_course = {}
     if course_activity == 1:  # First activity of the course
-        data['started'] = 1
-    elif course_kqs == course_activity:
-        data['completed'] = 1
+        data_course['started'] = 1
+    elif structure.kq_count == course_activity:
+        data_course['completed'] = 1
 
     if passed_course:
-        data['passed'] = 1
+        data_course['passed'] = 1
 
-    if data.keys():
-        stats_course = db.get_collection('stats_course')
-        stats_course.update(
-            {'course_id': activity_created['course_id']},
-            {'$inc': data},
-            safe=True
-        )
+    update_stats({'kq_id': activity_created['kq_id'],
+                  'unit_id': kq.unit_id,
+                  'course_id': activity_created['course_id']},
+                 data_kq, data_unit, data_course)
 
 
 def update_stats(submitted, data_kq=None, data_unit=None, data_course=None):
-    db = get_db()
-    data_kq = data_kq or {}
-    data_unit = data_unit or {}
-    data_course = data_course or {}
-    # KQ
-    if data_kq.keys():
-        stats_kq = db.get_collection('stats_kq')
-        stats_kq.update(
-            {'kq_id': submitted['kq_id']},
-            {'$inc': data_kq},
-            safe=True
-        )
-
-    # UNIT
-    if data_unit.keys():
-        stats_unit = db.get_collection('stats_unit')
-        stats_unit.update(
-            {'unit_id': submitted['unit_id']},
-            {'$inc': data_unit},
-            safe=True
-        )
-
-    # COURSE
-    if data_course.keys():
-        stats_course = db.get_collection('stats_course')
-        stats_course.update(
-            {'course_id': submitted['course_id']},
-            {'$inc': data_course},
-            safe=True
-        )
+    # The increments are buffered and coalesced by the stats aggregator, see
+    # moocng.api.stats
+    aggregator = get_stats_aggregator()
+    aggregator.add('stats_kq', 'kq_id', submitted['kq_id'], data_kq)
+    aggregator.add('stats_unit', 'unit_id', submitted['unit_id'], data_unit)
+    aggregator.add('stats_course', 'course_id', submitted['course_id'],
+                   data_course)
 
 
 def to_decimal(float_price):
@@ -189,6 +171,8 @@ def update_unit_mark(db, unit, user, threshold, new_mark_unit=None, new_mark_nor
         data_unit['mark'] = new_mark_unit
         data_unit['relative_mark'] = new_mark_normalized_unit
         marks_unit.insert(data_unit)
+    if updated_unit_mark:
+        invalidate_user_marks(user.pk)
     return updated_unit_mark, has_passed_now(new_mark_unit, mark_unit_item, threshold)
 
 
@@ -213,11 +197,84 @@ def update_course_mark(db, course, user, new_mark_course=None):
         updated_course_mark = True
         data_course['mark'] = new_mark_course
         marks_course.insert(data_course)
+    if updated_course_mark:
+        invalidate_user_marks(user.pk)
     return updated_course_mark, has_passed_now(new_mark_course, mark_course_item, course.threshold)
 
 
+def set_kq_mark(db, kq, user, new_mark_kq, new_mark_normalized_kq):
+    # Returns the previous mark document (None if there wasn't any) in the
+    # same round trip that stores the new mark
+    data_kq = {}
+    data_kq['user_id'] = user.pk
+    data_kq['course_id'] = kq.unit.course_id
+    data_kq['unit_id'] = kq.unit_id
+    data_kq['kq_id'] = kq.pk
+    marks_kq = db.get_collection('marks_kq')
+    return marks_kq.find_and_modify(
+        data_kq,
+        {'$set': {'mark': new_mark_kq,
+                  'relative_mark': new_mark_normalized_kq}},
+        upsert=True,
+        new=False
+    )
+
+
+def inc_unit_mark(db, unit, user, threshold, inc_mark_unit):
+    # The unit mark is the sum of the relative marks of its nuggets, so it
+    # starts at 0 and every change of a nugget is added atomically, even the
+    # first one. A full calculation here would count twice the nuggets
+    # changed at the same time by other events.
+    structure = get_course_structure(unit.course_id)
+    normalized_unit_weight = structure.unit_normalized_weight(unit.pk)
+    inc_mark_normalized_unit = (normalized_unit_weight * inc_mark_unit) / 100.0
+    data_unit = {}
+    data_unit['user_id'] = user.pk
+    data_unit['course_id'] = unit.course_id
+    data_unit['unit_id'] = unit.pk
+
+    marks_unit = db.get_collection('marks_unit')
+    mark_unit_item = marks_unit.find_and_modify(
+        data_unit,
+        {'$inc': {'mark': inc_mark_unit,
+                  'relative_mark': inc_mark_normalized_unit}},
+        upsert=True,
+        new=True
+    )
+    invalidate_user_marks(user.pk)
+    old_mark_unit_item = {'mark': mark_unit_item['mark'] - inc_mark_unit}
+    return inc_mark_normalized_unit, has_passed_now(mark_unit_item['mark'], old_mark_unit_item, threshold)
+
+
+def inc_course_mark(db, course, user, inc_mark_course):
+    # Like the unit mark, the course mark is the sum of the relative marks of
+    # its units and starts at 0
+    data_course = {}
+    data_course['user_id'] = user.pk
+    data_course['course_id'] = course.pk
+    marks_course = db.get_collection('marks_course')
+    mark_course_item = marks_course.find_and_modify(
+        data_course,
+        {'$inc': {'mark': inc_mark_course}},
+        upsert=True,
+        new=True
+    )
+    invalidate_user_marks(user.pk)
+    old_mark_course_item = {'mark': mark_course_item['mark'] - inc_mark_course}
+    return has_passed_now(mark_course_item['mark'], old_mark_course_item, course.threshold)
+
+
 def update_mark(submitted):
-    from moocng.courses.marks import calculate_kq_mark, calculate_unit_mark, calculate_course_mark
+    """
+    Update the marks of the nugget, unit and course affected by a student
+    event. Only the nugget mark is calculated, the unit and course marks are
+    moved with atomic $inc updates by the change in the relative mark of the
+    nugget, so the cost doesn't depend on the size of the unit or the course.
+
+    The full calculation (update_course_mark_by_user) is still available to
+    resynchronize the marks, e.g. after changing the weights of a course.
+    """
+    from moocng.courses.marks import calculate_kq_mark
     updated_kq_mark = updated_unit_mark = updated_course_mark = False
     passed_kq = passed_unit = passed_course = False
     kq = KnowledgeQuantum.objects.get(pk=submitted['kq_id'])
@@ -229,26 +286,35 @@ def update_mark(submitted):
     db = get_db()
 
     # KQ
-    updated_kq_mark, passed_kq = update_kq_mark(db, kq, user, course.threshold,
-                                                new_mark_kq=mark_kq,
-                                                new_mark_normalized_kq=mark_normalized_kq)
+    mark_kq_item = set_kq_mark(db, kq, user, mark_kq, mark_normalized_kq)
+    if mark_kq_item:
+        updated_kq_mark = (mark_kq != mark_kq_item['mark'] or
+                           mark_normalized_kq != mark_kq_item['relative_mark'])
+        old_mark_normalized_kq = mark_kq_item['relative_mark']
+    else:
+        updated_kq_mark = True
+        old_mark_normalized_kq = 0
+    threshold = course.threshold
+    if get_course_structure(course.pk).kq_type(kq.pk) == 'PeerReviewAssignment' and threshold is not None:
+        threshold = decimal.Decimal('5.0')  # P2P is a special case
+    passed_kq = has_passed_now(mark_kq, mark_kq_item, threshold)
 
     # UNIT
-    if not updated_kq_mark:
+    inc_mark_unit = mark_normalized_kq - old_mark_normalized_kq
+    if not updated_kq_mark or inc_mark_unit == 0:
         return (updated_kq_mark, updated_unit_mark, updated_course_mark,
                 passed_kq, passed_unit, passed_course)
 
-    mark_unit, mark_normalized_unit = calculate_unit_mark(kq.unit, user)
-    updated_unit_mark, passed_unit = update_unit_mark(db, unit, user, course.threshold,
-                                                      new_mark_unit=mark_unit,
-                                                      new_mark_normalized_unit=mark_normalized_unit)
+    updated_unit_mark = True
+    inc_mark_course, passed_unit = inc_unit_mark(db, unit, user, course.threshold,
+                                                 inc_mark_unit)
 
     # COURSE
-    if not updated_unit_mark:
+    if inc_mark_course == 0:
         return (updated_kq_mark, updated_unit_mark, updated_course_mark,
                 passed_kq, passed_unit, passed_course)
-    mark_course, units_info = calculate_course_mark(unit.course, user)
-    updated_course_mark, passed_course = update_course_mark(db, course, user, mark_course)
+    updated_course_mark = True
+    passed_course = inc_course_mark(db, course, user, inc_mark_course)
     return (updated_kq_mark, updated_unit_mark, updated_course_mark,
             passed_kq, passed_unit, passed_course)
 
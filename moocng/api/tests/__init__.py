@@ -16,6 +16,15 @@
 #from moocng.api.tests.test_api import ServicesTestCase
 #from moocng.api.tests.test_course import CoursesTestCase, CourseTestCase
 from moocng.api.tests.test_unit import UnitsTestCase, UnitTestCase
+from moocng.api.tests.test_queries import QueriesTestCase
+from moocng.api.tests.test_activity import ActivityTestCase
 #from moocng.api.tests.test_kq import KqsTestCase, KqTestCase
 #from moocng.api.tests.test_privkq import PrivKqsTestCase, PrivKqTestCase
 #from moocng.api.tests.test_user import UserTestCase
+from moocng.api.tests.test_user import BulkPassedCoursesTestCase
+from moocng.api.tests.test_stats import StatsAggregatorTestCase
+from moocng.api.tests.test_marks import MarksTestCase
+from moocng.api.tests.test_portal_stats import PortalStatsTestCase
+from moocng.api.tests.test_cachebackends import TieredCacheTestCase
+from moocng.api.tests.test_serializers import FastSerializerTestCase
+from moocng.api.tests.test_etag import ConditionalGetTestCase
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+# Copyright 2012-2013 UNED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from django.utils import simplejson
+
+from moocng.api.tests.utils import ApiTestCase
+
+
+class ActivityTestCase(ApiTestCase):
+
+    def test_get_activity_pages(self):
+        user = self.create_test_user_user()
+        self.client = self.django_login_user(self.client, user)
+
+        activity = self.mongodb.get_collection('activity')
+        activity.insert([{
+            'user_id': user.id,
+            'course_id': 1,
+            'unit_id': 1,
+            'kq_id': kq_id,
+        } for kq_id in range(5)], safe=True)
+
+        kq_ids = []
+        url = '/api/%s/activity/%s&limit=2' % (self.api_name, self.format_append)
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            page = simplejson.loads(response.content)
+            self.assertEqual(page['meta']['total_count'], 5)
+            self.assertTrue(len(page['objects']) <= 2)
+            kq_ids.extend([obj['kq_id'] for obj in page['objects']])
+            url = page['meta']['next']
+            if url is not None:
+                self.assertTrue('after=' in url)
+        self.assertEqual(kq_ids, range(5))
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+# Copyright 2013 UNED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from django.core.cache import get_cache
+from django.test import TestCase
+from django.test.utils import override_settings
+
+
+@override_settings(CACHES={
+    'default': {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+    },
+    'tiered_local': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tiered-test-local',
+    },
+    'tiered_shared': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tiered-test-shared',
+    },
+})
+class TieredCacheTestCase(TestCase):
+
+    def setUp(self):
+        self.cache = get_cache('moocng.cachebackends.TieredCache', OPTIONS={
+            'LOCAL': 'tiered_local',
+            'SHARED': 'tiered_shared',
+            'LOCAL_TIMEOUT': 5,
+        })
+        self.local = self.cache.local
+        self.shared = self.cache.shared
+        self.cache.clear()
+
+    def test_set(self):
+        self.cache.set('key', 'value')
+        self.assertEqual(self.local.get('key'), 'value')
+        self.assertEqual(self.shared.get('key'), 'value')
+        self.assertEqual(self.cache.get('key'), 'value')
+
+    def test_get_from_shared(self):
+        # Set by another process
+        self.shared.set('key', 'value')
+        self.assertEqual(self.local.get('key'), None)
+        self.assertEqual(self.cache.get('key'), 'value')
+        self.assertEqual(self.local.get('key'), 'value')
+
+        self.assertEqual(self.cache.get('missing', 'default'), 'default')
+        self.assertEqual(self.local.get('missing'), None)
+
+    def test_get_from_local(self):
+        self.cache.set('key', 'value')
+        # Changed by another process, seen up to LOCAL_TIMEOUT seconds later
+        self.shared.set('key', 'other value')
+        self.assertEqual(self.cache.get('key'), 'value')
+
+    def test_delete(self):
+        self.cache.set('key', 'value')
+        self.cache.delete('key')
+        self.assertEqual(self.local.get('key'), None)
+        self.assertEqual(self.shared.get('key'), None)
+        self.assertEqual(self.cache.get('key'), None)
+
+    def test_add(self):
+        self.assertTrue(self.cache.add('key', 'value'))
+        self.assertEqual(self.shared.get('key'), 'value')
+        self.assertEqual(self.cache.get('key'), 'value')
+
+        # Added by another process before, the local value is outdated
+        self.local.set('other', 'local value')
+        self.shared.set('other', 'shared value')
+        self.assertFalse(self.cache.add('other', 'value'))
+        self.assertEqual(self.local.get('other'), None)
+        self.assertEqual(self.cache.get('other'), 'shared value')
+
+    def test_local_timeout(self):
+        self.assertEqual(self.cache._get_local_timeout(60), 5)
+        self.assertEqual(self.cache._get_local_timeout(1), 1)
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+# Copyright 2013 UNED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from django.contrib.auth.models import AnonymousUser
+from django.test.client import RequestFactory
+
+from moocng.api.resources import UnitResource
+from moocng.api.tests.utils import ApiTestCase
+
+
+class ConditionalGetTestCase(ApiTestCase):
+
+    def setUp(self):
+        super(ConditionalGetTestCase, self).setUp()
+        owner = self.create_test_user_owner()
+        self.course = self.create_test_basic_course(owner)
+        self.unit = self.create_test_basic_unit(self.course)
+        self.kq = self.create_test_basic_kq(self.unit)
+        self.url = '/api/%s/unit/%s&course=%d' % (self.api_name,
+                                                  self.format_append,
+                                                  self.course.id)
+
+    def get_etag(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.has_header('ETag'))
+        return response['ETag']
+
+    def test_etag_changes_after_save(self):
+        user = self.create_test_user_user()
+        self.client = self.django_login_user(self.client, user)
+
+        etag = self.get_etag()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.unit.title = 'test_renamed_unit'
+        self.unit.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue('test_renamed_unit' in response.content)
+        unit_etag = response['ETag']
+        self.assertNotEqual(unit_etag, etag)
+
+        self.kq.title = 'test_renamed_kq'
+        self.kq.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=unit_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response['ETag'] in (etag, unit_etag))
+
+    def test_not_modified_unauthenticated(self):
+        # The ETag an anonymous user would get if it was allowed
+        request = RequestFactory().get(self.url)
+        request.user = AnonymousUser()
+        etag = UnitResource().build_etag(request, self.course.id, False)
+        self.assertNotEqual(etag, None)
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 401)
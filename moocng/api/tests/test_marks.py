@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+# Copyright 2013 UNED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from moocng.api.tasks import update_mark
+from moocng.api.tests.utils import ApiTestCase
+from moocng.courses.models import CourseStudent
+
+
+class MarksTestCase(ApiTestCase):
+
+    up_collections = ('activity', 'marks_kq', 'marks_unit', 'marks_course')
+    down_collections = ('activity', 'marks_kq', 'marks_unit', 'marks_course')
+
+    def setUp(self):
+        super(MarksTestCase, self).setUp()
+        owner = self.create_test_user_owner()
+        self.user = self.create_test_user_user()
+        self.course = self.create_test_basic_course(owner)
+        # The only scorable unit, with two videos of the same weight
+        self.unit = self.create_test_basic_unit(self.course, unittype='h')
+        self.kq1 = self.create_test_basic_kq(self.unit)
+        self.kq2 = self.create_test_basic_kq(self.unit)
+
+    def watch(self, kq):
+        submitted = {
+            'user_id': self.user.id,
+            'course_id': self.course.id,
+            'unit_id': self.unit.id,
+            'kq_id': kq.id,
+        }
+        self.mongodb.get_collection('activity').insert(dict(submitted),
+                                                       safe=True)
+        return update_mark(submitted)
+
+    def get_marks(self, collection):
+        return [(mark['mark'], mark.get('relative_mark', None))
+                for mark in self.mongodb.get_collection(collection).find(
+                    {'user_id': self.user.id})]
+
+    def test_first_mark(self):
+        updated = self.watch(self.kq1)
+        self.assertEqual(updated[:3], (True, True, True))
+        self.assertEqual(self.get_marks('marks_unit'), [(5.0, 5.0)])
+        self.assertEqual(self.get_marks('marks_course'), [(5.0, None)])
+
+    def test_mark_delta(self):
+        self.watch(self.kq1)
+        updated = self.watch(self.kq2)
+        self.assertEqual(updated[:3], (True, True, True))
+        # The unit and course marks are moved, not created again
+        self.assertEqual(self.get_marks('marks_unit'), [(10.0, 10.0)])
+        self.assertEqual(self.get_marks('marks_course'), [(10.0, None)])
+
+    def test_unchanged_mark(self):
+        self.watch(self.kq1)
+        updated = self.watch(self.kq1)
+        self.assertEqual(updated[:3], (False, False, False))
+        self.assertEqual(self.get_marks('marks_unit'), [(5.0, 5.0)])
+        self.assertEqual(self.get_marks('marks_course'), [(5.0, None)])
+
+    def test_transcript_after_mark(self):
+        self.course.status = 'p'
+        self.course.save()
+        self.unit.status = 'p'
+        self.unit.save()
+        CourseStudent.objects.create(course=self.course, student=self.user)
+        self.client = self.django_login_user(self.client, self.user)
+        url = '/transcript/'
+
+        response = self.client.get(url)
+        self.assertContains(response, '<strong> 0</strong>/10')
+
+        # A cached transcript doesn't read the marks again
+        self.mongodb.get_collection('marks_unit').insert({
+            'user_id': self.user.id,
+            'course_id': self.course.id,
+            'unit_id': self.unit.id,
+            'mark': 1.0,
+            'relative_mark': 1.0,
+        }, safe=True)
+        cached = self.client.get(url)
+        self.assertEqual(cached.content, response.content)
+        self.mongodb.get_collection('marks_unit').remove(safe=True)
+
+        # The mark event invalidates it
+        self.watch(self.kq1)
+        response = self.client.get(url)
+        self.assertContains(response, '<strong> 5</strong>/10')
+
+        # And so does a change of the units of the course
+        self.unit.title = 'renamed unit'
+        self.unit.save()
+        self.assertContains(self.client.get(url), 'renamed unit')
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+# Copyright 2013 UNED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from moocng.api.tests.utils import ApiTestCase
+from moocng.portal.stats import (calculate_all_stats,
+                                 calculate_all_stats_in_shards,
+                                 store_stats_in_mongo)
+
+
+class ShardInterrupted(Exception):
+    pass
+
+
+class PortalStatsTestCase(ApiTestCase):
+
+    up_collections = ('activity', 'stats_kq', 'stats_unit', 'stats_course',
+                      'stats_checkpoints')
+    down_collections = ('activity', 'stats_kq', 'stats_unit', 'stats_course',
+                        'stats_checkpoints')
+
+    def get_stats(self, collection, key_field):
+        fields = ('started', 'completed', 'passed', 'viewed', 'submitted')
+        return dict([(doc[key_field], dict([(field, doc[field])
+                                            for field in fields
+                                            if field in doc]))
+                     for doc in self.mongodb.get_collection(collection).find()])
+
+    def create_activity_data(self):
+        owner = self.create_test_user_owner()
+        course = self.create_test_basic_course(owner)
+        unit = self.create_test_basic_unit(course, unittype='h')
+        kq1 = self.create_test_basic_kq(unit)
+        kq2 = self.create_test_basic_kq(unit)
+        students = [self.create_test_user_alum1(), self.create_test_user_alum2(),
+                    self.create_test_user_user(), self.create_test_user_test()]
+        activity = self.mongodb.get_collection('activity')
+        for student, kqs in zip(students, ([kq1, kq2], [kq1], [kq2], [kq1, kq2])):
+            for kq in kqs:
+                activity.insert({
+                    'user_id': student.id,
+                    'course_id': course.id,
+                    'unit_id': unit.id,
+                    'kq_id': kq.id,
+                }, safe=True)
+
+    def get_all_stats(self):
+        return (self.get_stats('stats_course', 'course_id'),
+                self.get_stats('stats_unit', 'unit_id'),
+                self.get_stats('stats_kq', 'kq_id'))
+
+    def clear_stats(self):
+        for collection in ('stats_kq', 'stats_unit', 'stats_course'):
+            self.mongodb.get_collection(collection).remove(safe=True)
+
+    def test_stats_in_shards(self):
+        self.create_activity_data()
+        calculate_all_stats()
+        expected = self.get_all_stats()
+        self.assertEqual(expected[0].values(),
+                         [{'started': 4, 'completed': 2, 'passed': 0}])
+
+        self.clear_stats()
+        calculate_all_stats_in_shards(processes=1, shard_size=2)
+        self.assertEqual(self.get_all_stats(), expected)
+
+    def test_stats_in_shards_resumed(self):
+        self.create_activity_data()
+        calculate_all_stats()
+        expected = self.get_all_stats()
+
+        def interrupt(step, counter, total):
+            # After the first shard with students is saved
+            if counter > 0:
+                raise ShardInterrupted()
+
+        self.clear_stats()
+        self.assertRaises(ShardInterrupted, calculate_all_stats_in_shards,
+                          processes=1, shard_size=2, callback=interrupt)
+        self.assertEqual(self.get_all_stats(), ({}, {}, {}))
+
+        calculate_all_stats_in_shards(processes=1, shard_size=2, resume=True)
+        self.assertEqual(self.get_all_stats(), expected)
+
+        # Resuming a stored run doesn't store it again
+        calculate_all_stats_in_shards(processes=1, shard_size=2, resume=True)
+        self.assertEqual(self.get_all_stats(), expected)
+
+    def test_store_stats_twice(self):
+        stats = {
+            1: {'started': 2, 'completed': 1, 'passed': 1, 'u': {
+                10: {'started': 2, 'completed': 1, 'passed': 0, 'n': {
+                    100: {'viewed': 2, 'submitted': 1, 'passed': 1},
+                    101: {'viewed': 1},
+                }},
+            }},
+            2: {'started': 1, 'completed': 0, 'passed': 0, 'u': {}},
+        }
+        # The documents are created the first time and incremented the second
+        store_stats_in_mongo(stats, chunk_size=2)
+        store_stats_in_mongo(stats, chunk_size=2)
+
+        self.assertEqual(self.get_stats('stats_course', 'course_id'), {
+            1: {'started': 4, 'completed': 2, 'passed': 2},
+            2: {'started': 2, 'completed': 0, 'passed': 0},
+        })
+        self.assertEqual(self.get_stats('stats_unit', 'unit_id'), {
+            10: {'started': 4, 'completed': 2, 'passed': 0},
+        })
+        self.assertEqual(self.get_stats('stats_kq', 'kq_id'), {
+            100: {'viewed': 4, 'submitted': 2, 'passed': 2},
+            101: {'viewed': 2},
+        })
+        self.assertEqual(self.mongodb.get_collection('stats_kq').find_one(
+            {'kq_id': 100})['unit_id'], 10)
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+# Copyright 2012-2013 UNED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from django.db import connection
+from django.db.models import signals
+
+from moocng.api.tests.utils import ApiTestCase
+from moocng.courses.models import (KnowledgeQuantum, Question, Option, Unit,
+                                   handle_question_post_save)
+
+
+class QueriesTestCase(ApiTestCase):
+    """
+    The number of SQL queries of the list requests must not depend on the
+    number of objects returned
+    """
+
+    def setUp(self):
+        super(QueriesTestCase, self).setUp()
+        # Don't send the videos of the questions to celery
+        signals.post_save.disconnect(handle_question_post_save, sender=Question)
+
+    def tearDown(self):
+        super(QueriesTestCase, self).tearDown()
+        signals.post_save.connect(handle_question_post_save, sender=Question)
+
+    def count_queries(self, url):
+        use_debug_cursor = connection.use_debug_cursor
+        connection.use_debug_cursor = True
+        start = len(connection.queries)
+        try:
+            response = self.client.get(url)
+        finally:
+            connection.use_debug_cursor = use_debug_cursor
+        self.assertEqual(response.status_code, 200)
+        return len(connection.queries) - start
+
+    def create_test_unit(self, course, title):
+        return Unit.objects.create(title=title, course=course, unittype='n')
+
+    def create_test_question(self, unit, title, options):
+        # The titles of the nuggets of a unit are unique
+        kq = KnowledgeQuantum.objects.create(title=title, unit=unit, weight=1)
+        question = Question.objects.create(kq=kq)
+        for i in range(options):
+            Option.objects.create(question=question, optiontype='c',
+                                  solution='true', y=i * 20)
+        return question
+
+    def test_get_kqs_queries(self):
+        owner = self.create_test_user_owner()
+        alum1 = self.create_test_user_alum1()
+        self.client = self.django_login_user(self.client, alum1)
+        course = self.create_test_basic_course(owner, student=alum1)
+
+        small_unit = self.create_test_unit(course, 'test_small_unit')
+        big_unit = self.create_test_unit(course, 'test_big_unit')
+        for i in range(2):
+            self.create_test_question(small_unit, 'test_kq_%d' % i, 2)
+        for i in range(10):
+            self.create_test_question(big_unit, 'test_kq_%d' % i, 2)
+
+        url = '/api/%s/kq/%s&unit=%%d' % (self.api_name, self.format_append)
+        # The first request loads the course structure
+        self.count_queries(url % small_unit.id)
+        self.assertEqual(self.count_queries(url % small_unit.id),
+                         self.count_queries(url % big_unit.id))
+
+    def test_get_options_queries(self):
+        owner = self.create_test_user_owner()
+        alum1 = self.create_test_user_alum1()
+        self.client = self.django_login_user(self.client, alum1)
+        course = self.create_test_basic_course(owner, student=alum1)
+
+        unit = self.create_test_basic_unit(course)
+        small_question = self.create_test_question(unit, 'test_small_kq', 2)
+        big_question = self.create_test_question(unit, 'test_big_kq', 10)
+
+        url = '/api/%s/option/%s&question=%%d' % (self.api_name,
+                                                  self.format_append)
+        self.assertEqual(self.count_queries(url % small_question.id),
+                         self.count_queries(url % big_question.id))
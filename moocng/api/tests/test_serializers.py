@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+# Copyright 2013 UNED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import datetime
+from decimal import Decimal
+
+from django.test import TestCase
+from django.utils.translation import ugettext_lazy as _
+
+from tastypie.bundle import Bundle
+from tastypie.serializers import Serializer
+
+from moocng.api.serializers import FastSerializer
+
+
+class FastSerializerTestCase(TestCase):
+
+    def get_data(self):
+        unit = Bundle(data={
+            'id': 2,
+            'title': u'Unidad de introducción',
+            'start': datetime.datetime(2013, 10, 1, 9, 30),
+            'deadline': None,
+            'weight': Decimal('12.50'),
+        })
+        objects = [Bundle(data={
+            'id': kq_id,
+            'title': _(u'Nugget'),
+            'unit': unit,
+            'created': datetime.date(2013, 9, 1),
+            'normalized_weight': 0.5,
+            'is_active': kq_id % 2 == 0,
+            'media_content_types': ['youtube', u'vímeo'],
+            'answers': {'1': [1, 2], 'b': {'c': Decimal('0.1')}},
+        }) for kq_id in range(3)]
+        return {
+            'meta': {'limit': 20, 'next': None, 'offset': 0,
+                     'previous': None, 'total_count': len(objects)},
+            'objects': objects,
+        }
+
+    def test_to_json(self):
+        expected = Serializer().to_json(self.get_data())
+        self.assertEqual(FastSerializer().to_json(self.get_data()), expected)
+
+    def test_iter_json(self):
+        expected = Serializer().to_json(self.get_data())
+        self.assertEqual(''.join(FastSerializer().iter_json(self.get_data())),
+                         expected)
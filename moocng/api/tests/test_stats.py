@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+# Copyright 2013 UNED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from django.test.utils import override_settings
+
+from moocng.api import stats
+from moocng.api.tests.utils import ApiTestCase
+
+
+@override_settings(STATS_AGGREGATOR_MAX_EVENTS=100, STATS_AGGREGATOR_WINDOW=60)
+class StatsAggregatorTestCase(ApiTestCase):
+
+    up_collections = ('stats_kq', )
+    down_collections = ('stats_kq', )
+
+    def setUp(self):
+        super(StatsAggregatorTestCase, self).setUp()
+        stats._aggregator = None
+        self.stats_kq = self.mongodb.get_collection('stats_kq')
+        self.stats_kq.insert({'kq_id': 1, 'viewed': 0}, safe=True)
+
+    def tearDown(self):
+        aggregator = stats._aggregator
+        if aggregator is not None and aggregator.timer is not None:
+            aggregator.timer.cancel()
+        stats._aggregator = None
+        super(StatsAggregatorTestCase, self).tearDown()
+
+    def get_viewed(self):
+        return self.stats_kq.find_one({'kq_id': 1})['viewed']
+
+    def test_flush_on_shutdown(self):
+        aggregator = stats.get_stats_aggregator()
+        aggregator.add('stats_kq', 'kq_id', 1, {'viewed': 1})
+        aggregator.add('stats_kq', 'kq_id', 1, {'viewed': 1})
+        self.assertEqual(self.get_viewed(), 0)
+
+        stats.flush_stats_aggregator()
+        self.assertEqual(self.get_viewed(), 2)
+        self.assertEqual(aggregator.pending, {})
+
+    def test_flush_on_pool_process_exit(self):
+        # What a pool process runs when it starts and when it exits
+        finalizer = stats.register_stats_aggregator_finalizer()
+        aggregator = stats.get_stats_aggregator()
+        aggregator.add('stats_kq', 'kq_id', 1, {'viewed': 3})
+        self.assertEqual(self.get_viewed(), 0)
+
+        finalizer()
+        self.assertEqual(self.get_viewed(), 3)
+
+    def test_failed_flush_is_retried(self):
+        # A $inc of a non numeric field fails
+        self.stats_kq.update({'kq_id': 1}, {'$set': {'viewed': 'none'}},
+                             safe=True)
+        aggregator = stats.get_stats_aggregator()
+        aggregator.add('stats_kq', 'kq_id', 1, {'viewed': 1})
+        aggregator.flush()
+        self.assertEqual(aggregator.pending,
+                         {('stats_kq', 'kq_id', 1): {'viewed': 1}})
+        self.assertNotEqual(aggregator.timer, None)
+
+        self.stats_kq.update({'kq_id': 1}, {'$set': {'viewed': 0}}, safe=True)
+        aggregator.flush()
+        self.assertEqual(self.get_viewed(), 1)
+        self.assertEqual(aggregator.pending, {})
+        self.assertEqual(aggregator.timer, None)
@@ -25,6 +25,7 @@ from django.utils.timezone import utc
 from moocng.api.tests.outputs import (NO_OBJECTS, NORMAL_USER,
                                       BASIC_ALLCOURSES, BASIC_COURSES)
 from moocng.api.tests.utils import ApiTestCase
+from moocng.courses.models import CourseStudent
 
 
 class UserTestCase(ApiTestCase):
@@ -532,3 +533,41 @@ class UserTestCase(ApiTestCase):
         aux_basic_courses['objects'][0]['slug'] = u'course1_course'
         aux_basic_courses['objects'][0]['threshold'] = u'1'
         self.assertEqual(simplejson.loads(response.content), aux_basic_courses)
+
+
+class BulkPassedCoursesTestCase(ApiTestCase):
+
+    def test_get_bulk_passedcourses(self):
+        owner = self.create_test_user_owner()
+
+        certificator = self.create_test_user_user()
+        ct = ContentType.objects.get(model='course', app_label='courses')
+        perm = Permission.objects.get(content_type=ct, codename='can_list_passedcourses')
+        certificator.user_permissions.add(perm)
+        key = str(uuid.uuid4())
+        self.generate_apikeyuser(certificator, key)
+
+        test_user = self.create_test_user_test()
+        alum1 = self.create_test_user_alum1()
+        course1 = self.create_test_basic_course(owner=owner, name='course1')
+        course1.threshold = 5
+        course1.save()
+        CourseStudent.objects.create(course=course1, student=test_user)
+        CourseStudent.objects.create(course=course1, student=alum1)
+
+        marks_course = self.mongodb.get_collection('marks_course')
+        marks_course.remove()
+        marks_course.insert({'user_id': test_user.pk, 'course_id': course1.pk, 'mark': 7.5})
+        marks_course.insert({'user_id': alum1.pk, 'course_id': course1.pk, 'mark': 2.5})
+
+        response = self.client.get('/api/%s/user/passedcourses/%s&key=%s' % (self.api_name, self.format_append, key))
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.get('/api/%s/user/passedcourses/%s&key=%s&users=%d&emails=%s' % (
+            self.api_name, self.format_append, key, test_user.pk, alum1.email))
+        self.assertEqual(response.status_code, 200)
+        objects = simplejson.loads(response.content)['objects']
+        self.assertEqual([(obj['id'], obj['passed_courses']) for obj in objects],
+                         [(test_user.pk, [u'/api/%s/course/%d/' % (self.api_name, course1.pk)]),
+                          (alum1.pk, [])])
+        marks_course.remove()
@@ -14,6 +14,7 @@
 # limitations under the License.
 
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.test import TestCase
 from django.test.utils import override_settings
 
@@ -32,6 +33,8 @@ class ApiTestCase(TestCase):
 
     def setUp(self):
         super(ApiTestCase, self).setUp()
+        # The cache isn't rolled back with the database
+        cache.clear()
         self.mongodb = get_db()
         for collection in self.up_collections:
             self.mongodb.database.drop_collection(collection)
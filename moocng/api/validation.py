@@ -23,7 +23,7 @@ from tastypie.validation import Validation
 
 
 from moocng.courses.models import Question, Option
-from moocng.mongodb import get_db
+from moocng.mongodb import exists, get_db
 
 logger = logging.getLogger(__name__)
 
@@ -106,12 +106,10 @@ class PeerReviewSubmissionsResourceValidation(Validation):
         db = get_db()
         collection = db.get_collection("peer_review_submissions")
 
-        exists = collection.find({
+        if exists(collection, {
             "kq": bundle.data["kq"],
             "author": unicode(request.user.id)
-        })
-
-        if exists.count() > 0:
+        }):
             msg = "Already exists a submission for kq=%s and user=%s" % (
                 bundle.data["kq"],
                 request.user.id)
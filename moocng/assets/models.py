@@ -23,6 +23,7 @@ from django.utils.translation import ugettext
 
 from moocng.assets import cache
 from moocng.courses.models import KnowledgeQuantum
+from moocng.courses.structure import invalidate_course_structure
 
 from tinymce.models import HTMLField
 
@@ -137,13 +138,29 @@ def remove_reservations_delete(sender, instance, **kwargs):
 def invalidate_cache(sender, instance, **kwargs):
     try:
         cache.invalidate_course_has_assets_in_cache(instance.kq.unit.course)
+        # The nuggets of the API include their asset availability
+        invalidate_course_structure(instance.kq.unit.course_id)
     except ObjectDoesNotExist:
         pass
 
 
+def invalidate_cache_assets_changed(sender, instance, action, reverse, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if reverse:
+        # The instance is an Asset
+        for availability in AssetAvailability.objects.filter(
+                id__in=kwargs.get('pk_set') or []).select_related('kq__unit'):
+            invalidate_course_structure(availability.kq.unit.course_id)
+    else:
+        invalidate_cache(sender, instance, **kwargs)
+
+
 signals.pre_save.connect(assure_granularity, sender=Asset)
 signals.post_save.connect(check_duration_reservations, sender=Asset)
 signals.post_save.connect(remove_reservations, sender=AssetAvailability)
 signals.pre_delete.connect(remove_reservations_delete, sender=AssetAvailability)
 signals.post_save.connect(invalidate_cache, sender=AssetAvailability)
 signals.post_delete.connect(invalidate_cache, sender=AssetAvailability)
+signals.m2m_changed.connect(invalidate_cache_assets_changed,
+                            sender=AssetAvailability.assets.through)
@@ -31,7 +31,8 @@ from moocng.assets.utils import (book_asset,
                                  user_course_get_past_reservations,
                                  user_course_get_pending_reservations)
 from moocng.courses.models import KnowledgeQuantum
-from moocng.courses.security import get_course_if_user_can_view_or_404
+from moocng.courses.security import (get_course_access,
+                                     get_course_if_user_can_view_or_404)
 from moocng.courses.utils import is_course_ready
 
 from django.db.models import Q
@@ -43,7 +44,7 @@ from datetime import datetime, timedelta
 def course_reservations(request, course_slug):
     course = get_course_if_user_can_view_or_404(course_slug, request)
 
-    is_enrolled = course.students.filter(id=request.user.id).exists()
+    is_enrolled = get_course_access(course, request.user).is_enrolled
     if not is_enrolled:
         messages.error(request, _('You are not enrolled in this course'))
         return HttpResponseRedirect(reverse('course_overview',
@@ -98,7 +99,7 @@ def cancel_reservation(request, course_slug, reservation_id):
 
         course = get_course_if_user_can_view_or_404(course_slug, request)
 
-        is_enrolled = course.students.filter(id=request.user.id).exists()
+        is_enrolled = get_course_access(course, request.user).is_enrolled
 
         if not is_enrolled:
             messages.error(request, _('You are not enrolled in this course'))
@@ -130,7 +131,7 @@ def reservation_create(request, course_slug, kq_id, asset_id):
 
     if request.method in ['POST', 'PUT']:
         course = get_course_if_user_can_view_or_404(course_slug, request)
-        is_enrolled = course.students.filter(id=request.user.id).exists()
+        is_enrolled = get_course_access(course, request.user).is_enrolled
 
         if not is_enrolled:
             messages.error(request, _('You are not enrolled in this course'))
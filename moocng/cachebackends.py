@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+# Copyright 2013 UNED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from django.core.cache import get_cache
+from django.core.cache.backends.base import BaseCache
+
+# Default value of the LOCAL_TIMEOUT option, in seconds
+DEFAULT_LOCAL_TIMEOUT = 5
+
+_missing = object()
+
+
+class TieredCache(BaseCache):
+    """
+    Cache in two levels: a per process cache (e.g. LocMemCache) in front of
+    a cache shared by every process (e.g. memcached or, where there is no
+    memcached like in the tests, FileBasedCache). Both are other entries of
+    the CACHES setting:
+
+        CACHES = {
+            'default': {
+                'BACKEND': 'moocng.cachebackends.TieredCache',
+                'OPTIONS': {
+                    'LOCAL': 'local',
+                    'SHARED': 'shared',
+                    'LOCAL_TIMEOUT': 5,
+                },
+            },
+            'local': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            },
+            'shared': {
+                'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+                'LOCATION': '127.0.0.1:11211',
+            },
+        }
+
+    The values are kept in the local cache for at most LOCAL_TIMEOUT seconds
+    because the deletes of the other processes don't reach it, so a value
+    changed by another process can be seen that long.
+
+    .. versionadded:: 0.1
+    """
+
+    def __init__(self, location, params):
+        super(TieredCache, self).__init__(params)
+        options = params.get('OPTIONS', {})
+        self.local_alias = options.get('LOCAL', 'local')
+        self.shared_alias = options.get('SHARED', 'shared')
+        self.local_timeout = int(options.get('LOCAL_TIMEOUT',
+                                             DEFAULT_LOCAL_TIMEOUT))
+        self._local = None
+        self._shared = None
+
+    @property
+    def local(self):
+        if self._local is None:
+            self._local = get_cache(self.local_alias)
+        return self._local
+
+    @property
+    def shared(self):
+        if self._shared is None:
+            self._shared = get_cache(self.shared_alias)
+        return self._shared
+
+    def _get_local_timeout(self, timeout):
+        if timeout is None:
+            timeout = self.default_timeout
+        if timeout and timeout < self.local_timeout:
+            return timeout
+        return self.local_timeout
+
+    def add(self, key, value, timeout=None, version=None):
+        added = self.shared.add(key, value, timeout, version=version)
+        # Whether it was added or not the local value can be outdated
+        self.local.delete(key, version=version)
+        return added
+
+    def get(self, key, default=None, version=None):
+        value = self.local.get(key, _missing, version=version)
+        if value is _missing:
+            value = self.shared.get(key, _missing, version=version)
+            if value is _missing:
+                return default
+            self.local.set(key, value, self.local_timeout, version=version)
+        return value
+
+    def set(self, key, value, timeout=None, version=None):
+        self.shared.set(key, value, timeout, version=version)
+        self.local.set(key, value, self._get_local_timeout(timeout),
+                       version=version)
+
+    def delete(self, key, version=None):
+        self.shared.delete(key, version=version)
+        self.local.delete(key, version=version)
+
+    def get_many(self, keys, version=None):
+        values = self.local.get_many(keys, version=version)
+        missing = [key for key in keys if key not in values]
+        if missing:
+            shared_values = self.shared.get_many(missing, version=version)
+            if shared_values:
+                self.local.set_many(shared_values, self.local_timeout,
+                                    version=version)
+                values.update(shared_values)
+        return values
+
+    def set_many(self, data, timeout=None, version=None):
+        self.shared.set_many(data, timeout, version=version)
+        self.local.set_many(data, self._get_local_timeout(timeout),
+                            version=version)
+
+    def delete_many(self, keys, version=None):
+        self.shared.delete_many(keys, version=version)
+        self.local.delete_many(keys, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        value = self.shared.incr(key, delta, version=version)
+        self.local.delete(key, version=version)
+        return value
+
+    def decr(self, key, delta=1, version=None):
+        value = self.shared.decr(key, delta, version=version)
+        self.local.delete(key, version=version)
+        return value
+
+    def clear(self):
+        self.shared.clear()
+        self.local.clear()
+
+    def close(self, **kwargs):
+        for cache in (self._local, self._shared):
+            if cache is not None and hasattr(cache, 'close'):
+                cache.close(**kwargs)
@@ -110,11 +110,15 @@ def num_announcement_dont_viewed(request):
     if user.is_anonymous():
         return {'profile': None,
                 'announcements_dont_viewed': 0}
-    profile = user.get_profile()
-    from moocng.courses.models import Announcement
-    announcement_dont_viewed = Announcement.objects.portal()
-    last_announcement_viewed = getattr(profile, 'last_announcement', None)
-    if last_announcement_viewed:
-        announcement_dont_viewed = announcement_dont_viewed.filter(datetime__gt=last_announcement_viewed.datetime)
-    return {'profile': profile,
-            'announcements_dont_viewed': announcement_dont_viewed.count()}
+
+    # Both are callables, so the templates only query them if they show them
+    counter = []
+
+    def announcements_dont_viewed():
+        if not counter:
+            from moocng.courses.cache import get_announcements_dont_viewed
+            counter.append(get_announcements_dont_viewed(user))
+        return counter[0]
+
+    return {'profile': user.get_profile,
+            'announcements_dont_viewed': announcements_dont_viewed}
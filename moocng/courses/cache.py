@@ -13,6 +13,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import uuid
+
 from django.conf import settings
 from django.core.cache import cache
 from django.utils.hashcompat import md5_constructor
@@ -34,3 +36,113 @@ def invalidate_template_fragment_i18n(fragment, *variables):
     for lang_code, lang_text in settings.LANGUAGES:
         i18n_variables = (lang_code,) + variables
         invalidate_template_fragment(fragment, *i18n_variables)
+
+
+# The authentication of the API checks on every request if the user is a
+# teacher, the teacher course ids are cached for a short time and
+# invalidated when a CourseTeacher changes
+TEACHER_COURSES_TIMEOUT = getattr(settings, 'TEACHER_COURSES_CACHE_TIMEOUT', 300)
+
+
+def get_teacher_courses_key(user_id):
+    return 'user_%s_teacher_courses' % user_id
+
+
+def get_teacher_course_ids(user):
+    """
+    Return the ids of the courses the user teaches
+
+    .. versionadded:: 0.1
+    """
+    from moocng.courses.models import CourseTeacher
+    if not user.is_authenticated():
+        return []
+    key = get_teacher_courses_key(user.id)
+    course_ids = cache.get(key)
+    if course_ids is None:
+        course_ids = list(CourseTeacher.objects.filter(
+            teacher=user).values_list('course_id', flat=True))
+        cache.set(key, course_ids, TEACHER_COURSES_TIMEOUT)
+    return course_ids
+
+
+def invalidate_teacher_course_ids(user_id):
+    cache.delete(get_teacher_courses_key(user_id))
+
+
+# What a user can do in a course (enrolled, teacher and the units of the
+# course) is read on every course page. The key contains the version of the
+# course structure, so saving a unit or the course invalidates it, and it is
+# deleted when the user enrolls, unenrolls or becomes a teacher of the course
+COURSE_ACCESS_TIMEOUT = getattr(settings, 'COURSE_ACCESS_CACHE_TIMEOUT', 3600)
+
+
+def get_course_access_key(course_id, user_id, version):
+    return 'course_%d_user_%d_access_%s' % (course_id, user_id, version)
+
+
+def invalidate_course_access(course_id, user_id):
+    from moocng.courses.structure import get_course_structure_version
+    version = get_course_structure_version(course_id)
+    if version is not None:
+        cache.delete(get_course_access_key(course_id, user_id, version))
+
+
+# The number of portal announcements a user hasn't viewed is shown on every
+# page. It is cached for the version of the portal announcements, which
+# changes when an announcement is saved or deleted, and deleted when the
+# profile of the user (the last announcement viewed) is saved
+ANNOUNCEMENTS_DONT_VIEWED_TIMEOUT = getattr(
+    settings, 'ANNOUNCEMENTS_DONT_VIEWED_CACHE_TIMEOUT', 3600 * 24)
+
+PORTAL_ANNOUNCEMENTS_VERSION_KEY = 'portal_announcements_version'
+
+
+def get_portal_announcements_version():
+    version = cache.get(PORTAL_ANNOUNCEMENTS_VERSION_KEY)
+    if version is None:
+        cache.add(PORTAL_ANNOUNCEMENTS_VERSION_KEY, uuid.uuid4().hex,
+                  ANNOUNCEMENTS_DONT_VIEWED_TIMEOUT)
+        version = cache.get(PORTAL_ANNOUNCEMENTS_VERSION_KEY)
+    return version
+
+
+def invalidate_portal_announcements():
+    cache.set(PORTAL_ANNOUNCEMENTS_VERSION_KEY, uuid.uuid4().hex,
+              ANNOUNCEMENTS_DONT_VIEWED_TIMEOUT)
+
+
+def get_announcements_dont_viewed_key(user_id, version):
+    return 'user_%d_announcements_dont_viewed_%s' % (user_id, version)
+
+
+def get_announcements_dont_viewed(user):
+    """
+    Return the number of portal announcements newer than the last one the
+    user viewed
+
+    .. versionadded:: 0.1
+    """
+    from moocng.courses.models import Announcement
+    version = get_portal_announcements_version()
+    key = get_announcements_dont_viewed_key(user.id, version)
+    count = None
+    if version is not None:
+        count = cache.get(key)
+    if count is None:
+        announcements = Announcement.objects.portal()
+        last_announcement_viewed = getattr(user.get_profile(),
+                                           'last_announcement', None)
+        if last_announcement_viewed:
+            announcements = announcements.filter(
+                datetime__gt=last_announcement_viewed.datetime)
+        count = announcements.count()
+        if version is not None:
+            cache.set(key, count, ANNOUNCEMENTS_DONT_VIEWED_TIMEOUT)
+    return count
+
+
+def invalidate_announcements_dont_viewed(user_id):
+    version = get_portal_announcements_version()
+    if version is not None:
+        cache.delete(get_announcements_dont_viewed_key(user_id, version))
@@ -23,7 +23,7 @@ from zipfile import ZipFile, ZipInfo
 from django.core.management.base import BaseCommand, CommandError
 
 from moocng.courses.models import Course, Unit, KnowledgeQuantum, Question
-from moocng.mongodb import get_db
+from moocng.mongodb import get_reporting_db
 
 
 class Command(BaseCommand):
@@ -87,7 +87,7 @@ class Command(BaseCommand):
                       "kq_answered", "kq_submited", "kq_reviewed", "kq_passed"]
         course_csv.writerow(kq_headers)
 
-        db = get_db()
+        db = get_reporting_db()
         answers = db.get_collection('answers')
         activities = db.get_collection('activity')
         peer_review_submissions = db.get_collection('peer_review_submissions')
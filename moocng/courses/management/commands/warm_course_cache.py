@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+# Copyright 2013 UNED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from optparse import make_option
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.core.urlresolvers import reverse
+from django.test.client import Client
+
+from moocng.courses.cache import invalidate_template_fragment_i18n
+from moocng.courses.models import Course
+from moocng.courses.security import get_courses_available_for_user
+from moocng.courses.structure import get_course_structure
+
+
+class Command(BaseCommand):
+    args = '<course_id course_id ...>'
+    help = ('Render the course list and the overview of the courses, every '
+            'available course by default, in every language so their cached '
+            'fragments are ready after a deploy')
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--invalidate',
+            action='store_true',
+            dest='invalidate',
+            default=False,
+            help='Invalidate the cached fragments before rendering them again.'
+        ),
+    )
+
+    def handle(self, *args, **options):
+        if args:
+            courses = []
+            for course_id in args:
+                try:
+                    courses.append(Course.objects.get(id=int(course_id)))
+                except (ValueError, Course.DoesNotExist):
+                    raise CommandError('Course %s does not exist' % course_id)
+        else:
+            courses = list(get_courses_available_for_user(AnonymousUser()))
+
+        if options['invalidate']:
+            invalidate_template_fragment_i18n('course_list')
+            for course in courses:
+                invalidate_template_fragment_i18n('course_overview_main_info', course.id)
+                invalidate_template_fragment_i18n('course_overview_secondary_info', course.id)
+
+        for course in courses:
+            get_course_structure(course.id)
+
+        # The fragments are cached for the anonymous users, the pages are
+        # requested as one of them
+        for lang_code, lang_text in settings.LANGUAGES:
+            client = Client()
+            client.cookies[settings.LANGUAGE_COOKIE_NAME] = lang_code
+            self._render(client, lang_code, reverse('home'))
+            for course in courses:
+                self._render(client, lang_code,
+                             reverse('course_overview', args=[course.slug]))
+
+    def _render(self, client, lang_code, url):
+        response = client.get(url, HTTP_ACCEPT_LANGUAGE=lang_code)
+        if response.status_code == 200:
+            self.stdout.write('Rendered %s (%s)\n' % (url, lang_code))
+        else:
+            self.stderr.write('Could not render %s (%s): status %d\n' % (
+                url, lang_code, response.status_code))
@@ -13,10 +13,19 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import uuid
+
+from django.core.cache import cache
 from django.db.models import Sum
 
+from moocng.courses.structure import get_course_structure
 from moocng.mongodb import get_db
 
+# The course marks of a user are cached, and the transcript of the user is
+# cached with a version of the marks, until one of them changes, see
+# invalidate_user_marks
+USER_COURSE_MARKS_TIMEOUT = 3600 * 24
+
 
 def calculate_question_mark(kq, question, user):
 
@@ -98,8 +107,7 @@ def calculate_kq_mark(kq, user):
 def normalize_kq_weight(kq, unit_kq_counter=None, total_weight_unnormalized=None):
     # KnowledgeQuantumResource does not send unit_kq_counter  [tastypie api]
     if unit_kq_counter is None:
-        unit = kq.unit
-        total_weight_unnormalized, unit_kq_counter, uni_kqs = get_unit_intermediate_calculations(unit)
+        return get_course_structure(kq.unit.course_id).kq_normalized_weight(kq.id)
     if total_weight_unnormalized == 0:
         if unit_kq_counter == 0:
             return 0
@@ -117,8 +125,7 @@ def calculate_unit_mark(unit, user, normalized_unit_weight=None):
     .. versionadded:: 0.1
     """
     if normalized_unit_weight is None:
-        total_weight_unnormalized, unit_course_counter, course_units = get_course_intermediate_calculations(unit.course)
-        normalized_unit_weight = normalize_unit_weight(unit, unit_course_counter, total_weight_unnormalized)
+        normalized_unit_weight = get_course_structure(unit.course_id).unit_normalized_weight(unit.id)
     unit_mark = 0
     kqs = get_kq_info_from_course(unit, user)
     for kq in kqs:
@@ -182,3 +189,99 @@ def get_course_mark(course, user, db=None):
     else:
         total_mark = 0
     return (total_mark, get_units_info_from_course(course, user, db=db))
+
+
+def get_user_course_marks_key(user_id, version):
+    return 'user_%s_course_marks_%s' % (user_id, version)
+
+
+def get_user_marks_version_key(user_id):
+    return 'user_%s_marks_version' % user_id
+
+
+def get_user_marks_version(user_id):
+    """
+    Version of the unit and course marks of a user. It is None if the cache
+    can't keep the versions.
+    """
+    key = get_user_marks_version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, USER_COURSE_MARKS_TIMEOUT)
+        version = cache.get(key)
+    return version
+
+
+def get_users_marks_versions(user_ids):
+    """
+    Like get_user_marks_version for some users, as a dict of
+    {user_id: version} without the users whose version can't be kept.
+    """
+    keys = dict([(get_user_marks_version_key(user_id), user_id)
+                 for user_id in user_ids])
+    versions = dict([(keys[key], version)
+                     for key, version in cache.get_many(keys.keys()).items()])
+    missing = [key for key, user_id in keys.items() if user_id not in versions]
+    if missing:
+        for key in missing:
+            cache.add(key, uuid.uuid4().hex, USER_COURSE_MARKS_TIMEOUT)
+        for key, version in cache.get_many(missing).items():
+            versions[keys[key]] = version
+    return versions
+
+
+def invalidate_user_marks(user_id):
+    cache.set(get_user_marks_version_key(user_id), uuid.uuid4().hex,
+              USER_COURSE_MARKS_TIMEOUT)
+
+
+def get_users_course_marks(user_ids, db=None):
+    """
+    Return the stored course marks of some users as a dict of
+    {user_id: {course_id: mark}}. The users that aren't in the cache are
+    read from marks_course with a single query.
+
+    The cached marks are kept for the marks version read before them, so the
+    marks a worker changes while they are read are stored under a version
+    that isn't current anymore.
+
+    .. versionadded:: 0.1
+    """
+    versions = get_users_marks_versions(user_ids)
+    keys = dict([(get_user_course_marks_key(user_id, version), user_id)
+                 for user_id, version in versions.items()])
+    marks = dict([(keys[key], value)
+                  for key, value in cache.get_many(keys.keys()).items()])
+    missing = [user_id for user_id in user_ids if user_id not in marks]
+    if missing:
+        for user_id in missing:
+            marks[user_id] = {}
+        db = db or get_db()
+        marks_course = db.get_collection('marks_course')
+        for item in marks_course.find({'user_id': {'$in': missing}},
+                                      fields=['user_id', 'course_id', 'mark']):
+            marks[item['user_id']][item['course_id']] = item['mark']
+        cache.set_many(dict([(get_user_course_marks_key(user_id, versions[user_id]),
+                              marks[user_id])
+                             for user_id in missing if user_id in versions]),
+                       USER_COURSE_MARKS_TIMEOUT)
+    return marks
+
+
+def get_passed_courses(enrollments, db=None):
+    """
+    Return the courses passed by some users as a dict of
+    {user_id: [course, ...]}. enrollments is a list of (user_id, course)
+    pairs, the courses without threshold are never passed.
+
+    .. versionadded:: 0.1
+    """
+    marks = get_users_course_marks(set([user_id for user_id, course in enrollments]),
+                                   db=db)
+    passed_courses = dict([(user_id, []) for user_id in marks.keys()])
+    for user_id, course in enrollments:
+        if course.threshold is None:
+            continue
+        if float(course.threshold) <= marks[user_id].get(course.pk, 0):
+            passed_courses[user_id].append(course)
+    return passed_courses
@@ -37,13 +37,17 @@ from adminsortable.fields import SortableForeignKey
 from tinymce.models import HTMLField
 
 from moocng.badges.models import Badge
-from moocng.courses.cache import invalidate_template_fragment_i18n
+from moocng.courses.cache import (invalidate_course_access,
+                                  invalidate_portal_announcements,
+                                  invalidate_template_fragment_i18n,
+                                  invalidate_teacher_course_ids)
 from moocng.courses.managers import (CourseManager, UnitManager,
                                      KnowledgeQuantumManager, QuestionManager,
                                      OptionManager, AttachmentManager,
                                      AnnouncementManager)
+from moocng.courses.structure import invalidate_course_structure
 from moocng.enrollment import enrollment_methods
-from moocng.mongodb import get_db
+from moocng.mongodb import exists, get_db
 from moocng.videos.tasks import process_video_task
 from moocng.media_contents import get_media_content_types_choices, media_content_extract_id
 
@@ -258,6 +262,7 @@ class Course(Sortable):
 
 
 def course_invalidate_cache(sender, instance, **kwargs):
+    invalidate_course_structure(instance.id)
     invalidate_template_fragment_i18n('course_list')
     invalidate_template_fragment_i18n('course_overview_main_info', instance.id)
     invalidate_template_fragment_i18n('course_overview_secondary_info', instance.id)
@@ -313,6 +318,8 @@ class CourseTeacher(Sortable):
 
 
 def courseteacher_invalidate_cache(sender, instance, **kwargs):
+    invalidate_teacher_course_ids(instance.teacher_id)
+    invalidate_course_access(instance.course_id, instance.teacher_id)
     try:
         invalidate_template_fragment_i18n('course_overview_secondary_info',
                                           instance.course.id)
@@ -348,6 +355,14 @@ class CourseStudent(models.Model):
         return self.course.can_clone_activity() and self.old_course_status == 'n'
 
 
+def coursestudent_invalidate_cache(sender, instance, **kwargs):
+    invalidate_course_access(instance.course_id, instance.student_id)
+
+signals.post_save.connect(coursestudent_invalidate_cache, sender=CourseStudent)
+signals.post_delete.connect(coursestudent_invalidate_cache,
+                            sender=CourseStudent)
+
+
 class Announcement(models.Model):
 
     title = models.CharField(verbose_name=_(u'Title'), max_length=200)
@@ -379,6 +394,8 @@ class Announcement(models.Model):
 
 
 def announcement_invalidate_cache(sender, instance, **kwargs):
+    # The announcement could have been moved from or to the portal
+    invalidate_portal_announcements()
     try:
         if instance.course:  # else: globals announcements
             invalidate_template_fragment_i18n('course_overview_secondary_info',
@@ -453,6 +470,7 @@ class Unit(Sortable):
 
 
 def unit_invalidate_cache(sender, instance, **kwargs):
+    invalidate_course_structure(instance.course_id)
     try:
         invalidate_template_fragment_i18n('course_overview_secondary_info',
                                           instance.course.id)
@@ -513,18 +531,24 @@ class KnowledgeQuantum(Sortable):
         verbose_name_plural = _(u'nuggets')
         unique_together = ('title', 'unit')
 
-    def is_completed(self, user):
-        if not self.kq_visited_by(user):
+    def is_completed(self, user, prefetch=None):
+        if not self.kq_visited_by(user, prefetch):
             return False
 
-        questions = self.question_set.filter()
+        # all() so the prefetched questions are used
+        questions = self.question_set.all()
         if len(questions):
-            return questions[0].is_completed(user, visited=True)
+            return questions[0].is_completed(user, visited=True,
+                                             prefetch=prefetch)
 
         try:
-            return self.peerreviewassignment.is_completed(user, visited=True)
+            peer_review_assignment = self.peerreviewassignment
         except ObjectDoesNotExist:
-            pass
+            peer_review_assignment = None
+        # select_related caches the missing assignment as None
+        if peer_review_assignment is not None:
+            return peer_review_assignment.is_completed(user, visited=True,
+                                                       prefetch=prefetch)
 
         return True
 
@@ -540,18 +564,19 @@ class KnowledgeQuantum(Sortable):
                 pass
         return "Video"
 
-    def kq_visited_by(self, user):
+    def kq_visited_by(self, user, prefetch=None):
+        if prefetch is not None:
+            return prefetch.kq_visited(self.id)
+
         db = get_db()
 
         activity = db.get_collection("activity")
         # Verify if user has watch the video from kq
-        user_activity_exists = activity.find({
+        return exists(activity, {
             "user_id": user.id,
             "kq_id": self.id,
         })
 
-        return user_activity_exists.count() > 0
-
     def natural_key(self):
         return self.unit.natural_key() + (self.title, )
 
@@ -598,8 +623,18 @@ def kq_stats(sender, instance, created, **kwargs):
         )
 
 
+def kq_invalidate_cache(sender, instance, **kwargs):
+    try:
+        invalidate_course_structure(instance.unit.course_id)
+    except Unit.DoesNotExist:
+        # The unit is being deleted, it invalidates the course structure
+        pass
+
+
 signals.post_save.connect(handle_kq_post_save, sender=KnowledgeQuantum)
 signals.post_save.connect(kq_stats, sender=KnowledgeQuantum)
+signals.post_save.connect(kq_invalidate_cache, sender=KnowledgeQuantum)
+signals.post_delete.connect(kq_invalidate_cache, sender=KnowledgeQuantum)
 
 
 class Attachment(models.Model):
@@ -684,15 +719,18 @@ class Question(models.Model):
 
         return correct
 
-    def is_completed(self, user, visited=None):
+    def is_completed(self, user, visited=None, prefetch=None):
         db = get_db()
 
         if visited is None:
-            visited = self.kq.kq_visited_by(user)
+            visited = self.kq.kq_visited_by(user, prefetch)
             if not visited:
                 return False
 
         # Verify if user has answered the question
+        if prefetch is not None:
+            return prefetch.get_answer(self.id) is not None
+
         answers = db.get_collection("answers")
         answer_exists = answers.find_one({
             "user_id": user.id,
@@ -707,7 +745,17 @@ def handle_question_post_save(sender, instance, created, **kwargs):
         process_video_task.delay(instance.id)
 
 
+def question_invalidate_cache(sender, instance, **kwargs):
+    try:
+        invalidate_course_structure(instance.kq.unit.course_id)
+    except ObjectDoesNotExist:
+        # The nugget is being deleted, it invalidates the course structure
+        pass
+
+
 signals.post_save.connect(handle_question_post_save, sender=Question)
+signals.post_save.connect(question_invalidate_cache, sender=Question)
+signals.post_delete.connect(question_invalidate_cache, sender=Question)
 
 
 class Option(models.Model):
@@ -757,3 +805,17 @@ class Option(models.Model):
                 return reply.lower() == self.solution.lower()
         else:
             return bool(reply) == (self.solution.lower() == u'true')
+
+
+def option_invalidate_cache(sender, instance, **kwargs):
+    # The options are not part of the course structure but its version is
+    # the content version of the course
+    try:
+        invalidate_course_structure(instance.question.kq.unit.course_id)
+    except ObjectDoesNotExist:
+        # The question is being deleted, it invalidates the course structure
+        pass
+
+
+signals.post_save.connect(option_invalidate_cache, sender=Option)
+signals.post_delete.connect(option_invalidate_cache, sender=Option)
@@ -16,6 +16,7 @@
 from datetime import date
 
 from django.contrib import messages
+from django.core.cache import cache
 from django.core.urlresolvers import reverse
 from django.db.models import Q
 from django.http import Http404
@@ -23,10 +24,85 @@ from django.shortcuts import get_object_or_404
 from django.utils.translation import ugettext as _
 
 
-from moocng.courses.models import Course, Unit, CourseTeacher
+from moocng.courses.cache import (COURSE_ACCESS_TIMEOUT, get_course_access_key,
+                                  get_teacher_course_ids)
+from moocng.courses.models import Course, CourseTeacher
+from moocng.courses.structure import get_course_structure_version
 from moocng.http import Http410
 
 
+class CourseAccess(object):
+
+    """
+    Snapshot of the access of a user to a course: if the user is enrolled, a
+    teacher of the course or staff and which units the user can see.
+
+    .. versionadded:: 0.1
+    """
+
+    def __init__(self, user, is_enrolled, is_teacher, units):
+        self.is_enrolled = is_enrolled
+        self.is_teacher = is_teacher
+        self.is_superuser = user.is_superuser
+        self.is_staff = user.is_staff
+        self.is_anonymous = user.is_anonymous()
+        # (id, status) pairs of every unit of the course, in order
+        self.units = units
+
+    def get_unit_ids(self, is_overview=False):
+        if self.is_superuser or self.is_staff:
+            return [unit_id for unit_id, status in self.units]
+        if self.is_anonymous:
+            statuses = is_overview and ('l', 'p') or ()
+        elif self.is_teacher:
+            statuses = ('d', 'l', 'p')
+        else:
+            statuses = is_overview and ('l', 'p') or ('p', )
+        return [unit_id for unit_id, status in self.units
+                if status in statuses]
+
+
+def get_course_access_data(course, user):
+    if user.is_anonymous():
+        user_id = 0
+    else:
+        user_id = user.id
+    version = get_course_structure_version(course.id)
+    key = get_course_access_key(course.id, user_id, version)
+    data = None
+    if version is not None:
+        data = cache.get(key)
+    if data is None:
+        if user_id:
+            is_enrolled = course.students.filter(id=user_id).exists()
+            is_teacher = course.id in get_teacher_course_ids(user)
+        else:
+            is_enrolled = is_teacher = False
+        units = list(course.unit_set.values_list('id', 'status'))
+        data = (is_enrolled, is_teacher, units)
+        if version is not None:
+            cache.set(key, data, COURSE_ACCESS_TIMEOUT)
+    return data
+
+
+def get_course_access(course, user):
+
+    """
+    Return the CourseAccess of the user to the course. It is cached and kept in
+    the user object, so it is only computed once per request.
+
+    .. versionadded:: 0.1
+    """
+    accesses = getattr(user, '_course_accesses', None)
+    if accesses is None:
+        accesses = user._course_accesses = {}
+    access = accesses.get(course.id, None)
+    if access is None:
+        access = CourseAccess(user, *get_course_access_data(course, user))
+        accesses[course.id] = access
+    return access
+
+
 def can_user_view_course(course, user):
 
     """
@@ -48,12 +124,8 @@ def can_user_view_course(course, user):
         return True, 'is_staff'
 
     # check if the user is a teacher of the course
-    if not user.is_anonymous():
-        try:
-            CourseTeacher.objects.get(teacher=user, course=course)
-            return True, 'is_teacher'
-        except CourseTeacher.DoesNotExist:
-            pass
+    if get_course_access(course, user).is_teacher:
+        return True, 'is_teacher'
 
     # at this point you don't have permissions to see a course
     if course.is_public:
@@ -126,21 +198,7 @@ def get_units_available_for_user(course, user, is_overview=False):
 
     .. versionadded:: 0.1
     """
-    if user.is_superuser or user.is_staff:
-        return course.unit_set.all()
-    elif user.is_anonymous():
-        if is_overview:
-            return course.unit_set.filter(Q(status='p') | Q(status='l'))
-        else:
-            return []
-    else:
-        if is_overview:
-            return Unit.objects.filter(
-                Q(status='p', course=course) |
-                Q(status='l', course=course) |
-                Q(status='d', course=course, course__courseteacher__teacher=user, course__courseteacher__course=course)).distinct()
-        else:
-            return Unit.objects.filter(
-                Q(status='p', course=course) |
-                Q(status='l', course=course, course__courseteacher__teacher=user, course__courseteacher__course=course) |
-                Q(status='d', course=course, course__courseteacher__teacher=user, course__courseteacher__course=course)).distinct()
+    unit_ids = get_course_access(course, user).get_unit_ids(is_overview)
+    if not unit_ids:
+        return []
+    return course.unit_set.filter(id__in=unit_ids)
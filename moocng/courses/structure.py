@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+# Copyright 2013 UNED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+# The structure of a course (units, nuggets, weights and types) is kept in the
+# shared cache under a key that contains a version. The version changes every
+# time the structure is invalidated, so every process notices the change with a
+# single cache lookup, and the structure itself is kept in memory too. The
+# version is also the content version of the ETags of the API. Without a shared
+# cache that can keep the versions (e.g. DummyCache) the structure is built
+# every time.
+
+COURSE_STRUCTURE_TIMEOUT = 3600 * 24
+
+_local_structures = {}
+
+
+def get_course_structure_version_key(course_id):
+    return 'course_%d_structure_version' % course_id
+
+
+def get_course_structure_key(course_id, version):
+    return 'course_%d_structure_%s' % (course_id, version)
+
+
+def get_course_structure_version(course_id):
+    key = get_course_structure_version_key(course_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, COURSE_STRUCTURE_TIMEOUT)
+        version = cache.get(key)
+    return version
+
+
+def get_course_structure_versions(course_ids):
+    """
+    Like get_course_structure_version for some courses, as a dict of
+    {course_id: version} without the courses whose version can't be kept.
+    """
+    keys = dict([(get_course_structure_version_key(course_id), course_id)
+                 for course_id in course_ids])
+    versions = dict([(keys[key], version)
+                     for key, version in cache.get_many(keys.keys()).items()])
+    missing = [key for key, course_id in keys.items() if course_id not in versions]
+    if missing:
+        for key in missing:
+            cache.add(key, uuid.uuid4().hex, COURSE_STRUCTURE_TIMEOUT)
+        for key, version in cache.get_many(missing).items():
+            versions[keys[key]] = version
+    return versions
+
+
+def invalidate_course_structure(course_id):
+    _local_structures.pop(course_id, None)
+    cache.set(get_course_structure_version_key(course_id), uuid.uuid4().hex,
+              COURSE_STRUCTURE_TIMEOUT)
+
+
+def normalize_weight(weight, counter, total_weight_unnormalized):
+    # Same rules as moocng.courses.marks.normalize_kq_weight and
+    # moocng.courses.marks.normalize_unit_weight
+    if not total_weight_unnormalized:
+        if counter == 0:
+            return 0
+        else:
+            return 100.0 / counter
+    return (weight * 100.0) / total_weight_unnormalized
+
+
+class CourseStructure(object):
+    """
+    Ids, weights and types of the units and nuggets of a course, with the
+    normalized weights already calculated. It is picklable so it can be
+    stored in the cache.
+
+    .. versionadded:: 0.1
+    """
+
+    # Set when the structure was built again because of a missing id
+    rebuilt = False
+
+    def __init__(self, course_id, version=None):
+        self.course_id = course_id
+        self.version = version
+        self.units = {}
+        self.kqs = {}
+        self.unit_ids = []
+        self.kq_count = 0
+        self.dates = []
+
+    @classmethod
+    def build(cls, course_id, version=None):
+        from moocng.courses.models import Unit, KnowledgeQuantum, Question
+        from moocng.peerreview.models import PeerReviewAssignment
+
+        structure = cls(course_id, version)
+        units = Unit.objects.filter(course__id=course_id).values(
+            'id', 'weight', 'unittype', 'start', 'deadline')
+        kqs = KnowledgeQuantum.objects.filter(unit__course__id=course_id).values(
+            'id', 'unit_id', 'weight')
+        question_kqs = set(Question.objects.filter(
+            kq__unit__course__id=course_id).values_list('kq_id', flat=True))
+        peer_review_kqs = set(PeerReviewAssignment.objects.filter(
+            kq__unit__course__id=course_id).values_list('kq_id', flat=True))
+
+        for unit in units:
+            structure.unit_ids.append(unit['id'])
+            structure.units[unit['id']] = {
+                'weight': unit['weight'],
+                'unittype': unit['unittype'],
+                'kq_ids': [],
+                'normalized_weight': 0,
+            }
+            structure.dates.extend([date for date in (unit['start'], unit['deadline'])
+                                    if date is not None])
+        structure.dates.sort()
+
+        for kq in kqs:
+            if kq['id'] in question_kqs:
+                kq_type = 'Question'
+            elif kq['id'] in peer_review_kqs:
+                kq_type = 'PeerReviewAssignment'
+            else:
+                kq_type = 'Video'
+            structure.units[kq['unit_id']]['kq_ids'].append(kq['id'])
+            structure.kqs[kq['id']] = {
+                'unit_id': kq['unit_id'],
+                'weight': kq['weight'],
+                'type': kq_type,
+                'normalized_weight': 0,
+            }
+        structure.kq_count = len(structure.kqs)
+
+        # See moocng.courses.marks.get_course_intermediate_calculations, the
+        # weights of every unit are added but only the scorable ones are
+        # counted
+        total_units_weight = sum([u['weight'] for u in structure.units.values()])
+        scorable_units = [u for u in structure.units.values()
+                          if settings.COURSES_USING_OLD_TRANSCRIPT or u['unittype'] != 'n']
+        for unit in structure.units.values():
+            unit['normalized_weight'] = normalize_weight(
+                unit['weight'], len(scorable_units), total_units_weight)
+            total_kqs_weight = sum([structure.kqs[kq_id]['weight']
+                                    for kq_id in unit['kq_ids']])
+            for kq_id in unit['kq_ids']:
+                kq = structure.kqs[kq_id]
+                kq['normalized_weight'] = normalize_weight(
+                    kq['weight'], len(unit['kq_ids']), total_kqs_weight)
+        return structure
+
+    def rebuild(self):
+        """
+        Build the structure again, in place, and store it for its version. It
+        is done once, when a unit or nugget isn't found: it could have been
+        created after the structure was built, before the version changed.
+        """
+        structure = CourseStructure.build(self.course_id, self.version)
+        structure.rebuilt = True
+        self.__dict__.update(structure.__dict__)
+        if self.version is not None:
+            cache.set(get_course_structure_key(self.course_id, self.version),
+                      self, COURSE_STRUCTURE_TIMEOUT)
+
+    def get_kq(self, kq_id):
+        if kq_id not in self.kqs and not self.rebuilt:
+            self.rebuild()
+        return self.kqs[kq_id]
+
+    def get_unit(self, unit_id):
+        if unit_id not in self.units and not self.rebuilt:
+            self.rebuild()
+        return self.units[unit_id]
+
+    def kq_normalized_weight(self, kq_id):
+        return self.get_kq(kq_id)['normalized_weight']
+
+    def kq_type(self, kq_id):
+        return self.get_kq(kq_id)['type']
+
+    def unit_normalized_weight(self, unit_id):
+        return self.get_unit(unit_id)['normalized_weight']
+
+    def unit_kq_count(self, unit_id):
+        return len(self.get_unit(unit_id)['kq_ids'])
+
+    def passed_dates(self, now=None):
+        """
+        Number of start dates and deadlines of the units that have been
+        reached, what the API shows depends on them.
+        """
+        now = now or timezone.now()
+        return len([date for date in self.dates if date <= now])
+
+
+def get_course_structure(course_id):
+
+    """
+    Return the CourseStructure of a course, from memory or from the cache if
+    it is still valid, building it otherwise.
+
+    .. versionadded:: 0.1
+    """
+    version = get_course_structure_version(course_id)
+    if version is None:
+        # The invalidations of the other processes can't be noticed
+        _local_structures.pop(course_id, None)
+        return CourseStructure.build(course_id)
+
+    structure = _local_structures.get(course_id, None)
+    if structure is not None and structure.version == version:
+        return structure
+
+    structure = cache.get(get_course_structure_key(course_id, version))
+    if structure is None:
+        structure = CourseStructure.build(course_id, version)
+        cache.set(get_course_structure_key(course_id, version), structure,
+                  COURSE_STRUCTURE_TIMEOUT)
+    _local_structures[course_id] = structure
+    return structure
+
+
+def get_course_content_version(course_id):
+    """
+    Return a version of the content of a course that changes when the course
+    or its units, nuggets, questions or options are saved and when a start
+    date or deadline of its units is reached. It is None if the cache can't
+    keep the versions.
+
+    .. versionadded:: 0.1
+    """
+    version = get_course_structure_version(course_id)
+    if version is None:
+        return None
+    return '%s-%d' % (version, get_course_structure(course_id).passed_dates())
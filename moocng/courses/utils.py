@@ -76,6 +76,83 @@ def get_unit_badge_class(unit):
     return UNIT_BADGE_CLASSES[unit.unittype]
 
 
+def get_transcript_data(user, courses, db=None):
+    """
+    Return the marks, units, badges and certificates of the transcript of
+    a user for the given courses. The marks of all the courses are read with
+    one query for marks_course and another one for marks_unit.
+
+    .. versionadded:: 0.1
+    """
+    from moocng.badges.models import Award
+    from moocng.courses.marks import normalize_unit_weight
+
+    courses = list(courses)
+    course_ids = [course.id for course in courses]
+    db = db or mongodb.get_db()
+    query = {'user_id': user.id, 'course_id': {'$in': course_ids}}
+    course_marks = dict([(mark['course_id'], mark['mark'])
+                         for mark in db.get_collection('marks_course').find(
+                             query, fields=['course_id', 'mark'])])
+    unit_marks = dict([(mark['unit_id'], mark)
+                       for mark in db.get_collection('marks_unit').find(
+                           query, fields=['unit_id', 'mark', 'relative_mark'])])
+
+    course_units = {}
+    for unit in Unit.objects.filter(course__id__in=course_ids):
+        course_units.setdefault(unit.course_id, []).append(unit)
+
+    passed_courses = [course for course in courses
+                      if course.threshold is not None and
+                      float(course.threshold) <= course_marks.get(course.id, 0)]
+    badge_ids = set([course.completion_badge_id for course in passed_courses
+                     if course.completion_badge_id is not None])
+    awards = {}
+    if badge_ids:
+        for award in Award.objects.filter(user=user, badge__id__in=badge_ids).select_related('badge'):
+            awards.setdefault(award.badge_id, award)
+        for badge_id in badge_ids:
+            if badge_id not in awards:
+                awards[badge_id] = Award.objects.create(badge_id=badge_id, user=user)
+
+    use_old_calculus = settings.COURSES_USING_OLD_TRANSCRIPT
+    courses_info = []
+    for course in courses:
+        units = course_units.get(course.id, [])
+        # Same weights as moocng.courses.marks.get_course_intermediate_calculations
+        total_weight_unnormalized = sum([unit.weight for unit in units])
+        scorable_units = [unit for unit in units
+                          if use_old_calculus or unit.unittype != 'n']
+        units_info = []
+        for unit in scorable_units:
+            unit_info = dict(unit_marks.get(unit.id, {'relative_mark': 0, 'mark': 0}))
+            unit_info['unit'] = unit
+            unit_info['normalized_weight'] = normalize_unit_weight(
+                unit, len(scorable_units), total_weight_unnormalized)
+            unit_info['badge_class'] = get_unit_badge_class(unit)
+            units_info.append(unit_info)
+
+        passed = course in passed_courses
+        cert_url = ''
+        award = None
+        if passed:
+            cert_url = settings.CERTIFICATE_URL % {
+                'courseid': course.id,
+                'email': user.email.lower()
+            }
+            award = awards.get(course.completion_badge_id, None)
+        courses_info.append({
+            'course': course,
+            'units_info': units_info,
+            'mark': course_marks.get(course.id, 0),
+            'award': award,
+            'passed': passed,
+            'cert_url': cert_url,
+            'use_old_calculus': use_old_calculus,
+        })
+    return courses_info
+
+
 def is_course_ready(course):
 
     """
@@ -221,7 +298,7 @@ def _clone_activity_user_course(mongo_db, trace_ids, user, copy_course, original
             new_act_doc['unit_id'] = trace_ids['Unit'][ori_unit_id]
         except KeyError:
             continue
-        exists_doc = activity.find(new_act_doc).count() > 0
+        exists_doc = mongodb.exists(activity, new_act_doc)
         if not exists_doc:
             new_act_docs.append(new_act_doc)
     if new_act_docs:
@@ -251,7 +328,7 @@ def _clone_answer_user_course(mongo_db, trace_ids, user, copy_course, original_c
             new_answer_doc['unit_id'] = trace_ids['Unit'][ori_unit_id]
         except KeyError:
             continue
-        exists_doc_without_reply = answers.find_one(new_answer_doc)
+        exists_doc_without_reply = mongodb.find_one_projected(answers, new_answer_doc, ['_id'])
         replyList = answer_doc['replyList']
         if not isinstance(replyList, list):
             continue
@@ -261,7 +338,7 @@ def _clone_answer_user_course(mongo_db, trace_ids, user, copy_course, original_c
             except KeyError:
                 continue
         new_answer_doc['replyList'] = answer_doc['replyList']
-        exists_doc = answers.find_one(new_answer_doc)
+        exists_doc = mongodb.exists(answers, new_answer_doc)
         if not exists_doc_without_reply:
             new_answer_doc['date'] = answer_doc['date']
             insert_answer_docs.append(new_answer_doc)
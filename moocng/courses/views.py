@@ -15,6 +15,8 @@
 
 import re
 
+from datetime import date
+
 from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.models import User
@@ -31,19 +33,24 @@ from django.template import RequestContext
 from django.utils.translation import get_language
 from django.utils.translation import ugettext as _
 
-from moocng.badges.models import Award
 from moocng.courses.models import Course, CourseTeacher, Announcement
-from moocng.courses.utils import (get_unit_badge_class, is_course_ready,
-                                  is_teacher as is_teacher_test,
-                                  send_mail_wrapper)
-from moocng.courses.marks import get_course_mark, get_course_intermediate_calculations, normalize_unit_weight
-from moocng.courses.security import (get_course_if_user_can_view_or_404,
+from moocng.courses.utils import (get_transcript_data, get_unit_badge_class,
+                                  is_course_ready, send_mail_wrapper)
+from moocng.courses.marks import get_user_marks_version
+from moocng.courses.security import (get_course_access,
+                                     get_course_if_user_can_view_or_404,
                                      get_courses_available_for_user,
                                      get_units_available_for_user)
+from moocng.courses.structure import get_course_structure_versions
 from moocng.courses.tasks import clone_activity_user_course_task
 from moocng.slug import unique_slugify
 from moocng.utils import use_cache
 
+# The transcript of a user is cached until the marks of the user or the
+# structure of one of the courses change, the other changes of the courses are
+# shown after this timeout
+TRANSCRIPT_CACHE_TIMEOUT = getattr(settings, 'TRANSCRIPT_CACHE_TIMEOUT', 3600)
+
 
 def home(request):
 
@@ -198,12 +205,9 @@ def course_overview(request, course_slug):
     """
     course = get_course_if_user_can_view_or_404(course_slug, request)
 
-    if request.user.is_authenticated():
-        is_enrolled = course.students.filter(id=request.user.id).exists()
-        is_teacher = is_teacher_test(request.user, course)
-    else:
-        is_enrolled = False
-        is_teacher = False
+    access = get_course_access(course, request.user)
+    is_enrolled = access.is_enrolled
+    is_teacher = access.is_teacher
 
     course_teachers = CourseTeacher.objects.filter(course=course)
     announcements = Announcement.objects.filter(course=course).order_by('datetime').reverse()[:5]
@@ -235,7 +239,8 @@ def course_classroom(request, course_slug):
     .. versionadded:: 0.1
     """
     course = get_course_if_user_can_view_or_404(course_slug, request)
-    is_enrolled = course.students.filter(id=request.user.id).exists()
+    access = get_course_access(course, request.user)
+    is_enrolled = access.is_enrolled
     if not is_enrolled:
         messages.error(request, _('You are not enrolled in this course'))
         return HttpResponseRedirect(reverse('course_overview', args=[course_slug]))
@@ -269,7 +274,7 @@ def course_classroom(request, course_slug):
         'course': course,
         'unit_list': units,
         'is_enrolled': is_enrolled,
-        'is_teacher': is_teacher_test(request.user, course),
+        'is_teacher': access.is_teacher,
         'peer_review': peer_review
     }, context_instance=RequestContext(request))
 
@@ -288,7 +293,8 @@ def course_progress(request, course_slug):
     """
     course = get_course_if_user_can_view_or_404(course_slug, request)
 
-    is_enrolled = course.students.filter(id=request.user.id).exists()
+    access = get_course_access(course, request.user)
+    is_enrolled = access.is_enrolled
     if not is_enrolled:
         messages.error(request, _('You are not enrolled in this course'))
         return HttpResponseRedirect(reverse('course_overview', args=[course_slug]))
@@ -317,19 +323,20 @@ def course_progress(request, course_slug):
         'course': course,
         'unit_list': units,
         'is_enrolled': is_enrolled,  # required due course nav templatetag
-        'is_teacher': is_teacher_test(request.user, course),
+        'is_teacher': access.is_teacher,
     }, context_instance=RequestContext(request))
 
 
 @login_required
 def course_extra_info(request, course_slug):
     course = get_course_if_user_can_view_or_404(course_slug, request)
-    is_enrolled = course.students.filter(id=request.user.id).exists()
+    access = get_course_access(course, request.user)
+    is_enrolled = access.is_enrolled
 
     return render_to_response('courses/static_page.html', {
         'course': course,
         'is_enrolled': is_enrolled,  # required due course nav templatetag
-        'is_teacher': is_teacher_test(request.user, course),
+        'is_teacher': access.is_teacher,
         'static_page': course.static_page,
     }, context_instance=RequestContext(request))
 
@@ -363,52 +370,20 @@ def transcript(request, course_slug=None):
         template_name = 'courses/transcript_course.html'
         course_transcript = get_object_or_404(Course, slug=course_slug)
         course_list = course_list.filter(slug=course_slug)
-    courses_info = []
-    use_old_calculus = settings.COURSES_USING_OLD_TRANSCRIPT
-    for course in course_list:
-        cert_url = ''
-        total_mark, units_info = get_course_mark(course, user)
-        award = None
-        passed = False
-        if course.threshold is not None and float(course.threshold) <= total_mark:
-            passed = True
-            cert_url = settings.CERTIFICATE_URL % {
-                'courseid': course.id,
-                'email': user.email.lower()
-            }
-            badge = course.completion_badge
-            if badge is not None:
-                try:
-                    award = Award.objects.get(badge=badge, user=user)
-                except Award.DoesNotExist:
-                    award = Award(badge=badge, user=user)
-                    award.save()
-        total_weight_unnormalized, unit_course_counter, course_units = get_course_intermediate_calculations(course)
-
-        units_info_ordered = []
-        for unit in course_units:
-            uinfo = next((u for u in units_info if u['unit_id'] == unit.pk),
-                         {'relative_mark': 0, 'mark': 0})
-            uinfo['unit'] = unit
-            normalized_unit_weight = normalize_unit_weight(unit,
-                                                           unit_course_counter,
-                                                           total_weight_unnormalized)
-            uinfo['normalized_weight'] = normalized_unit_weight
-            unit_class = get_unit_badge_class(unit)
-            uinfo['badge_class'] = unit_class
-            units_info_ordered.append(uinfo)
-        courses_info.append({
-            'course': course,
-            'units_info': units_info_ordered,
-            'mark': total_mark,
-            'award': award,
-            'passed': passed,
-            'cert_url': cert_url,
-            'use_old_calculus': use_old_calculus,
-        })
+    course_ids = list(course_list.values_list('id', flat=True))
+    # The transcript depends on the weights and units of the courses too
+    structure_versions = get_course_structure_versions(course_ids)
     return render_to_response(template_name, {
-        'courses_info': courses_info,
+        # Only calculated if the transcript is not in the cache
+        'courses_info': lambda: get_transcript_data(user, course_list),
         'course_transcript': course_transcript,
+        'course_slug': course_slug,
+        'course_ids': ','.join([str(course_id) for course_id in course_ids]),
+        'structure_versions': ','.join([structure_versions.get(course_id, '')
+                                        for course_id in course_ids]),
+        'marks_version': get_user_marks_version(user.id),
+        'today': date.today().isoformat(),
+        'transcript_cache_timeout': TRANSCRIPT_CACHE_TIMEOUT,
     }, context_instance=RequestContext(request))
 
 
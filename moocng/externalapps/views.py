@@ -7,6 +7,7 @@ from django.shortcuts import get_object_or_404, render_to_response
 from django.template import RequestContext
 from django.utils.translation import ugettext as _
 
+from moocng.courses.security import get_course_access
 from moocng.externalapps.forms import ExternalAppForm
 from moocng.externalapps.models import ExternalApp
 from moocng.teacheradmin.decorators import is_teacher_or_staff
@@ -16,7 +17,7 @@ from moocng.teacheradmin.models import Course
 @is_teacher_or_staff
 def externalapps_list(request, course_slug):
     course = get_object_or_404(Course, slug=course_slug)
-    is_enrolled = course.students.filter(id=request.user.id).exists()
+    is_enrolled = get_course_access(course, request.user).is_enrolled
     external_apps = ExternalApp.objects.filter(course=course)
 
     return render_to_response('externalapps_list.html', {
@@ -36,7 +37,7 @@ def externalapps_add_or_edit(request, course_slug, external_app_id=None):
         external_app = get_object_or_404(ExternalApp, pk=external_app_id)
         course = external_app.course
 
-    is_enrolled = course.students.filter(id=request.user.id).exists()
+    is_enrolled = get_course_access(course, request.user).is_enrolled
 
     if request.method == 'POST':
         form = ExternalAppForm(request.POST, instance=external_app)
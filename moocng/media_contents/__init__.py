@@ -1,6 +1,10 @@
 import json
 
 from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import get_language
+
+from moocng.courses.structure import get_course_structure_version
 
 from . import handlers
 
@@ -35,28 +39,72 @@ def media_content_extract_id(handler, url, **kwargs):
     return handler.extract_id(url, **kwargs)
 
 
-def media_contents_javascripts(**kwargs):
-    course = kwargs.get('course', None)
-    handlers_ids = []
+# The javascripts of a course are kept in the cache and in memory for the
+# version of the course structure, every change of its nuggets or questions
+# changes it
+MEDIA_CONTENTS_JAVASCRIPTS_TIMEOUT = 3600 * 24
+
+_local_javascripts = {}
+_media_content_types_script = None
+
+
+def get_media_contents_javascripts_key(course_id, version, language):
+    return 'course_%d_media_contents_javascripts_%s_%s' % (course_id, version,
+                                                           language)
+
 
-    if course:
-        if course.promotion_media_content_type:
-            handlers_ids.append(course.promotion_media_content_type)
+def get_media_content_types_script():
+    # settings.MEDIA_CONTENT_TYPES doesn't change while the process runs
+    global _media_content_types_script
+    if _media_content_types_script is None:
+        _media_content_types_script = "<script>MEDIA_CONTENT_TYPES = %s;</script>" % json.dumps(dict([(item['id'], item) for item in settings.MEDIA_CONTENT_TYPES]))
+    return _media_content_types_script
 
-        for unit in course.unit_set.all():
-            for kq in unit.knowledgequantum_set.all():
-                handlers_ids.append(kq.media_content_type)
-                for question in kq.question_set.all():
-                    handlers_ids.append(question.solution_media_content_type)
-        handlers_ids = list(set(handlers_ids))
 
-    html = "<script>MEDIA_CONTENT_TYPES = %s;</script>" % json.dumps(dict([(item['id'], item) for item in settings.MEDIA_CONTENT_TYPES]))
+def get_course_media_content_types(course):
+    from moocng.courses.models import KnowledgeQuantum, Question
+    handlers_ids = set(KnowledgeQuantum.objects.filter(
+        unit__course=course).values_list('media_content_type', flat=True))
+    handlers_ids.update(Question.objects.filter(
+        kq__unit__course=course).values_list('solution_media_content_type',
+                                             flat=True))
+    if course.promotion_media_content_type:
+        handlers_ids.add(course.promotion_media_content_type)
+    return sorted([handler_id for handler_id in handlers_ids if handler_id])
+
+
+def render_media_contents_javascripts(handlers_ids, **kwargs):
+    html = get_media_content_types_script()
     for handler_id in handlers_ids:
         handler = handlers.get_handler(handler_id)
         html += handler.get_javascript_code(**kwargs)
     return html
 
 
+def media_contents_javascripts(**kwargs):
+    course = kwargs.get('course', None)
+    if not course:
+        return render_media_contents_javascripts([], **kwargs)
+
+    version = get_course_structure_version(course.id)
+    if version is None or len(kwargs) > 1:
+        return render_media_contents_javascripts(
+            get_course_media_content_types(course), **kwargs)
+
+    language = get_language()
+    local_key = (course.id, language)
+    local_version, html = _local_javascripts.get(local_key, (None, None))
+    if local_version != version:
+        key = get_media_contents_javascripts_key(course.id, version, language)
+        html = cache.get(key)
+        if html is None:
+            html = render_media_contents_javascripts(
+                get_course_media_content_types(course), **kwargs)
+            cache.set(key, html, MEDIA_CONTENTS_JAVASCRIPTS_TIMEOUT)
+        _local_javascripts[local_key] = (version, html)
+    return html
+
+
 def get_media_content_types_choices():
     choices = []
     for handler_dict in settings.MEDIA_CONTENT_TYPES:
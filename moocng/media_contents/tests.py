@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+# Copyright 2013 UNED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models import signals
+from django.test import TestCase
+from django.utils.translation import get_language
+
+from moocng.courses import structure
+from moocng.courses.models import (Course, KnowledgeQuantum, Question, Unit,
+                                   handle_question_post_save)
+from moocng import media_contents
+from moocng.media_contents import (get_course_media_content_types,
+                                   media_contents_javascripts,
+                                   render_media_contents_javascripts)
+
+
+class MediaContentsJavascriptsTestCase(TestCase):
+
+    def setUp(self):
+        # Don't send the videos of the questions to celery
+        signals.post_save.disconnect(handle_question_post_save, sender=Question)
+        cache.clear()
+        owner = User.objects.create_user('owner', 'owner@example.com', 'owner123456')
+        self.course = Course.objects.create(name='test_course',
+                                            slug='test_course',
+                                            description='test_description',
+                                            owner=owner)
+        unit = Unit.objects.create(title='test_unit', course=self.course,
+                                   unittype='n')
+        kq = KnowledgeQuantum.objects.create(title='test_kq', unit=unit,
+                                             weight=1,
+                                             media_content_type='youtube')
+        self.question = Question.objects.create(
+            kq=kq, solution_media_content_type='vimeo')
+
+    def tearDown(self):
+        signals.post_save.connect(handle_question_post_save, sender=Question)
+
+    def test_question_deleted(self):
+        self.assertEqual(get_course_media_content_types(self.course),
+                         ['vimeo', 'youtube'])
+
+        # The memoized javascripts depend on the course structure version
+        structure._local_structures[self.course.id] = None
+        self.question.delete()
+        self.assertFalse(self.course.id in structure._local_structures)
+        self.assertEqual(get_course_media_content_types(self.course),
+                         ['youtube'])
+
+    def test_javascripts_reused_and_invalidated(self):
+        html = media_contents_javascripts(course=self.course)
+        self.assertEqual(html, render_media_contents_javascripts(
+            ['vimeo', 'youtube'], course=self.course))
+
+        # The memoized block is returned while the course doesn't change
+        local_key = (self.course.id, get_language())
+        version, local_html = media_contents._local_javascripts[local_key]
+        media_contents._local_javascripts[local_key] = (version, 'memoized')
+        self.assertEqual(media_contents_javascripts(course=self.course),
+                         'memoized')
+
+        self.question.delete()
+        self.assertEqual(media_contents_javascripts(course=self.course),
+                         render_media_contents_javascripts(
+                             ['youtube'], course=self.course))
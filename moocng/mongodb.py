@@ -13,12 +13,18 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import urlparse
+import logging
+import os
 
 from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import request_started
 
-from pymongo.connection import Connection
+from celery import signals as celery_signals
+
+from pymongo import ASCENDING, MongoClient, MongoReplicaSetClient, uri_parser
+from pymongo.errors import OperationFailure
+from pymongo.read_preferences import ReadPreference
 
 DEFAULT_MONGODB_HOST = 'localhost'
 DEFAULT_MONGODB_PORT = 27017
@@ -26,52 +32,288 @@ DEFAULT_MONGODB_NAME = 'moocng'
 DEFAULT_MONGODB_URI = 'mongodb://%s:%d/%s' % (DEFAULT_MONGODB_HOST,
                                               DEFAULT_MONGODB_PORT,
                                               DEFAULT_MONGODB_NAME)
+DEFAULT_MONGODB_MAX_POOL_SIZE = 10
+DEFAULT_MONGODB_REPORTING_READ_PREFERENCE = 'secondaryPreferred'
+
+logger = logging.getLogger(__name__)
+
+READ_PREFERENCES = {
+    'primary': ReadPreference.PRIMARY,
+    'primaryPreferred': ReadPreference.PRIMARY_PREFERRED,
+    'secondary': ReadPreference.SECONDARY,
+    'secondaryPreferred': ReadPreference.SECONDARY_PREFERRED,
+    'nearest': ReadPreference.NEAREST,
+}
+
+
+def get_connection_options():
+    options = {
+        'max_pool_size': getattr(settings, 'MONGODB_MAX_POOL_SIZE',
+                                 DEFAULT_MONGODB_MAX_POOL_SIZE),
+    }
+    for setting, option in (('MONGODB_SOCKET_TIMEOUT_MS', 'socketTimeoutMS'),
+                            ('MONGODB_CONNECT_TIMEOUT_MS', 'connectTimeoutMS')):
+        value = getattr(settings, setting, None)
+        if value is not None:
+            options[option] = value
+    return options
 
 
 class MongoDB(object):
 
-    def __init__(self, db_uri=DEFAULT_MONGODB_URI,
-                 connection_factory=Connection):
-        self.db_uri = urlparse.urlparse(db_uri)
-        self.connection = connection_factory(
-            host=self.db_uri.hostname or DEFAULT_MONGODB_HOST,
-            port=self.db_uri.port or DEFAULT_MONGODB_PORT,
-            tz_aware=True)
+    def __init__(self, db_uri=DEFAULT_MONGODB_URI, connection_factory=None,
+                 read_preference=None, connection=None):
+        self.db_uri = db_uri
+        try:
+            parsed_uri = uri_parser.parse_uri(db_uri)
+        except Exception, e:
+            raise ImproperlyConfigured('Invalid MONGODB_URI setting: %s' % e)
+        self.database_name = parsed_uri['database'] or DEFAULT_MONGODB_NAME
+        self.replica_set = any([option.lower() == 'replicaset'
+                                for option in parsed_uri['options']])
+
+        if read_preference is not None and read_preference not in READ_PREFERENCES:
+            raise ImproperlyConfigured('Unknown MongoDB read preference: %s'
+                                       % read_preference)
+        self.read_preference = read_preference
 
-        if self.db_uri.path:
-            self.database_name = self.db_uri.path[1:]
-        else:
-            self.database_name = DEFAULT_MONGODB_NAME
+        if connection is None:
+            if connection_factory is None:
+                if self.replica_set:
+                    connection_factory = MongoReplicaSetClient
+                else:
+                    connection_factory = MongoClient
+            # The client authenticates with the credentials of the uri
+            connection = connection_factory(db_uri, tz_aware=True,
+                                            **get_connection_options())
+        self.connection = connection
 
         self.database = self.get_database()
+        self.collections = {}
 
     def get_connection(self):
         return self.connection
 
     def get_database(self):
         database = self.connection[self.database_name]
-        if self.db_uri.username and self.db_uri.password:
-            database.authenticate(self.db_uri.username, self.db_uri.password)
+        if self.read_preference is not None:
+            database.read_preference = READ_PREFERENCES[self.read_preference]
 
         return database
 
     def get_collection(self, collection):
-        return self.database[collection]
+        # The handles are cached, building them is not free in the hot paths
+        try:
+            return self.collections[collection]
+        except KeyError:
+            handle = self.database[collection]
+            self.collections[collection] = handle
+            return handle
+
+    def with_read_preference(self, read_preference):
+        """
+        Return a MongoDB that shares the connection pool of this one but
+        reads with another read preference.
+        """
+        return MongoDB(self.db_uri, read_preference=read_preference,
+                       connection=self.connection)
 
 
 # this is not a thread local because we want
 # the server workers to reuse as many connections as possible
 _mongodb_connection = None
+_mongodb_pid = None
+_mongodb_read_preferences = {}
 
 
-def get_db(force_connect=False):
-    global _mongodb_connection
+def get_db(force_connect=False, read_preference=None):
+    global _mongodb_connection, _mongodb_pid, _mongodb_read_preferences
     try:
         db_uri = settings.MONGODB_URI
     except AttributeError:
         raise ImproperlyConfigured('Missing required MONGODB_URI setting')
 
-    if _mongodb_connection is None or force_connect:
+    # The sockets of the pool can't be shared with a forked process (e.g. the
+    # celery prefork workers), so every process gets its own connection
+    if (_mongodb_connection is None or force_connect or
+            _mongodb_pid != os.getpid() or
+            _mongodb_connection.db_uri != db_uri):
         _mongodb_connection = MongoDB(db_uri)
+        _mongodb_pid = os.getpid()
+        _mongodb_read_preferences = {}
+
+    if read_preference is None:
+        return _mongodb_connection
+
+    if read_preference not in _mongodb_read_preferences:
+        _mongodb_read_preferences[read_preference] = \
+            _mongodb_connection.with_read_preference(read_preference)
+    return _mongodb_read_preferences[read_preference]
+
+
+def get_reporting_db(force_connect=False):
+    """
+    Database for the reporting code (statistics, CSV exports...), it reads
+    from the secondaries of a replica set by default so the primary is not
+    loaded with the reports.
+    """
+    return get_db(force_connect, getattr(
+        settings, 'MONGODB_REPORTING_READ_PREFERENCE',
+        DEFAULT_MONGODB_REPORTING_READ_PREFERENCE))
+
+
+def exists(collection, query):
+    """
+    Return True if there is any document that matches the query. Unlike
+    find(query).count() it stops at the first document.
+    """
+    return collection.find_one(query, fields={'_id': True}) is not None
+
+
+def count_upto(collection, query, limit):
+    """
+    Count the documents that match the query, stopping at limit documents.
+    """
+    cursor = collection.find(query, fields={'_id': True}).limit(limit)
+    return cursor.count(with_limit_and_skip=True)
+
+
+def find_one_projected(collection, query, fields, **kwargs):
+    """
+    find_one that only returns the given fields. The _id is not returned
+    unless it is one of them.
+    """
+    projection = dict([(field, True) for field in fields])
+    projection.setdefault('_id', False)
+    return collection.find_one(query, fields=projection, **kwargs)
+
+
+# Indexes required by the queries of the platform, by collection. Every index
+# is a (keys, options) tuple with the arguments of create_index. The unique
+# indexes replace the duplicate checks before the inserts, the existing
+# duplicates must be merged with the merge_mongo_duplicates command before
+# they can be created.
+MONGODB_INDEXES = {
+    'activity': (
+        ([('user_id', ASCENDING), ('course_id', ASCENDING)], {}),
+        ([('user_id', ASCENDING), ('unit_id', ASCENDING)], {}),
+        ([('user_id', ASCENDING), ('kq_id', ASCENDING)], {'unique': True}),
+    ),
+    'answers': (
+        ([('user_id', ASCENDING), ('question_id', ASCENDING)], {'unique': True}),
+        ([('user_id', ASCENDING), ('kq_id', ASCENDING)], {}),
+    ),
+    'marks_kq': (
+        ([('user_id', ASCENDING), ('course_id', ASCENDING),
+          ('unit_id', ASCENDING), ('kq_id', ASCENDING)], {}),
+    ),
+    'marks_unit': (
+        ([('user_id', ASCENDING), ('course_id', ASCENDING),
+          ('unit_id', ASCENDING)], {}),
+    ),
+    'marks_course': (
+        ([('user_id', ASCENDING), ('course_id', ASCENDING)], {}),
+    ),
+    'peer_review_submissions': (
+        ([('kq', ASCENDING), ('assigned_to', ASCENDING)], {}),
+        ([('kq', ASCENDING), ('reviews', ASCENDING),
+          ('author_reviews', ASCENDING)], {}),
+        ([('author', ASCENDING), ('kq', ASCENDING)], {'unique': True}),
+    ),
+    'peer_review_reviews': (
+        ([('reviewer', ASCENDING), ('kq', ASCENDING)], {}),
+        ([('author', ASCENDING), ('kq', ASCENDING)], {}),
+        ([('submission_id', ASCENDING), ('reviewer', ASCENDING)], {'unique': True}),
+    ),
+    'stats_course': (
+        ([('course_id', ASCENDING)], {}),
+    ),
+    'stats_unit': (
+        ([('unit_id', ASCENDING)], {}),
+    ),
+    'stats_kq': (
+        ([('kq_id', ASCENDING)], {}),
+    ),
+}
+
+
+def get_required_indexes(collections=None):
+    """
+    Return the (collection, keys, options) tuples of the registered indexes
+    of the given collections, of every collection by default.
+    """
+    if collections is None:
+        collections = sorted(MONGODB_INDEXES.keys())
+    return [(collection, keys, options)
+            for collection in collections
+            for keys, options in MONGODB_INDEXES.get(collection, ())]
+
+
+def is_index_satisfied(index, keys, options):
+    # A unique index is valid for a non unique one but not the other way
+    return (list(index['key']) == list(keys) and
+            (not options.get('unique', False) or index.get('unique', False)))
+
+
+def get_missing_indexes(db=None, collections=None):
+    db = db or get_db()
+    existing = {}
+    missing = []
+    for collection, keys, options in get_required_indexes(collections):
+        if collection not in existing:
+            information = db.get_collection(collection).index_information()
+            existing[collection] = information.values()
+        if not [index for index in existing[collection]
+                if is_index_satisfied(index, keys, options)]:
+            missing.append((collection, keys, options))
+    return missing
+
+
+def ensure_indexes(db=None, collections=None, background=True):
+    """
+    Create the registered indexes that don't exist yet and return them.
+
+    An existing index on the same keys without the unique option is replaced
+    by the unique one. If the unique index can't be created (there are
+    duplicated documents) the old one is restored and the error is raised.
+    """
+    db = db or get_db()
+    missing = get_missing_indexes(db, collections)
+    for collection, keys, options in missing:
+        mongo_collection = db.get_collection(collection)
+        replaced = [name for name, index in mongo_collection.index_information().items()
+                    if list(index['key']) == list(keys)]
+        for name in replaced:
+            mongo_collection.drop_index(name)
+        index_options = {'background': background}
+        index_options.update(options)
+        try:
+            mongo_collection.create_index(keys, **index_options)
+        except OperationFailure:
+            if replaced:
+                mongo_collection.create_index(keys, background=background)
+            raise
+    return missing
+
+
+def check_indexes(*args, **kwargs):
+    """
+    Log a warning for every registered index that doesn't exist. It runs once
+    per process, when the first request or the celery worker starts.
+    """
+    request_started.disconnect(check_indexes)
+    if not getattr(settings, 'MONGODB_CHECK_INDEXES', True):
+        return
+    try:
+        missing = get_missing_indexes()
+    except Exception:
+        logger.exception('The MongoDB indexes could not be checked')
+        return
+    for collection, keys, options in missing:
+        logger.warning('Missing MongoDB index %s on the %s collection, run '
+                       'the ensure_mongo_indexes command' % (keys, collection))
+
 
-    return _mongodb_connection
+request_started.connect(check_indexes)
+if hasattr(celery_signals, 'worker_ready'):
+    celery_signals.worker_ready.connect(check_indexes, weak=False)
@@ -23,6 +23,7 @@ from adminsortable.models import Sortable
 from tinymce.models import HTMLField
 
 from moocng.courses.models import KnowledgeQuantum
+from moocng.courses.structure import invalidate_course_structure
 from moocng.mongodb import get_db
 from moocng.peerreview import cache
 from moocng.peerreview.managers import EvaluationCriterionManager, PeerReviewAssignmentManager
@@ -40,21 +41,24 @@ class PeerReviewAssignment(models.Model):
         verbose_name = _(u'peer review assignment')
         verbose_name_plural = _(u'peer review assignments')
 
-    def is_completed(self, user, visited=None):
+    def is_completed(self, user, visited=None, prefetch=None):
 
         db = get_db()
 
         if visited is None:
-            visited = self.kq.kq_visited_by(user)
+            visited = self.kq.kq_visited_by(user, prefetch)
             if not visited:
                 return False
 
         # Verify if user has sent a submission
-        submissions = db.get_collection("peer_review_submissions")
-        user_submission = submissions.find_one({
-            "kq": self.kq.id,
-            "author": user.id
-        })
+        if prefetch is not None:
+            user_submission = prefetch.get_submission(self.kq_id)
+        else:
+            submissions = db.get_collection("peer_review_submissions")
+            user_submission = submissions.find_one({
+                "kq": self.kq_id,
+                "author": user.id
+            })
 
         if not user_submission:
             return False
@@ -75,6 +79,7 @@ def invalidate_cache(sender, instance, **kwargs):
     try:
         course = instance.kq.unit.course
         cache.invalidate_course_has_peer_review_assignment_in_cache(course)
+        invalidate_course_structure(course.id)
     except ObjectDoesNotExist:  # The knowledge quantum is being deleted
         pass
 
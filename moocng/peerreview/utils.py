@@ -18,9 +18,12 @@ from datetime import datetime
 from django.db import IntegrityError
 from django.utils.translation import ugettext as _
 
+from pymongo.errors import DuplicateKeyError
+
 from tastypie.exceptions import BadRequest
 
-from moocng.mongodb import get_db
+from moocng.api.cache import invalidate_user_progress
+from moocng.mongodb import find_one_projected, get_db
 from moocng.peerreview import cache
 from moocng.peerreview.models import PeerReviewAssignment
 
@@ -50,7 +53,7 @@ def get_peer_review_review_score(review):
             len(review["criteria"]))
 
 
-def kq_get_peer_review_score(kq, author, pra=None):
+def kq_get_peer_review_score(kq, author, pra=None, prefetch=None):
     """ppr_collection is peer_review_reviews mongo collection
 
         Return a tuple with (score, scorable)
@@ -65,6 +68,9 @@ def kq_get_peer_review_score(kq, author, pra=None):
         * If I got enough reviews of my submission and I have reviewed enough
           reviews of other students' submissions:
             rerturn Average
+
+        The submission and the reviews are taken from prefetch, a
+        moocng.api.prefetch.UserMongoPrefetch of the author, if it is given
     """
 
     if not pra:
@@ -72,15 +78,20 @@ def kq_get_peer_review_score(kq, author, pra=None):
             pra = kq.peerreviewassignment
         except PeerReviewAssignment.DoesNotExist:
             return None
+        # select_related caches the missing assignment as None
+        if pra is None:
+            return None
 
     db = get_db()
 
-    prs_collection = db.get_collection("peer_review_submissions")
-
-    submission = prs_collection.find_one({
-        "kq": kq.id,
-        "author": author.id
-    })
+    if prefetch is not None:
+        submission = prefetch.get_submission(kq.id)
+    else:
+        prs_collection = db.get_collection("peer_review_submissions")
+        submission = prs_collection.find_one({
+            "kq": kq.id,
+            "author": author.id
+        })
 
     if (not submission or
        submission.get("author_reviews", 0) < pra.minimum_reviewers):
@@ -88,12 +99,15 @@ def kq_get_peer_review_score(kq, author, pra=None):
     elif submission["reviews"] == 0:
         return None
 
-    ppr_collection = db.get_collection("peer_review_reviews")
-    reviews = ppr_collection.find({
-        "kq": kq.id,
-        "author": author.id
-    })
-    reviews_count = reviews.count()
+    if prefetch is not None:
+        reviews = prefetch.get_reviews(kq.id)
+    else:
+        ppr_collection = db.get_collection("peer_review_reviews")
+        reviews = list(ppr_collection.find({
+            "kq": kq.id,
+            "author": author.id
+        }))
+    reviews_count = len(reviews)
     sum_average = 0
     for review in reviews:
         sum_average += float(get_peer_review_review_score(review))
@@ -109,10 +123,10 @@ def save_review(kq, reviewer, user_reviewed, criteria, comment):
     submissions = db.get_collection("peer_review_submissions")
     reviews = db.get_collection("peer_review_reviews")
 
-    submission = submissions.find_one({
+    submission = find_one_projected(submissions, {
         "author": user_reviewed.id,
         "kq": kq.id
-    })
+    }, ["_id"])
 
     peer_review_review = {
         "submission_id": submission.get("_id"),
@@ -126,17 +140,12 @@ def save_review(kq, reviewer, user_reviewed, criteria, comment):
         "course": kq.unit.course.id
     }
 
-    review_exists = (reviews.find({
-        "submission_id": submission.get("_id"),
-        "reviewer": reviewer.id,
-    }).count() > 0)
-
-    if review_exists:
+    try:
+        reviews.insert(peer_review_review, safe=True)
+    except DuplicateKeyError:
         raise IntegrityError("Already exist one review for this submission and"
                              " reviewer")
 
-    reviews.insert(peer_review_review)
-
     submissions.update({
         "author": user_reviewed.id,
         "kq": kq.id,
@@ -162,6 +171,10 @@ def save_review(kq, reviewer, user_reviewed, criteria, comment):
         }
     })
 
+    # The score and the progress of both of them have changed
+    invalidate_user_progress(kq.unit.course_id, user_reviewed.id)
+    invalidate_user_progress(kq.unit.course_id, reviewer.id)
+
     return peer_review_review
 
 
@@ -169,6 +182,7 @@ def insert_p2p_if_does_not_exists_or_raise(p2p_submission, submissions=None):
     if submissions is None:
         db = get_db()
         submissions = db.get_collection("peer_review_submissions")
-    if submissions.find({'kq': p2p_submission['kq'], 'author': p2p_submission['author']}).count() > 0:
+    try:
+        return submissions.insert(p2p_submission, safe=True)
+    except DuplicateKeyError:
         raise BadRequest(_('You have already sent a submission. Please reload the page'))
-    return submissions.insert(p2p_submission)
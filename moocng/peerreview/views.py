@@ -31,11 +31,12 @@ from django.shortcuts import get_object_or_404, render_to_response
 from django.template import RequestContext
 from django.utils.translation import ugettext as _
 
-from moocng.api.mongodb import get_db
+from moocng.mongodb import count_upto, exists, find_one_projected, get_db
 from moocng.api.tasks import on_peerreviewreview_created_task
 from moocng.courses.models import KnowledgeQuantum
 from moocng.courses.utils import send_mail_wrapper, is_course_ready
-from moocng.courses.security import get_course_if_user_can_view_or_404
+from moocng.courses.security import (get_course_access,
+                                     get_course_if_user_can_view_or_404)
 from moocng.peerreview.forms import ReviewSubmissionForm, EvalutionCriteriaResponseForm
 from moocng.peerreview.models import PeerReviewAssignment, EvaluationCriterion
 from moocng.peerreview.utils import course_get_visible_peer_review_assignments, save_review, insert_p2p_if_does_not_exists_or_raise
@@ -47,7 +48,7 @@ def course_review_assign(request, course_slug, assignment_id):
     assignment = get_object_or_404(PeerReviewAssignment, id=assignment_id)
     user_id = request.user.id
 
-    is_enrolled = course.students.filter(id=user_id).exists()
+    is_enrolled = get_course_access(course, request.user).is_enrolled
     if not is_enrolled:
         messages.error(request, _('You are not enrolled in this course'))
         return HttpResponseRedirect(reverse('course_overview', args=[course_slug]))
@@ -58,11 +59,10 @@ def course_review_assign(request, course_slug, assignment_id):
 
     collection = get_db().get_collection('peer_review_submissions')
 
-    submission = collection.find({
+    if exists(collection, {
         'kq': assignment.kq.id,
         'assigned_to': user_id
-    })
-    if submission.count() > 0:
+    }):
         messages.error(request, _('You already have a submission assigned.'))
         return HttpResponseRedirect(reverse('course_reviews', args=[course_slug]))
 
@@ -71,7 +71,7 @@ def course_review_assign(request, course_slug, assignment_id):
 
     assignation_expire = datetime.utcnow() - max_hours_assigned
 
-    submission = collection.find({
+    submission = find_one_projected(collection, {
         'kq': assignment.kq.id,
         '$or': [
             {
@@ -91,17 +91,17 @@ def course_review_assign(request, course_slug, assignment_id):
         'reviewers': {
             '$ne': user_id
         }
-    }).sort([
+    }, ['_id'], sort=[
         ('reviews', pymongo.ASCENDING),
         ('author_reviews', pymongo.DESCENDING),
-    ]).limit(1)
+    ])
 
-    if submission.count() == 0:
+    if submission is None:
         messages.error(request, _('There is no submission avaliable for you at this moment. Please, try again later.'))
         return HttpResponseRedirect(reverse('course_reviews', args=[course_slug]))
     else:
         collection.update({
-            '_id': submission[0]['_id']
+            '_id': submission['_id']
         }, {
             '$set': {
                 'assigned_to': user_id,
@@ -115,7 +115,7 @@ def course_review_assign(request, course_slug, assignment_id):
 def course_reviews(request, course_slug):
     course = get_course_if_user_can_view_or_404(course_slug, request)
 
-    is_enrolled = course.students.filter(id=request.user.id).exists()
+    is_enrolled = get_course_access(course, request.user).is_enrolled
     if not is_enrolled:
         messages.error(request, _('You are not enrolled in this course'))
         return HttpResponseRedirect(reverse('course_overview', args=[course_slug]))
@@ -155,7 +155,7 @@ def course_review_review(request, course_slug, assignment_id):
     assignment = get_object_or_404(PeerReviewAssignment, id=assignment_id)
     user_id = request.user.id
 
-    is_enrolled = course.students.filter(id=user_id).exists()
+    is_enrolled = get_course_access(course, request.user).is_enrolled
     if not is_enrolled:
         messages.error(request, _('You are not enrolled in this course'))
         return HttpResponseRedirect(reverse('course_overview', args=[course_slug]))
@@ -166,18 +166,16 @@ def course_review_review(request, course_slug, assignment_id):
 
     collection = get_db().get_collection('peer_review_submissions')
 
-    submission = collection.find({
+    submission = collection.find_one({
         'kq': assignment.kq.id,
         'assigned_to': user_id
     })
 
-    if submission.count() == 0:
+    if submission is None:
         messages.error(request, _('You don\'t have this submission assigned.'))
         return HttpResponseRedirect(reverse('course_reviews', args=[course_slug]))
 
-    submission_obj = submission[0]
-
-    submitter = User.objects.get(id=int(submission_obj['author']))
+    submitter = User.objects.get(id=int(submission['author']))
 
     criteria_initial = [{'evaluation_criterion_id': criterion.id} for criterion in assignment.criteria.all()]
     EvalutionCriteriaResponseFormSet = formset_factory(EvalutionCriteriaResponseForm, extra=0, max_num=len(criteria_initial))
@@ -191,10 +189,11 @@ def course_review_review(request, course_slug, assignment_id):
                 review = save_review(assignment.kq, request.user, submitter, criteria_values, submission_form.cleaned_data['comments'])
 
                 reviews = get_db().get_collection('peer_review_reviews')
-                reviewed_count = reviews.find({
+                # Only the first review and the pending ones are relevant
+                reviewed_count = count_upto(reviews, {
                     'reviewer': user_id,
                     'kq': assignment.kq.id
-                }).count()
+                }, max(assignment.minimum_reviewers, 1) + 1)
                 on_peerreviewreview_created_task.apply_async(
                     args=[review, reviewed_count],
                     queue='stats',
@@ -219,14 +218,14 @@ def course_review_review(request, course_slug, assignment_id):
     max_hours_assigned = timedelta(hours=getattr(settings,
                                    "PEER_REVIEW_ASSIGNATION_EXPIRE", 24))
 
-    assigned_when = submission[0]["assigned_when"]
+    assigned_when = submission["assigned_when"]
     assignation_expire = assigned_when + max_hours_assigned
 
     now = datetime.now(assigned_when.tzinfo)
     is_assignation_expired = now > assignation_expire
 
     return render_to_response('peerreview/review_review.html', {
-        'submission': submission[0],
+        'submission': submission,
         'is_assignation_expired': is_assignation_expired,
         'assignation_expire': assignation_expire,
         'submission_form': submission_form,
@@ -0,0 +1,116 @@
+# Copyright 2013 UNED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import timeit
+from datetime import datetime
+from decimal import Decimal
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.utils.translation import ugettext_lazy
+
+from tastypie.bundle import Bundle
+from tastypie.serializers import Serializer
+
+from moocng.api.serializers import FastSerializer
+
+
+def generate_course_data(units, kqs):
+    """
+    List response with the shape of /api/v1/kq/ for a generated course
+    """
+    objects = []
+    for unit in range(units):
+        for kq in range(kqs):
+            kq_id = unit * kqs + kq
+            objects.append(Bundle(data={
+                'id': kq_id,
+                'resource_uri': '/api/v1/kq/%d/' % kq_id,
+                'unit': '/api/v1/unit/%d/' % unit,
+                'title': u'Nugget %d of the unit %d' % (kq, unit),
+                'teacher_comments': ugettext_lazy(u'Teacher comments'),
+                'supplementary_material': u'<p>Material \xe1\xe9\xed</p>' * 5,
+                'question': '/api/v1/question/%d/' % kq_id,
+                'peer_review_assignment': None,
+                'asset_availability': None,
+                'media_content_type': u'youtube',
+                'media_content_id': u'eW3gMGqcZQc',
+                'iframe_code': u'<iframe src="//www.youtube.com/embed/{{ID}}"></iframe>',
+                'thumbnail_url': u'//img.youtube.com/vi/eW3gMGqcZQc/0.jpg',
+                'weight': Decimal('10.5'),
+                'normalized_weight': 100.0 / kqs,
+                'order': kq,
+                'correct': kq % 2 == 0,
+                'completed': kq % 3 == 0,
+                'peer_review_score': None,
+                'created': datetime(2013, 9, 1, 10, 30),
+            }))
+    return {
+        'meta': {
+            'limit': 0,
+            'offset': 0,
+            'total_count': len(objects),
+            'next': None,
+            'previous': None,
+        },
+        'objects': objects,
+    }
+
+
+class Command(BaseCommand):
+
+    help = ('Compare the default tastypie serializer with the FastSerializer '
+            'of the API on the nuggets of a generated course')
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--units',
+            dest='units',
+            type='int',
+            default=10,
+            help='Number of units of the generated course.'
+        ),
+        make_option(
+            '--kqs',
+            dest='kqs',
+            type='int',
+            default=20,
+            help='Number of nuggets of every unit.'
+        ),
+        make_option(
+            '--repeat',
+            dest='repeat',
+            type='int',
+            default=20,
+            help='Number of times the list is serialized.'
+        ),
+    )
+
+    def handle(self, *args, **options):
+        data = generate_course_data(options['units'], options['kqs'])
+        serializer = Serializer()
+        fast_serializer = FastSerializer()
+        benchmarks = (
+            ('tastypie', lambda: serializer.serialize(data, 'application/json')),
+            ('fast', lambda: fast_serializer.serialize(data, 'application/json')),
+            ('fast streaming', lambda: u''.join(fast_serializer.iter_json(data))),
+        )
+
+        self.stdout.write('%d nuggets, %d runs\n' % (len(data['objects']),
+                                                    options['repeat']))
+        for name, function in benchmarks:
+            seconds = timeit.timeit(function, number=options['repeat'])
+            self.stdout.write('%-16s %8.3f ms/response\n' % (
+                name, seconds * 1000 / options['repeat']))
@@ -0,0 +1,78 @@
+# Copyright 2013 UNED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import timeit
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from pymongo import ASCENDING
+
+from moocng.mongodb import count_upto, exists, get_db
+
+BENCHMARK_COLLECTION = 'benchmark_activity'
+
+
+class Command(BaseCommand):
+
+    help = ('Compare the find().count() existence checks with the exists and '
+            'count_upto helpers on a temporary activity collection')
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--documents',
+            dest='documents',
+            type='int',
+            default=5000,
+            help='Number of activity documents of the benchmarked user.'
+        ),
+        make_option(
+            '--repeat',
+            dest='repeat',
+            type='int',
+            default=200,
+            help='Number of times every query is run.'
+        ),
+    )
+
+    def handle(self, *args, **options):
+        db = get_db()
+        db.database.drop_collection(BENCHMARK_COLLECTION)
+        activity = db.get_collection(BENCHMARK_COLLECTION)
+        activity.ensure_index([('user_id', ASCENDING), ('course_id', ASCENDING)])
+        activity.insert([{
+            'user_id': 1,
+            'course_id': 1,
+            'unit_id': i / 10,
+            'kq_id': i,
+        } for i in range(options['documents'])], safe=True)
+
+        query = {'user_id': 1, 'course_id': 1}
+        benchmarks = (
+            ('find().count() > 0', lambda: activity.find(query).count() > 0),
+            ('exists', lambda: exists(activity, query)),
+            ('find().count()', lambda: activity.find(query).count()),
+            ('count_upto(2)', lambda: count_upto(activity, query, 2)),
+        )
+
+        self.stdout.write('%d activity documents, %d runs\n' % (
+            options['documents'], options['repeat']))
+        try:
+            for name, function in benchmarks:
+                seconds = timeit.timeit(function, number=options['repeat'])
+                self.stdout.write('%-20s %8.3f ms/query\n' % (
+                    name, seconds * 1000 / options['repeat']))
+        finally:
+            db.database.drop_collection(BENCHMARK_COLLECTION)
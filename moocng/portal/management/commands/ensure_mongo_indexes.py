@@ -0,0 +1,63 @@
+# Copyright 2013 UNED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from moocng.mongodb import MONGODB_INDEXES, ensure_indexes, get_missing_indexes
+
+
+class Command(BaseCommand):
+
+    args = '<collection collection ...>'
+    help = ('Create the MongoDB indexes required by the platform that don\'t '
+            'exist yet, for every collection by default')
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--check',
+            action='store_true',
+            dest='check',
+            default=False,
+            help='Only list the missing indexes, don\'t create them.'
+        ),
+        make_option(
+            '--foreground',
+            action='store_false',
+            dest='background',
+            default=True,
+            help='Build the indexes in the foreground, it is faster but it blocks the collections.'
+        ),
+    )
+
+    def handle(self, *args, **options):
+        for collection in args:
+            if collection not in MONGODB_INDEXES:
+                raise CommandError('There are no indexes registered for the %s collection' % collection)
+        collections = args or None
+
+        if options['check']:
+            indexes = get_missing_indexes(collections=collections)
+            message = 'Missing index %s on %s\n'
+        else:
+            indexes = ensure_indexes(collections=collections,
+                                     background=options['background'])
+            message = 'Created index %s on %s\n'
+
+        for collection, keys, index_options in indexes:
+            self.stdout.write(message % (keys, collection))
+        if not indexes:
+            self.stdout.write('All the indexes exist\n')
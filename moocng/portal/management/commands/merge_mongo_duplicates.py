@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+# Copyright 2013 UNED
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from moocng.mongodb import ensure_indexes, get_db, get_required_indexes
+
+
+def merge_first(db, documents):
+    return documents[0], documents[1:]
+
+
+def merge_answers(db, documents):
+    # The last answer is the one the student sees and the marks are based on
+    documents = sorted(documents, key=lambda answer: answer.get('date', None))
+    return documents[-1], documents[:-1]
+
+
+def merge_peer_review_submissions(db, documents):
+    kept, removed = documents[0], documents[1:]
+    reviews = db.get_collection('peer_review_reviews')
+    reviews.update({
+        'submission_id': {'$in': [submission['_id'] for submission in removed]},
+    }, {
+        '$set': {'submission_id': kept['_id']},
+    }, multi=True, safe=True)
+    db.get_collection('peer_review_submissions').update({
+        '_id': kept['_id'],
+    }, {
+        '$set': {
+            'reviews': reviews.find({'submission_id': kept['_id']}).count(),
+            'author_reviews': sum([submission.get('author_reviews', 0)
+                                   for submission in documents]),
+        },
+    }, safe=True)
+    return kept, removed
+
+
+def merge_peer_review_reviews(db, documents):
+    # Every review counted once in the reviewed submission and once in the
+    # submission of the reviewer, see moocng.peerreview.utils.save_review
+    kept, removed = documents[0], documents[1:]
+    submissions = db.get_collection('peer_review_submissions')
+    submission = submissions.find_one({'_id': kept['submission_id']},
+                                      fields=['reviewers'])
+    if submission is not None:
+        reviewers = list(submission.get('reviewers', []))
+        for review in removed:
+            if reviewers.count(kept['reviewer']) > 1:
+                reviewers.remove(kept['reviewer'])
+        submissions.update({
+            '_id': kept['submission_id'],
+        }, {
+            '$inc': {'reviews': -len(removed)},
+            '$set': {'reviewers': reviewers},
+        }, safe=True)
+    submissions.update({
+        'author': kept['reviewer'],
+        'kq': kept['kq'],
+    }, {
+        '$inc': {'author_reviews': -len(removed)},
+    }, safe=True)
+    return kept, removed
+
+
+# The submissions go before the reviews, merging them can leave two reviews of
+# the same reviewer on the merged submission
+MERGE_FUNCTIONS = (
+    ('activity', merge_first),
+    ('answers', merge_answers),
+    ('peer_review_submissions', merge_peer_review_submissions),
+    ('peer_review_reviews', merge_peer_review_reviews),
+)
+
+
+def find_duplicates(collection, keys):
+    """
+    Yield the values of the keys that are repeated in the collection. The
+    documents are read sorted by the keys, so the existing index is used and
+    the duplicates are consecutive.
+    """
+    fields = [key for key, direction in keys]
+    query = dict([(field, {'$exists': True}) for field in fields])
+    projection = dict([(field, True) for field in fields])
+    projection['_id'] = False
+
+    previous = None
+    reported = False
+    for document in collection.find(query, fields=projection).sort(keys):
+        values = tuple([document.get(field, None) for field in fields])
+        if values == previous:
+            if not reported:
+                reported = True
+                yield dict(zip(fields, values))
+        else:
+            previous = values
+            reported = False
+
+
+class Command(BaseCommand):
+
+    args = '<collection collection ...>'
+    help = ('Merge the documents that break the unique MongoDB indexes and '
+            'create the indexes, for every collection by default')
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--dry-run',
+            action='store_true',
+            dest='dry_run',
+            default=False,
+            help='Only count the duplicated documents, don\'t merge them.'
+        ),
+    )
+
+    def handle(self, *args, **options):
+        merge_functions = dict(MERGE_FUNCTIONS)
+        for collection in args:
+            if collection not in merge_functions:
+                raise CommandError('The duplicates of the %s collection can\'t be merged' % collection)
+        collections = [collection for collection, merge in MERGE_FUNCTIONS
+                       if not args or collection in args]
+
+        db = get_db()
+        for collection, keys, index_options in get_required_indexes(collections):
+            if not index_options.get('unique', False):
+                continue
+            mongo_collection = db.get_collection(collection)
+            groups = documents = 0
+            for query in find_duplicates(mongo_collection, keys):
+                duplicates = list(mongo_collection.find(query).sort('_id'))
+                groups += 1
+                documents += len(duplicates) - 1
+                if options['dry_run']:
+                    continue
+                kept, removed = merge_functions[collection](db, duplicates)
+                mongo_collection.remove({
+                    '_id': {'$in': [document['_id'] for document in removed]},
+                }, safe=True)
+            self.stdout.write('%s: %d duplicated documents of %d %s\n' % (
+                collection, documents, groups, keys))
+
+        if not options['dry_run']:
+            for collection, keys, index_options in ensure_indexes(db, collections):
+                self.stdout.write('Created index %s on %s\n' % (keys, collection))
@@ -22,7 +22,7 @@ from pymongo import ASCENDING
 from moocng.badges.models import Award
 from moocng.courses.marks import calculate_course_mark
 from moocng.courses.models import Course, KnowledgeQuantum
-from moocng.mongodb import get_db
+from moocng.mongodb import get_reporting_db
 
 
 class Command(BaseCommand):
@@ -58,7 +58,7 @@ class Command(BaseCommand):
         kqs = KnowledgeQuantum.objects.filter(unit__course__id=course.id).count()
         completed_first_unit = 0
 
-        db = get_db()
+        db = get_reporting_db()
         activity = db.get_collection('activity')
         rows = []
         badge = course.completion_badge
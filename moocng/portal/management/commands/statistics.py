@@ -16,11 +16,12 @@ from datetime import datetime
 from optparse import make_option
 
 from django.db.models import Q
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 
 from moocng.courses.models import Course
 from moocng.mongodb import get_db
-from moocng.portal.stats import calculate_all_stats
+from moocng.portal.stats import (calculate_all_stats,
+                                 calculate_all_stats_in_shards)
 
 
 class Command(BaseCommand):
@@ -48,6 +49,27 @@ class Command(BaseCommand):
             dest='all_courses',
             default=False,
             help='Calculate statistics for all courses, this overrides any other option.'
+        ),
+        make_option(
+            '--processes',
+            dest='processes',
+            type='int',
+            default=0,
+            help='Split the students in shards and calculate them with this number of processes.'
+        ),
+        make_option(
+            '--shard-size',
+            dest='shard_size',
+            type='int',
+            default=5000,
+            help='Number of user ids of every shard when using --processes or --resume.'
+        ),
+        make_option(
+            '--resume',
+            action='store_true',
+            dest='resume',
+            default=False,
+            help='Resume an interrupted run at the shards that weren\'t calculated. The same courses and shard size must be used.'
         )
     )
 
@@ -89,15 +111,16 @@ class Command(BaseCommand):
 
         print 'Calculating stats for these courses (ids): %s' % ', '.join([str(cid) for cid in courses])
 
-        # Drop existing stats for selected courses
-        db = get_db()
-        stats_course = db.get_collection('stats_course')
-        stats_unit = db.get_collection('stats_unit')
-        stats_kq = db.get_collection('stats_kq')
-        for cid in courses:
-            stats_course.remove({'course_id': cid}, safe=True)
-            stats_unit.remove({'course_id': cid}, safe=True)
-            stats_kq.remove({'course_id': cid}, safe=True)
+        if not options['resume']:
+            # Drop existing stats for selected courses
+            db = get_db()
+            stats_course = db.get_collection('stats_course')
+            stats_unit = db.get_collection('stats_unit')
+            stats_kq = db.get_collection('stats_kq')
+            for cid in courses:
+                stats_course.remove({'course_id': cid}, safe=True)
+                stats_unit.remove({'course_id': cid}, safe=True)
+                stats_kq.remove({'course_id': cid}, safe=True)
 
         # Callback to show some progress information
         def callback(step='', counter=0, total=0):
@@ -108,4 +131,15 @@ class Command(BaseCommand):
                 elif step == 'storing':
                     print 'Saved %d of %d statistics entries' % (counter, total)
 
-        calculate_all_stats(callback=callback, course_blacklist=blacklist)
+        if options['processes'] or options['resume']:
+            try:
+                calculate_all_stats_in_shards(
+                    processes=max(1, options['processes']),
+                    shard_size=options['shard_size'],
+                    course_blacklist=blacklist,
+                    callback=callback,
+                    resume=options['resume'])
+            except ValueError, e:
+                raise CommandError(e.message)
+        else:
+            calculate_all_stats(callback=callback, course_blacklist=blacklist)
@@ -12,15 +12,27 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import cPickle
 import decimal
 import gc
+import logging
+from itertools import groupby
+from multiprocessing import Pool
 
+from bson.binary import Binary
+
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.core.exceptions import ObjectDoesNotExist
+from django.core.exceptions import FieldError, ObjectDoesNotExist
+from django.db import connection
+from django.db.models import Max
 
 from moocng.api.tasks import has_passed_now
 from moocng.courses.models import KnowledgeQuantum, Course
-from moocng.mongodb import get_db
+from moocng.mongodb import (ensure_indexes, get_db, get_missing_indexes,
+                            get_reporting_db)
+
+logger = logging.getLogger(__name__)
 
 
 # We can't use the method in the model because this code can be called from a
@@ -37,6 +49,257 @@ def kq_type(kq):
     return "Video"
 
 
+def get_kq_types(kq_objects):
+    # Same rules as kq_type, for every nugget at once. The relations are
+    # looked up by name because kq_objects can be a manager of the south orm,
+    # where they may not be available.
+    kq_types = {}
+    for relation, nugget_type in (('peerreviewassignment', 'PeerReviewAssignment'),
+                                  ('question', 'Question')):
+        try:
+            kq_ids = kq_objects.filter(**{'%s__isnull' % relation: False}).values_list('id', flat=True)
+        except FieldError:
+            continue
+        for kq_id in kq_ids:
+            kq_types[kq_id] = nugget_type
+    return kq_types
+
+
+class UserStream(object):
+    """
+    Iterates over a cursor sorted by a user field, returning the documents of
+    the users asked for in increasing order. This way every collection is
+    read only once for a batch of students.
+    """
+
+    def __init__(self, cursor, user_field):
+        self.groups = groupby(cursor, key=lambda doc: doc[user_field])
+        self.current = next(self.groups, None)
+
+    def get(self, user_id):
+        docs = []
+        while self.current is not None and self.current[0] <= user_id:
+            if self.current[0] == user_id:
+                docs = list(self.current[1])
+            self.current = next(self.groups, None)
+        return docs
+
+
+def load_stats_metadata(kq_objects=KnowledgeQuantum.objects,
+                        course_objects=Course.objects):
+    """
+    Course, unit and nugget data needed to calculate the statistics, loaded
+    only once into dictionaries.
+    """
+    metadata = {
+        'kq_units': {},
+        'unit_total_kqs': {},
+        'course_total_kqs': {},
+        'kq_types': get_kq_types(kq_objects),
+        'course_thresholds': dict(course_objects.values_list('id', 'threshold')),
+    }
+    for kq_id, unit_id, course_id in kq_objects.values_list('id', 'unit__id', 'unit__course__id'):
+        metadata['kq_units'][kq_id] = unit_id
+        metadata['unit_total_kqs'][unit_id] = metadata['unit_total_kqs'].get(unit_id, 0) + 1
+        metadata['course_total_kqs'][course_id] = metadata['course_total_kqs'].get(course_id, 0) + 1
+    return metadata
+
+
+# The collections are read sorted by user, see calculate_students_stats
+STATS_SOURCE_COLLECTIONS = ('activity', 'peer_review_submissions',
+                            'peer_review_reviews', 'answers', 'marks_kq',
+                            'marks_unit', 'marks_course')
+STATS_COLLECTIONS = ('stats_kq', 'stats_unit', 'stats_course')
+
+
+def check_source_indexes(db=None):
+    # The indexes of the live collections are created by the
+    # ensure_mongo_indexes and merge_mongo_duplicates commands, building them
+    # here would block the database
+    for collection, keys, options in get_missing_indexes(db, STATS_SOURCE_COLLECTIONS):
+        logger.warning('Missing index %s on %s, the statistics will be slow. '
+                       'Run the ensure_mongo_indexes command.' % (keys, collection))
+
+
+def calculate_students_stats(students, metadata, course_blacklist=None,
+                             callback=None, counter=0, total=0):
+    """
+    Calculate the statistics of a list of students sorted by id, reading
+    every collection only once. Returns the stats dictionary that
+    store_stats_in_mongo expects.
+    """
+    stats = {}
+    if not students:
+        return stats
+
+    kq_units = metadata['kq_units']
+    unit_total_kqs = metadata['unit_total_kqs']
+    course_total_kqs = metadata['course_total_kqs']
+    kq_types = metadata['kq_types']
+    course_thresholds = metadata['course_thresholds']
+
+    db = get_reporting_db()
+    activity = db.get_collection('activity')
+    submissions = db.get_collection('peer_review_submissions')
+    reviews = db.get_collection('peer_review_reviews')
+    answers = db.get_collection('answers')
+    marks_kq = db.get_collection('marks_kq')
+    marks_unit = db.get_collection('marks_unit')
+    marks_course = db.get_collection('marks_course')
+
+    def user_stream(collection, user_field, fields, extra_query=None):
+        query = {user_field: {'$gte': students[0], '$lte': students[-1]}}
+        query.update(extra_query or {})
+        # The cursors are consumed along the whole batch, so they must
+        # not time out in the server
+        cursor = collection.find(query, fields=fields,
+                                 sort=[(user_field, 1)], timeout=False)
+        return UserStream(cursor, user_field)
+
+    if course_blacklist:
+        activity_query = {'course_id': {'$nin': course_blacklist}}
+    else:
+        activity_query = {}
+    activity_stream = user_stream(activity, 'user_id',
+                                  ['user_id', 'course_id', 'unit_id', 'kq_id'],
+                                  activity_query)
+    submissions_stream = user_stream(submissions, 'author', ['author', 'kq'])
+    reviews_stream = user_stream(reviews, 'reviewer', ['reviewer', 'kq'])
+    answers_stream = user_stream(answers, 'user_id', ['user_id', 'kq_id'])
+    marks_kq_stream = user_stream(marks_kq, 'user_id',
+                                  ['user_id', 'course_id', 'unit_id', 'kq_id', 'mark'])
+    marks_unit_stream = user_stream(marks_unit, 'user_id',
+                                    ['user_id', 'course_id', 'unit_id', 'mark'])
+    marks_course_stream = user_stream(marks_course, 'user_id',
+                                      ['user_id', 'course_id', 'mark'])
+
+    for student_id in students:
+        student_activity = activity_stream.get(student_id)
+
+        # The first document wins, as it would with find_one
+        student_marks_course = {}
+        for mark in marks_course_stream.get(student_id):
+            student_marks_course.setdefault(mark.get('course_id'), mark)
+        student_marks_unit = {}
+        for mark in marks_unit_stream.get(student_id):
+            student_marks_unit.setdefault((mark.get('course_id'), mark.get('unit_id')), mark)
+        student_marks_kq = {}
+        for mark in marks_kq_stream.get(student_id):
+            student_marks_kq.setdefault((mark.get('course_id'), mark.get('unit_id'), mark.get('kq_id')), mark)
+        student_answers = set([answer.get('kq_id') for answer in answers_stream.get(student_id)])
+        student_submissions = set([submission.get('kq') for submission in submissions_stream.get(student_id)])
+        student_reviews = {}
+        for review in reviews_stream.get(student_id):
+            student_reviews[review.get('kq')] = student_reviews.get(review.get('kq'), 0) + 1
+
+        student_course_kqs = {}
+        student_started_courses = []
+        student_unit_kqs = {}
+        student_started_units = []
+
+        for act in student_activity:
+            cid = int(act['course_id'])
+            nid = int(act['kq_id'])
+
+            if not nid in kq_units:
+                continue
+            nugget_type = kq_types.get(nid, 'Video')
+
+            try:
+                # This is here due a bug that populated the activity
+                # collection with documents with their unit_id set to null
+                uid = int(act.get('unit_id'))
+            except TypeError:
+                uid = int(kq_units[nid])
+
+            if not cid in stats:
+                stats[cid] = {
+                    'u': {},
+                    'total_kqs': course_total_kqs.get(cid, 0),
+                    'threshold': course_thresholds.get(cid),
+                    'started': 0,
+                    'completed': 0,
+                    'passed': 0
+                }
+
+            if not uid in stats[cid]['u']:
+                stats[cid]['u'][uid] = {
+                    'n': {},
+                    'total_kqs': unit_total_kqs.get(uid, 0),
+                    'started': 0,
+                    'completed': 0,
+                    'passed': 0
+                }
+
+            if not nid in stats[cid]['u'][uid]['n']:
+                stats[cid]['u'][uid]['n'][nid] = {
+                    'viewed': 0,
+                    'passed': 0
+                }
+                if nugget_type == "PeerReviewAssignment":
+                    stats[cid]['u'][uid]['n'][nid]['submitted'] = 0
+                    stats[cid]['u'][uid]['n'][nid]['reviews'] = 0
+                    stats[cid]['u'][uid]['n'][nid]['reviewers'] = 0
+                elif nugget_type == "Question":
+                    stats[cid]['u'][uid]['n'][nid]['submitted'] = 0
+
+            # Student course stats
+            if not cid in student_started_courses:
+                stats[cid]['started'] += 1
+                mark = student_marks_course.get(cid)
+                if mark and has_passed_now(mark['mark'], False, stats[cid]['threshold']):
+                    stats[cid]['passed'] += 1
+                student_started_courses.append(cid)
+
+            if not cid in student_course_kqs:
+                student_course_kqs[cid] = 0
+            student_course_kqs[cid] += 1
+            if student_course_kqs[cid] == stats[cid]['total_kqs']:
+                stats[cid]['completed'] += 1
+
+            # Student unit stats
+            if not uid in student_started_units:
+                stats[cid]['u'][uid]['started'] += 1
+                mark = student_marks_unit.get((cid, uid))
+                if mark and has_passed_now(mark['mark'], False, stats[cid]['threshold']):
+                    stats[cid]['u'][uid]['passed'] += 1
+                student_started_units.append(uid)
+
+            if not uid in student_unit_kqs:
+                student_unit_kqs[uid] = 0
+            student_unit_kqs[uid] += 1
+            if student_unit_kqs[uid] == stats[cid]['u'][uid]['total_kqs']:
+                stats[cid]['u'][uid]['completed'] += 1
+
+            # Student nugget stats
+            threshold = stats[cid]['threshold']
+            stats[cid]['u'][uid]['n'][nid]['viewed'] += 1
+            if nugget_type == 'PeerReviewAssignment':
+                if nid in student_submissions:
+                    stats[cid]['u'][uid]['n'][nid]['submitted'] += 1
+
+                revs = student_reviews.get(nid, 0)
+                if revs > 0:
+                    stats[cid]['u'][uid]['n'][nid]['reviewers'] += 1
+                    stats[cid]['u'][uid]['n'][nid]['reviews'] += revs
+                if threshold is not None:
+                    threshold = decimal.Decimal('5.0')  # P2P is a special case
+
+            elif nugget_type == 'Question':
+                if nid in student_answers:
+                    stats[cid]['u'][uid]['n'][nid]['submitted'] += 1
+
+            mark = student_marks_kq.get((cid, uid, nid))
+            if mark and has_passed_now(mark['mark'], False, threshold):
+                stats[cid]['u'][uid]['n'][nid]['passed'] += 1
+
+        counter += 1
+        if callback is not None:
+            callback(step='calculating', counter=counter, total=total)
+
+    return stats
+
+
 def calculate_all_stats(user_objects=User.objects,
                         kq_objects=KnowledgeQuantum.objects, callback=None,
                         course_blacklist=None, student_batch=5000,
@@ -46,264 +309,250 @@ def calculate_all_stats(user_objects=User.objects,
     lower = 0
     upper = student_batch
     total = user_objects.all().count()
-    all_students = user_objects.only('id').all()
+    all_students = user_objects.only('id').order_by('id')
     all_students = [s.id for s in all_students]
 
+    metadata = load_stats_metadata(kq_objects, course_objects)
+    check_source_indexes(get_db())
+
+    # The stats of every batch are merged and stored together at the end
+    stats = {}
     while counter < total:
-        db = get_db()
-        stats = {}
-        activity = db.get_collection('activity')
-        submissions = db.get_collection('peer_review_submissions')
-        reviews = db.get_collection('peer_review_reviews')
-        answers = db.get_collection('answers')
-        marks_kq = db.get_collection('marks_kq')
-        marks_unit = db.get_collection('marks_unit')
-        marks_course = db.get_collection('marks_course')
         students = all_students[lower:upper]
+        if not students:
+            break
+        merge_stats(stats, calculate_students_stats(students, metadata,
+                                                    course_blacklist,
+                                                    callback, counter, total))
+        counter += len(students)
+
+        lower = upper
+        upper = upper + student_batch
+        gc.collect()
 
-        for student_id in students:
-            if course_blacklist:
-                student_activity = activity.find({
-                    'user_id': student_id,
-                    'course_id': {'$nin': course_blacklist},
-                })
-            else:
-                student_activity = activity.find({
-                    'user_id': student_id,
-                })
-
-            student_course_kqs = {}
-            student_started_courses = []
-            student_unit_kqs = {}
-            student_started_units = []
-
-            for act in student_activity:
-                cid = int(act['course_id'])
-                nid = int(act['kq_id'])
-
-                try:
-                    kqObj = kq_objects.only('id').get(id=nid)
-                    nugget_type = kq_type(kqObj)
-                except ObjectDoesNotExist:
+    store_stats_in_mongo(stats, kq_objects, callback=callback)
+
+
+def merge_stats(stats, partial):
+    """
+    Add the counters of the partial stats dictionary to stats.
+    """
+    for cid, course in partial.items():
+        if not cid in stats:
+            stats[cid] = course
+            continue
+        for field in ('started', 'completed', 'passed'):
+            stats[cid][field] += course[field]
+        for uid, unit in course['u'].items():
+            if not uid in stats[cid]['u']:
+                stats[cid]['u'][uid] = unit
+                continue
+            for field in ('started', 'completed', 'passed'):
+                stats[cid]['u'][uid][field] += unit[field]
+            for nid, nugget in unit['n'].items():
+                if not nid in stats[cid]['u'][uid]['n']:
+                    stats[cid]['u'][uid]['n'][nid] = nugget
                     continue
+                for field, value in nugget.items():
+                    stats[cid]['u'][uid]['n'][nid][field] += value
+    return stats
 
-                try:
-                    # This is here due a bug that populated the activity
-                    # collection with documents with their unit_id set to null
-                    uid = int(act['unit_id'])
-                except TypeError:
-                    uid = int(kqObj.unit.id)
-
-                if not cid in stats:
-                    stats[cid] = {
-                        'u': {},
-                        'total_kqs': kq_objects.filter(unit__course__id=cid).count(),
-                        'threshold': course_objects.get(id=cid).threshold,
-                        'started': 0,
-                        'completed': 0,
-                        'passed': 0
-                    }
-
-                if not uid in stats[cid]['u']:
-                    stats[cid]['u'][uid] = {
-                        'n': {},
-                        'total_kqs': kq_objects.filter(unit__id=uid).count(),
-                        'started': 0,
-                        'completed': 0,
-                        'passed': 0
-                    }
 
-                if not nid in stats[cid]['u'][uid]['n']:
-                    stats[cid]['u'][uid]['n'][nid] = {
-                        'viewed': 0,
-                        'passed': 0
-                    }
-                    if nugget_type == "PeerReviewAssignment":
-                        stats[cid]['u'][uid]['n'][nid]['submitted'] = 0
-                        stats[cid]['u'][uid]['n'][nid]['reviews'] = 0
-                        stats[cid]['u'][uid]['n'][nid]['reviewers'] = 0
-                    elif nugget_type == "Question":
-                        stats[cid]['u'][uid]['n'][nid]['submitted'] = 0
-
-                # Student course stats
-                if not cid in student_started_courses:
-                    stats[cid]['started'] += 1
-                    mark = marks_course.find_one({
-                        'user_id': student_id,
-                        'course_id': cid
-                    })
-                    if mark and has_passed_now(mark['mark'], False, stats[cid]['threshold']):
-                        stats[cid]['passed'] += 1
-                    student_started_courses.append(cid)
-
-                if not cid in student_course_kqs:
-                    student_course_kqs[cid] = 0
-                student_course_kqs[cid] += 1
-                if student_course_kqs[cid] == stats[cid]['total_kqs']:
-                    stats[cid]['completed'] += 1
-
-                # Student unit stats
-                if not uid in student_started_units:
-                    stats[cid]['u'][uid]['started'] += 1
-                    mark = marks_unit.find_one({
-                        'user_id': student_id,
-                        'course_id': cid,
-                        'unit_id': uid
-                    })
-                    if mark and has_passed_now(mark['mark'], False, stats[cid]['threshold']):
-                        stats[cid]['u'][uid]['passed'] += 1
-                    student_started_units.append(uid)
-
-                if not uid in student_unit_kqs:
-                    student_unit_kqs[uid] = 0
-                student_unit_kqs[uid] += 1
-                if student_unit_kqs[uid] == stats[cid]['u'][uid]['total_kqs']:
-                    stats[cid]['u'][uid]['completed'] += 1
-
-                # Student nugget stats
-                threshold = stats[cid]['threshold']
-                stats[cid]['u'][uid]['n'][nid]['viewed'] += 1
-                if nugget_type == 'PeerReviewAssignment':
-                    submitted = submissions.find({
-                        'kq': nid,
-                        'author': student_id
-                    })
-                    if submitted.count() > 0:
-                        stats[cid]['u'][uid]['n'][nid]['submitted'] += 1
-
-                    revs = reviews.find({
-                        'kq': nid,
-                        'reviewer': student_id
-                    })
-                    if revs.count() > 0:
-                        stats[cid]['u'][uid]['n'][nid]['reviewers'] += 1
-                        stats[cid]['u'][uid]['n'][nid]['reviews'] += revs.count()
-                    if threshold is not None:
-                        threshold = decimal.Decimal('5.0')  # P2P is a special case
-
-                elif nugget_type == 'Question':
-                    submitted = answers.find({
-                        'kq_id': nid,
-                        'user_id': student_id
-                    })
-                    if submitted.count() > 0:
-                        stats[cid]['u'][uid]['n'][nid]['submitted'] += 1
-
-                mark = marks_kq.find_one({
-                    'user_id': student_id,
-                    'course_id': cid,
-                    'unit_id': uid,
-                    'kq_id': nid
-                })
-                if mark and has_passed_now(mark['mark'], False, threshold):
-                    stats[cid]['u'][uid]['n'][nid]['passed'] += 1
-
-            counter += 1
-            if callback is not None:
-                callback(step='calculating', counter=counter, total=total)
+# The students are split in shards by id range, [index * shard_size + 1,
+# (index + 1) * shard_size], so the shards of a run don't change when new
+# users register while it is running.
+STATS_CHECKPOINTS_COLLECTION = 'stats_checkpoints'
 
-        store_stats_in_mongo(stats, kq_objects, callback=callback)
-        lower = upper
-        upper = upper + student_batch
-        gc.collect()
+_shard_context = {}
 
 
-def add_field(dictionary, field, value, increment):
-    if increment:
-        if not '$inc' in dictionary:
-            dictionary['$inc'] = {}
-        dictionary['$inc'][field] = value
-    else:
-        dictionary[field] = value
+def _init_shard_worker(metadata, course_blacklist):
+    _shard_context['metadata'] = metadata
+    _shard_context['course_blacklist'] = course_blacklist
+    # Don't share the sockets of the parent process
+    get_db(force_connect=True)
 
 
-def store_stats_in_mongo(stats, kq_objects, callback=None):
+def _calculate_shard(shard):
+    index, lower_id, upper_id = shard
+    students = list(User.objects.filter(id__gte=lower_id, id__lte=upper_id).order_by('id').values_list('id', flat=True))
+    stats = calculate_students_stats(students, _shard_context['metadata'],
+                                     _shard_context['course_blacklist'])
+    return index, len(students), stats
+
+
+def calculate_all_stats_in_shards(processes=1, shard_size=5000,
+                                  course_blacklist=None, callback=None,
+                                  resume=False):
+    """
+    Calculate the statistics like calculate_all_stats, splitting the students
+    in shards that are calculated by a pool of processes. The stats of every
+    finished shard are saved in the stats_checkpoints collection, and they are
+    merged and stored once all the shards are finished, so an interrupted run
+    can be resumed at the shards that weren't saved without counting any
+    student twice.
+
+    A resumed run must use the same course blacklist and shard size. A run
+    interrupted while storing the merged stats can't be resumed.
+    """
     db = get_db()
-    stats_course = db.get_collection('stats_course')
-    stats_unit = db.get_collection('stats_unit')
-    stats_kq = db.get_collection('stats_kq')
-
-    # TODO move indexes creation to the end if recreating an index is not dangerous
-    if stats_course.count() == 0:
-        stats_course.create_index([('course_id', 1)])
-    if stats_unit.count() == 0:
-        stats_unit.create_index([('unit_id', 1)])
-    if stats_kq.count() == 0:
-        stats_kq.create_index([('kq_id', 1)])
+    checkpoints = db.get_collection(STATS_CHECKPOINTS_COLLECTION)
+    run = {
+        '_id': 'run',
+        'course_blacklist': sorted(course_blacklist or []),
+        'shard_size': shard_size,
+    }
+    if resume:
+        previous_run = checkpoints.find_one({'_id': 'run'})
+        if previous_run is None:
+            raise ValueError('There is no statistics run to resume')
+        if (previous_run['course_blacklist'] != run['course_blacklist'] or
+                previous_run['shard_size'] != run['shard_size']):
+            raise ValueError('The courses or the shard size are not the same '
+                             'of the run to resume')
+        if previous_run.get('stored', False):
+            return
+        if previous_run.get('storing', False):
+            raise ValueError('The run to resume was interrupted while storing '
+                             'the statistics, run it again without resume')
+        finished = set([c['shard'] for c in checkpoints.find({'shard': {'$exists': True}},
+                                                            fields=['shard'])])
+    else:
+        checkpoints.remove({}, safe=True)
+        checkpoints.insert(run, safe=True)
+        finished = set()
 
-    counter = 0
-    total = kq_objects.all().count()  # TODO not a valid metric
-    for cid in stats.keys():
-        for uid in stats[cid]['u'].keys():
-            for nid in stats[cid]['u'][uid]['n'].keys():
-                increment = stats_kq.find_one({'kq_id': nid}) is not None
-
-                if increment:
-                    nugget = {}
-                else:
-                    nugget = {
-                        'course_id': cid,
-                        'unit_id': uid,
-                        'kq_id': nid,
-                    }
-
-                add_field(nugget, 'viewed', stats[cid]['u'][uid]['n'][nid]['viewed'], increment)
-                add_field(nugget, 'passed', stats[cid]['u'][uid]['n'][nid]['passed'], increment)
-                if 'reviews' in stats[cid]['u'][uid]['n'][nid]:
-                    add_field(nugget, 'submitted', stats[cid]['u'][uid]['n'][nid]['submitted'], increment)
-                    add_field(nugget, 'reviews', stats[cid]['u'][uid]['n'][nid]['reviews'], increment)
-                    add_field(nugget, 'reviewers', stats[cid]['u'][uid]['n'][nid]['reviewers'], increment)
-                elif 'submitted' in stats[cid]['u'][uid]['n'][nid]:
-                    add_field(nugget, 'submitted', stats[cid]['u'][uid]['n'][nid]['submitted'], increment)
-
-                stats_kq.update(
-                    spec={'kq_id': nid},
-                    document=nugget,
-                    upsert=True,
-                    safe=True
-                )
-
-                counter += 1
-                if callback is not None:
-                    callback(step='storing', counter=counter, total=total)
-
-            increment = stats_unit.find_one({'unit_id': uid}) is not None
-
-            if increment:
-                unit = {}
-            else:
-                unit = {
-                    'course_id': cid,
-                    'unit_id': uid,
-                }
+    max_id = User.objects.aggregate(Max('id'))['id__max'] or 0
+    shards = [(index, index * shard_size + 1, (index + 1) * shard_size)
+              for index in range(max_id // shard_size + 1)
+              if index not in finished]
 
-            add_field(unit, 'started', stats[cid]['u'][uid]['started'], increment)
-            add_field(unit, 'completed', stats[cid]['u'][uid]['completed'], increment)
-            add_field(unit, 'passed', stats[cid]['u'][uid]['passed'], increment)
+    metadata = load_stats_metadata()
+    check_source_indexes(db)
 
-            stats_unit.update(
-                spec={'unit_id': uid},
-                document=unit,
-                upsert=True,
+    counter = 0
+    total = User.objects.count()
+
+    if processes > 1:
+        # The children must open their own database connections
+        connection.close()
+        pool = Pool(processes, initializer=_init_shard_worker,
+                    initargs=(metadata, course_blacklist))
+        results = pool.imap_unordered(_calculate_shard, shards)
+    else:
+        pool = None
+        _init_shard_worker(metadata, course_blacklist)
+        results = (_calculate_shard(shard) for shard in shards)
+
+    try:
+        for index, students_count, partial in results:
+            # The _id makes a shard saved twice fail instead of being counted
+            # twice
+            checkpoints.insert({
+                '_id': 'shard_%d' % index,
+                'shard': index,
+                'stats': Binary(cPickle.dumps(partial, cPickle.HIGHEST_PROTOCOL)),
+            }, safe=True)
+            counter += students_count
+            if callback is not None:
+                callback(step='calculating', counter=counter, total=total)
+            gc.collect()
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+    checkpoints.update({'_id': 'run'}, {'$set': {'storing': True}}, safe=True)
+    stats = {}
+    for checkpoint in checkpoints.find({'shard': {'$exists': True}}):
+        merge_stats(stats, cPickle.loads(str(checkpoint['stats'])))
+    store_stats_in_mongo(stats, KnowledgeQuantum.objects, callback=callback)
+    checkpoints.update({'_id': 'run'}, {'$set': {'stored': True}}, safe=True)
+
+
+def bulk_inc(collection, key_field, docs):
+    """
+    Increment the counters of many documents, creating the ones that don't
+    exist yet. docs is a list of (key value, fields to set only when the
+    document is created, counters to increment) tuples.
+    """
+    if not docs:
+        return
+
+    if hasattr(collection, 'initialize_unordered_bulk_op'):
+        # pymongo >= 2.7
+        bulk = collection.initialize_unordered_bulk_op()
+        for key_value, on_insert, increments in docs:
+            update = {'$inc': increments}
+            # MongoDB >= 2.6 rejects an empty $setOnInsert
+            if on_insert:
+                update['$setOnInsert'] = on_insert
+            bulk.find({key_field: key_value}).upsert().update_one(update)
+        bulk.execute()
+        return
+
+    # One update per existing document, older pymongo versions have no bulk
+    # operations
+    existing = collection.find({key_field: {'$in': [doc[0] for doc in docs]}},
+                               fields=[key_field])
+    existing = set([doc[key_field] for doc in existing])
+    new_docs = []
+    for key_value, on_insert, increments in docs:
+        if key_value in existing:
+            collection.update(
+                {key_field: key_value},
+                {'$inc': increments},
                 safe=True
             )
+        else:
+            new_doc = {key_field: key_value}
+            new_doc.update(on_insert)
+            new_doc.update(increments)
+            new_docs.append(new_doc)
+    if new_docs:
+        collection.insert(new_docs, safe=True)
+
+
+def store_stats_in_mongo(stats, kq_objects=None, callback=None,
+                         chunk_size=None):
+    """
+    Add the stats dictionary to the stats_kq, stats_unit and stats_course
+    collections. The documents are built in memory and written in chunks of
+    chunk_size (STATS_STORE_CHUNK_SIZE setting by default) documents.
+
+    kq_objects is not used anymore, it is kept for the south migrations.
+    """
+    if chunk_size is None:
+        chunk_size = getattr(settings, 'STATS_STORE_CHUNK_SIZE', 1000)
+
+    nuggets = []
+    units = []
+    courses = []
+    for cid, course in stats.items():
+        for uid, unit in course['u'].items():
+            for nid, nugget in unit['n'].items():
+                nuggets.append((nid, {'course_id': cid, 'unit_id': uid},
+                                dict(nugget)))
+            units.append((uid, {'course_id': cid},
+                          dict([(field, unit[field])
+                                for field in ('started', 'completed', 'passed')])))
+        courses.append((cid, {},
+                        dict([(field, course[field])
+                              for field in ('started', 'completed', 'passed')])))
 
-        increment = stats_course.find_one({'course_id': cid}) is not None
+    db = get_db()
+    counter = 0
+    total = len(nuggets) + len(units) + len(courses)
+    for collection_name, key_field, docs in (('stats_kq', 'kq_id', nuggets),
+                                             ('stats_unit', 'unit_id', units),
+                                             ('stats_course', 'course_id', courses)):
+        collection = db.get_collection(collection_name)
+        for lower in range(0, len(docs), chunk_size):
+            chunk = docs[lower:lower + chunk_size]
+            bulk_inc(collection, key_field, chunk)
+
+            counter += len(chunk)
+            if callback is not None:
+                callback(step='storing', counter=counter, total=total)
 
-        if increment:
-            course = {}
-        else:
-            course = {
-                'course_id': cid,
-            }
-
-        add_field(course, 'started', stats[cid]['started'], increment)
-        add_field(course, 'completed', stats[cid]['completed'], increment)
-        add_field(course, 'passed', stats[cid]['passed'], increment)
-
-        stats_course.update(
-            spec={'course_id': cid},
-            document=course,
-            upsert=True,
-            safe=True
-        )
+    ensure_indexes(db, STATS_COLLECTIONS)
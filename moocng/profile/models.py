@@ -19,6 +19,7 @@ from django.db.models import signals
 from django.dispatch import receiver
 from django.utils.translation import ugettext_lazy as _
 
+from moocng.courses.cache import invalidate_announcements_dont_viewed
 from moocng.courses.models import Announcement
 
 
@@ -46,3 +47,9 @@ def create_user_profile(sender, instance, created, **kwargs):
         profile = None
     if not profile and UserProfile._meta.db_table in tables:
         UserProfile.objects.create(user=instance)
+
+
+@receiver(signals.post_save, sender=UserProfile,
+          dispatch_uid="userprofile_invalidate_cache")
+def userprofile_invalidate_cache(sender, instance, **kwargs):
+    invalidate_announcements_dont_viewed(instance.user_id)
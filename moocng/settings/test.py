@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+
+# Settings to run the tests, the ones of the site with a real cache so the
+# versioned cache keys and their invalidations are tested too:
+#
+#   python manage.py test --settings=moocng.settings.test
+#
+# manage.py uses them by default for the test command.
+
+from moocng.settings import *
+
+CACHES = {
+    'default': {
+        'BACKEND': 'moocng.cachebackends.TieredCache',
+        'OPTIONS': {
+            'LOCAL': 'local',
+            'SHARED': 'shared',
+            'LOCAL_TIMEOUT': 5,
+        },
+    },
+    'local': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'moocng-test-local',
+    },
+    # The tests run in a single process, a second local memory cache plays
+    # the memcached shared by the processes
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'moocng-test-shared',
+    },
+}
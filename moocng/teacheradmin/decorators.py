@@ -16,7 +16,7 @@
 from django.shortcuts import get_object_or_404
 
 from moocng.courses.models import Course
-from moocng.courses.utils import is_teacher
+from moocng.courses.security import get_course_access
 from moocng.decorators import user_passes_test
 
 
@@ -35,7 +35,7 @@ def is_teacher_or_staff(original_function=None):
         course = get_object_or_404(Course, slug=course_slug)
 
         def teacherness_test(user):
-            return is_teacher(user, course) or user.is_staff
+            return get_course_access(course, user).is_teacher or user.is_staff
 
         decorator = user_passes_test(teacherness_test)
 
@@ -29,10 +29,11 @@ from django.utils.translation import ugettext as _
 
 from moocng.courses.models import (Course, CourseTeacher, KnowledgeQuantum,
                                    Option, Announcement, Unit, Attachment)
+from moocng.courses.security import get_course_access
 from moocng.courses.utils import UNIT_BADGE_CLASSES
 from moocng.categories.models import Category
 from moocng.media_contents import get_media_content_types_choices
-from moocng.mongodb import get_db
+from moocng.mongodb import get_reporting_db
 from moocng.portal.templatetags.gravatar import gravatar_img_for_email
 from moocng.teacheradmin.decorators import is_teacher_or_staff
 from moocng.teacheradmin.forms import (CourseForm, AnnouncementForm,
@@ -52,9 +53,9 @@ from moocng.externalapps.models import externalapps
 @is_teacher_or_staff
 def teacheradmin_stats(request, course_slug):
     course = get_object_or_404(Course, slug=course_slug)
-    is_enrolled = course.students.filter(id=request.user.id).exists()
+    is_enrolled = get_course_access(course, request.user).is_enrolled
 
-    stats_course = get_db().get_collection('stats_course')
+    stats_course = get_reporting_db().get_collection('stats_course')
     stats = stats_course.find_one({'course_id': course.id})
 
     if stats is not None:
@@ -83,7 +84,7 @@ def teacheradmin_stats(request, course_slug):
 @is_teacher_or_staff
 def teacheradmin_stats_units(request, course_slug):
     course = get_object_or_404(Course, slug=course_slug)
-    stats_unit = get_db().get_collection('stats_unit')
+    stats_unit = get_reporting_db().get_collection('stats_unit')
     data = []
 
     for unit in course.unit_set.only('id', 'title').all():
@@ -115,7 +116,7 @@ def teacheradmin_stats_kqs(request, course_slug):
     unit = get_object_or_404(Unit, id=request.GET['unit'])
     if not unit in course.unit_set.all():
         return HttpResponse(status=400)
-    stats_kq = get_db().get_collection('stats_kq')
+    stats_kq = get_reporting_db().get_collection('stats_kq')
     data = []
 
     for kq in unit.knowledgequantum_set.only('id', 'title').all():
@@ -149,7 +150,7 @@ def teacheradmin_stats_kqs(request, course_slug):
 @is_teacher_or_staff
 def teacheradmin_units(request, course_slug):
     course = get_object_or_404(Course, slug=course_slug)
-    is_enrolled = course.students.filter(id=request.user.id).exists()
+    is_enrolled = get_course_access(course, request.user).is_enrolled
 
     return render_to_response('teacheradmin/units.html', {
         'course': course,
@@ -205,7 +206,7 @@ def teacheradmin_units_attachment(request, course_slug):
 def teacheradmin_units_question(request, course_slug, kq_id):
     kq = get_object_or_404(KnowledgeQuantum, id=kq_id)
     course = get_object_or_404(Course, slug=course_slug)
-    is_enrolled = course.students.filter(id=request.user.id).exists()
+    is_enrolled = get_course_access(course, request.user).is_enrolled
     question_list = kq.question_set.all()
     if len(question_list) > 0:
         obj = question_list[0]
@@ -282,7 +283,7 @@ def teacheradmin_units_option(request, course_slug, kq_id, option_id):
 @is_teacher_or_staff
 def teacheradmin_teachers(request, course_slug):
     course = get_object_or_404(Course, slug=course_slug)
-    is_enrolled = course.students.filter(id=request.user.id).exists()
+    is_enrolled = get_course_access(course, request.user).is_enrolled
 
     return render_to_response('teacheradmin/teachers.html', {
         'course': course,
@@ -431,7 +432,7 @@ def teacheradmin_teachers_reorder(request, course_slug):
 @is_teacher_or_staff
 def teacheradmin_info(request, course_slug):
     course = get_object_or_404(Course, slug=course_slug)
-    is_enrolled = course.students.filter(id=request.user.id).exists()
+    is_enrolled = get_course_access(course, request.user).is_enrolled
     external_apps = externalapps.all()
 
     if request.method == 'POST':
@@ -466,7 +467,7 @@ def teacheradmin_info(request, course_slug):
 @is_teacher_or_staff
 def teacheradmin_categories(request, course_slug):
     course = get_object_or_404(Course, slug=course_slug)
-    is_enrolled = course.students.filter(id=request.user.id).exists()
+    is_enrolled = get_course_access(course, request.user).is_enrolled
 
     if request.method == 'POST':
         category_list = []
@@ -515,7 +516,7 @@ def teacheradmin_categories(request, course_slug):
 @is_teacher_or_staff
 def teacheradmin_assets(request, course_slug):
     course = get_object_or_404(Course, slug=course_slug)
-    is_enrolled = course.students.filter(id=request.user.id).exists()
+    is_enrolled = get_course_access(course, request.user).is_enrolled
     assets = course_get_assets(course).order_by('id').distinct()
 
     return render_to_response('teacheradmin/assets.html', {
@@ -530,7 +531,7 @@ def teacheradmin_assets_edit(request, course_slug, asset_id):
 
     asset = get_object_or_404(Asset, id=asset_id)
     course = get_object_or_404(Course, slug=course_slug)
-    is_enrolled = course.students.filter(id=request.user.id).exists()
+    is_enrolled = get_course_access(course, request.user).is_enrolled
 
     if request.method == 'POST':
         form = AssetTeacherForm(request.POST, instance=asset)
@@ -566,7 +567,7 @@ def teacheradmin_assets_edit(request, course_slug, asset_id):
 @is_teacher_or_staff
 def teacheradmin_announcements(request, course_slug):
     course = get_object_or_404(Course, slug=course_slug)
-    is_enrolled = course.students.filter(id=request.user.id).exists()
+    is_enrolled = get_course_access(course, request.user).is_enrolled
     announcements = course.announcement_set.all()
 
     return render_to_response('teacheradmin/announcements.html', {
@@ -580,7 +581,7 @@ def teacheradmin_announcements(request, course_slug):
 def teacheradmin_announcements_view(request, course_slug, announ_id, announ_slug):
     announcement = get_object_or_404(Announcement, id=announ_id)
     course = announcement.course
-    is_enrolled = course.students.filter(id=request.user.id).exists()
+    is_enrolled = get_course_access(course, request.user).is_enrolled
     return render_to_response('teacheradmin/announcement_view.html', {
         'course': course,
         'is_enrolled': is_enrolled,
@@ -598,7 +599,7 @@ def teacheradmin_announcements_add_or_edit(request, course_slug, announ_id=None,
         announcement = get_object_or_404(Announcement, id=announ_id)
         course = announcement.course
 
-    is_enrolled = course.students.filter(id=request.user.id).exists()
+    is_enrolled = get_course_access(course, request.user).is_enrolled
     students = course.students.count()
     data = None
     if request.method == 'POST':
@@ -642,7 +643,7 @@ def teacheradmin_announcements_delete(request, course_slug, announ_id, announ_sl
 @is_teacher_or_staff
 def teacheradmin_emails(request, course_slug):
     course = get_object_or_404(Course, slug=course_slug)
-    is_enrolled = course.students.filter(id=request.user.id).exists()
+    is_enrolled = get_course_access(course, request.user).is_enrolled
     students = course.students.count()
     data = None
     if request.method == 'POST':